@@ -0,0 +1 @@
+"""HKXShift - Skyrim animation speed adjuster"""
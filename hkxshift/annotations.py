@@ -0,0 +1,185 @@
+"""Rescaling annotation dumps and the searchable annotation index"""
+import threading
+import time
+import json
+import sqlite3
+
+from .common import is_float
+
+def rescale_annotations(lines, scale, match_line):
+    """Rescale the annotation times in hkanno dump lines.
+    
+    Returns (new lines, {rule name: preserved lines}, dropped lines, changed).
+    changed is False when the result means the same as the input (no
+    timestamped lines, only preserved lines, only times at 0), in which case
+    merging it back would leave the HKX as it was.
+    """
+    modified_lines = []
+    preserved_lines = {}
+    skipped_lines = 0
+    changed = False
+    for line in lines:
+        # One search checks the line against every annotation rule (SCAR_ActionData...)
+        rule = match_line(line)
+        if rule:
+            if rule['action'] == 'preserve':
+                # Preserve patch annotation without modification
+                modified_lines.append(line)
+                preserved_lines[rule['name']] = preserved_lines.get(rule['name'], 0) + 1
+            else:
+                skipped_lines += 1
+                changed = True
+            continue
+        
+        parts = line.strip().split(" ", 1)
+        if len(parts) < 2 or not is_float(parts[0]):
+            modified_lines.append(line)
+            continue
+        try:
+            new_time = f"{float(parts[0]) * scale:.6f}"
+            modified_lines.append(f"{new_time} {parts[1]}\n")
+            changed = changed or float(new_time) != float(parts[0])
+        except:
+            modified_lines.append(line)
+    return modified_lines, preserved_lines, skipped_lines, changed
+
+def parse_annotation_dump(content):
+    """(track, time, text) for every annotation in an hkanno dump.
+
+    Each annotation track starts with a "# numAnnotations: N" comment line.
+    """
+    annotations = []
+    track = 0
+    tracks_seen = 0
+    for line in content.splitlines():
+        line = line.strip()
+        if line.startswith("#"):
+            if line.startswith("# numAnnotations:"):
+                track = tracks_seen
+                tracks_seen += 1
+            continue
+        parts = line.split(" ", 1)
+        if len(parts) == 2 and is_float(parts[0]):
+            annotations.append((track, float(parts[0]), parts[1]))
+    return annotations
+
+class AnnotationIndex:
+    """SQLite index of every dumped annotation (file, track, time, text, content hash).
+
+    Annotation text gets a full-text index when SQLite has FTS5, otherwise text
+    queries fall back to substring matching. A file's rows are replaced whenever
+    it is dumped again, and its signature (size and mtime, or zip CRC) tells an
+    index run which files changed since.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, root TEXT, signature TEXT, "
+                              "content_hash TEXT, indexed REAL)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS files_root ON files (root)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS annotations (id INTEGER PRIMARY KEY, path TEXT, "
+                              "track INTEGER, time REAL, text TEXT)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS annotations_path ON annotations (path)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS annotations_time ON annotations (time)")
+            try:
+                self.conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS annotations_fts USING fts5("
+                                  "text, content='annotations', content_rowid='id')")
+                self.conn.execute("CREATE TRIGGER IF NOT EXISTS annotations_insert AFTER INSERT ON annotations BEGIN "
+                                  "INSERT INTO annotations_fts (rowid, text) VALUES (new.id, new.text); END")
+                self.conn.execute("CREATE TRIGGER IF NOT EXISTS annotations_delete AFTER DELETE ON annotations BEGIN "
+                                  "INSERT INTO annotations_fts (annotations_fts, rowid, text) "
+                                  "VALUES ('delete', old.id, old.text); END")
+                self.fts = True
+            except sqlite3.OperationalError:
+                self.fts = False
+
+    @staticmethod
+    def signature(source_tree, rel):
+        return json.dumps(list(source_tree.identity(rel)))
+
+    def signatures(self, root):
+        """{file key: signature} of every indexed file under a source root"""
+        with self.lock:
+            return dict(self.conn.execute("SELECT path, signature FROM files WHERE root = ?", (root,)).fetchall())
+
+    def update(self, path, root, signature, content_hash, annotations):
+        """Replace a file's (track, time, text) annotations"""
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM annotations WHERE path = ?", (path,))
+            self.conn.executemany("INSERT INTO annotations (path, track, time, text) VALUES (?, ?, ?, ?)",
+                                  [(path,) + annotation for annotation in annotations])
+            self.conn.execute("INSERT OR REPLACE INTO files (path, root, signature, content_hash, indexed) "
+                              "VALUES (?, ?, ?, ?, ?)", (path, root, signature, content_hash, time.time()))
+
+    def prune(self, root, present):
+        """Forget files under root that are no longer in the source; returns how many"""
+        with self.lock, self.conn:
+            gone = [(path,) for (path,) in self.conn.execute("SELECT path FROM files WHERE root = ?", (root,)).fetchall()
+                    if path not in present]
+            self.conn.executemany("DELETE FROM annotations WHERE path = ?", gone)
+            self.conn.executemany("DELETE FROM files WHERE path = ?", gone)
+        return len(gone)
+
+    def lines(self, paths):
+        """{file key: (signature, ["time text" lines])} for the indexed files among paths"""
+        found = {}
+        with self.lock:
+            for start in range(0, len(paths), 500):
+                chunk = paths[start:start + 500]
+                rows = self.conn.execute(
+                    f"SELECT f.path, f.signature, a.time, a.text FROM files f LEFT JOIN annotations a ON a.path = f.path "
+                    f"WHERE f.path IN ({', '.join('?' * len(chunk))}) ORDER BY a.id", chunk).fetchall()
+                for path, signature, at, text in rows:
+                    lines = found.setdefault(path, (signature, []))[1]
+                    if text is not None:
+                        lines.append(f"{at:.6f} {text}")
+        return found
+
+    def query(self, text="", min_time=None, max_time=None, path="", limit=1000, files=False):
+        """Annotations matching every given filter, as (file key, track, time, text, content hash) rows.
+        
+        text is an FTS5 query (SCAR_ActionData, "HitFrame OR PowerAttack", Sound*);
+        text that is not valid query syntax is searched as a phrase. path is a
+        glob over the file key. With files=True there is one row per file, with
+        the number of matching annotations in place of the text.
+        """
+        conditions = []
+        params = []
+        if text and self.fts:
+            conditions.append("a.id IN (SELECT rowid FROM annotations_fts WHERE annotations_fts MATCH ?)")
+            params.append(text)
+        elif text:
+            conditions.append("a.text LIKE ?")
+            params.append(f"%{text}%")
+        if min_time is not None:
+            conditions.append("a.time >= ?")
+            params.append(min_time)
+        if max_time is not None:
+            conditions.append("a.time <= ?")
+            params.append(max_time)
+        if path:
+            conditions.append("a.path GLOB ?")
+            params.append(path)
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        if files:
+            sql = (f"SELECT a.path, MIN(a.track), MIN(a.time), COUNT(*), f.content_hash FROM annotations a "
+                   f"JOIN files f ON f.path = a.path{where} GROUP BY a.path ORDER BY a.path LIMIT ?")
+        else:
+            sql = (f"SELECT a.path, a.track, a.time, a.text, f.content_hash FROM annotations a "
+                   f"JOIN files f ON f.path = a.path{where} ORDER BY a.path, a.track, a.time LIMIT ?")
+        with self.lock:
+            try:
+                return self.conn.execute(sql, params + [limit]).fetchall()
+            except sqlite3.OperationalError:
+                if not (text and self.fts):
+                    raise
+                params[0] = '"' + text.replace('"', '""') + '"'
+                return self.conn.execute(sql, params + [limit]).fetchall()
+
+    def counts(self):
+        """(indexed files, indexed annotations)"""
+        with self.lock:
+            return (self.conn.execute("SELECT COUNT(*) FROM files").fetchone()[0],
+                    self.conn.execute("SELECT COUNT(*) FROM annotations").fetchone()[0])
@@ -0,0 +1,172 @@
+"""Annotation backends (hkanno, the packfile parser, a stub) and their calibration"""
+import os
+import shutil
+import subprocess
+import time
+import shlex
+import mmap
+import struct
+import tempfile
+
+from .common import NO_WINDOW_FLAGS
+from .packfile import HkxPatchError, parse_packfile_animations, read_packfile_annotations
+from .annotations import parse_annotation_dump
+
+class AnnotationBackend:
+    """Reads and writes the annotations of HKX files in hkanno's text dump format.
+    
+    dump() writes the annotations of an HKX file to a text file, update()
+    writes an edited dump back into the HKX. Both raise on failure.
+    """
+    name = "backend"
+    # Whether dumps and results may go into the caches and the annotation index
+    cacheable = True
+    
+    def unavailable(self):
+        """Why this backend cannot run here, or None"""
+        return None
+    
+    def dump(self, hkx, out_path):
+        raise NotImplementedError
+    
+    def update(self, hkx, anno_path):
+        raise NotImplementedError
+
+class HkannoBackend(AnnotationBackend):
+    """The external hkanno64.exe, optionally started through a compatibility layer (e.g. "wine")"""
+    name = "hkanno"
+    
+    def __init__(self, path="hkanno64.exe", wrapper=""):
+        self.path = path
+        self.wrapper = shlex.split(wrapper)
+    
+    def unavailable(self):
+        if not os.path.isfile(self.path):
+            return f"{self.path} not found"
+        if self.wrapper and not shutil.which(self.wrapper[0]):
+            return f"{self.wrapper[0]} not found"
+        return None
+    
+    def command(self, cmd_type, args):
+        return self.wrapper + [self.path] + list(cmd_type) + list(args)
+    
+    def run(self, cmd_type, args, creationflags=NO_WINDOW_FLAGS):
+        """Run an hkanno command; returns (return code, output lines without DLL noise)"""
+        result = subprocess.run(
+            self.command(cmd_type, args),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            creationflags=creationflags
+        )
+        filtered = [line for line in (result.stdout + result.stderr).splitlines() if "hctFilterTexture.dll" not in line]
+        return result.returncode, filtered
+    
+    def dump(self, hkx, out_path):
+        self.run(["dump", "-o", out_path], [hkx])
+        if not os.path.isfile(out_path):
+            raise OSError("hkanno wrote no dump")
+    
+    def update(self, hkx, anno_path):
+        self.run(["update", "-i", anno_path], [hkx])
+
+class PackfileBackend(AnnotationBackend):
+    """In-process dump/update of binary packfiles (Skyrim LE/SE), without starting hkanno.
+    
+    update() only rewrites annotation times; files it cannot handle (tagfiles,
+    annotations added, removed or renamed) raise HkxPatchError.
+    """
+    name = "packfile"
+    
+    def dump(self, hkx, out_path):
+        """Write the dump hkanno would write: the animation header, then every track, empty ones included"""
+        with open(hkx, "rb") as f:
+            _, annotations, animations = parse_packfile_animations(f.read())
+        if len(animations) != 1:
+            raise HkxPatchError("more than one animation in the file")
+        class_name, duration, track_count, frames = animations[0]
+        if frames is None:
+            raise HkxPatchError(f"frame count of {class_name} unknown")
+        tracks = [[] for _ in range(track_count)]
+        for _, time_value, text, track in annotations:
+            tracks[track].append(f"{time_value:.6f} {text}\n")
+        with open(out_path, "w", encoding="utf-8") as f:
+            f.write(f"# numOriginalFrames: {frames}\n")
+            f.write(f"# duration: {duration:.6f}\n")
+            f.write(f"# numAnnotationTracks: {track_count}\n")
+            for lines in tracks:
+                f.write(f"# numAnnotations: {len(lines)}\n")
+                f.writelines(lines)
+    
+    def update(self, hkx, anno_path):
+        with open(anno_path, "r", encoding="utf-8") as f:
+            wanted = [(time_value, text) for _, time_value, text in parse_annotation_dump(f.read())]
+        with open(hkx, "r+b") as f, mmap.mmap(f.fileno(), 0) as data:
+            _, annotations = read_packfile_annotations(data)
+            if [text for _, _, text, _ in annotations] != [text for _, text in wanted]:
+                raise HkxPatchError("annotations were added, removed or renamed")
+            for (offset, _, _, _), (time_value, _) in zip(annotations, wanted):
+                struct.pack_into("<f", data, offset, time_value)
+            data.flush()
+
+class StubBackend(AnnotationBackend):
+    """Stand-in for testing the pipeline without hkanno: dumps are empty and updates change nothing"""
+    name = "stub"
+    cacheable = False
+    
+    def dump(self, hkx, out_path):
+        os.stat(hkx)
+        with open(out_path, "w", encoding="utf-8") as f:
+            f.write("# numAnnotations: 0\n")
+    
+    def update(self, hkx, anno_path):
+        os.stat(hkx)
+
+# auto: calibrate the available backends on sample files and use the fastest one that works
+CALIBRATION_SAMPLES = 3
+# Smallest files tried when looking for samples that have annotations
+CALIBRATION_CANDIDATES = 20
+ANNOTATION_BACKENDS = ('auto', 'hkanno', 'packfile', 'stub')
+
+def calibrate_backends(backends, sample, repeat=2):
+    """Time a dump and an update of a copy of sample with each backend.
+    
+    The first backend's dump is the reference the others have to match line
+    for line, headers included, since the dump text is what later goes back
+    into hkanno. Returns ([(seconds, backend)] fastest first, {name: why it failed},
+    whether the reference dump holds any annotation).
+    """
+    timings = []
+    failures = {}
+    reference = None
+    annotated = False
+    work_dir = tempfile.mkdtemp(prefix="hkxshift-calibrate-")
+    try:
+        for backend in backends:
+            hkx = os.path.join(work_dir, f"{backend.name}.hkx")
+            anno = os.path.join(work_dir, f"{backend.name}.txt")
+            try:
+                best = None
+                for _ in range(repeat):
+                    shutil.copyfile(sample, hkx)
+                    started = time.perf_counter()
+                    backend.dump(hkx, anno)
+                    backend.update(hkx, anno)
+                    elapsed = time.perf_counter() - started
+                    best = elapsed if best is None else min(best, elapsed)
+                with open(anno, "r", encoding="utf-8") as f:
+                    dump = [line.rstrip() for line in f.read().splitlines() if line.strip()]
+            except Exception as e:
+                failures[backend.name] = str(e) or type(e).__name__
+                continue
+            if reference is None:
+                reference = dump
+                annotated = bool(parse_annotation_dump("\n".join(dump)))
+            elif dump != reference:
+                failures[backend.name] = "dump differs from the reference backend"
+                continue
+            timings.append((best, backend))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    timings.sort(key=lambda timing: timing[0])
+    return timings, failures, annotated
@@ -0,0 +1,319 @@
+"""Source backups and the manifests that restore and verify them"""
+import os
+import shutil
+import threading
+import time
+import zipfile
+import json
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from .common import ShiftError, TOOL_VERSION, is_hkx_file
+from .sources import ZipSource, file_sha256
+from .fileops import copy_and_hash, copy_hashing, lower_io_priority
+
+# Written into every <base>-backup folder: {"source", "kind", "files": {relative path: {size, mtime_ns, sha256}}}
+BACKUP_MANIFEST = "hkxshift_manifest.json"
+
+# copy: reflink or full copy, link: hardlinks shared with the backup, move: renames that use the backup up
+RESTORE_MODES = ('copy', 'link', 'move')
+
+# folder: a plain copy of the source, zip: deflated zip parts written in parallel
+BACKUP_FORMATS = ('folder', 'zip')
+BACKUP_PART = "backup-{:02d}.zip"
+
+def write_backup_manifest(backup_dir, source, kind, files, complete=True, backup_format='folder'):
+    """Write the manifest of a backup; files maps relative paths to describe_file() entries.
+
+    Entries of zip backups also name the part holding the file.
+    """
+    manifest = {
+        'tool_version': TOOL_VERSION,
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'source': os.path.abspath(source),
+        'kind': kind,
+        'format': backup_format,
+        'complete': complete,
+        'files': files,
+    }
+    path = os.path.join(backup_dir, BACKUP_MANIFEST)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(path + ".tmp", path)
+
+def split_by_size(files, parts):
+    """Deal (src, rel, size) files into at most `parts` lists of about equal total size, largest first"""
+    bins = [[0, []] for _ in range(max(1, min(parts, len(files))))]
+    for src, rel, size in sorted(files, key=lambda f: f[2], reverse=True):
+        smallest = min(bins, key=lambda b: b[0])
+        smallest[0] += size
+        smallest[1].append((src, rel, size))
+    return [files for _, files in bins]
+
+def output_manifest_path(path):
+    """Output manifest of a run, given the manifest itself or the run's -merged folder or archive"""
+    if path.lower().endswith(".json"):
+        return path
+    path = os.path.normpath(path)
+    name = os.path.basename(path)
+    for suffix in ("-merged.zip", "-merged"):
+        if name.endswith(suffix):
+            return os.path.join(os.path.dirname(path), f"{name[:-len(suffix)]}_manifest.json")
+    raise ShiftError(f"Not an output manifest or -merged folder: {path}")
+
+class OutputManifest:
+    """Hashes of the files written to a -merged folder, computed on their own threads as the files arrive"""
+    def __init__(self, root, threads=2):
+        self.root = root
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="hkxshift-hash")
+        self.futures = {}
+        self.lock = threading.Lock()
+
+    def add(self, path):
+        """Queue a finished output file for hashing"""
+        rel = os.path.relpath(path, self.root).replace("\\", "/")
+        future = self.pool.submit(self._describe, path)
+        with self.lock:
+            self.futures[rel] = future
+
+    @staticmethod
+    def _describe(path):
+        return {'size': os.path.getsize(path), 'sha256': file_sha256(path)}
+
+    def finish(self):
+        """Wait for the hashes; returns ({relative path: {size, sha256}}, [(file, error)])"""
+        with self.lock:
+            futures = dict(self.futures)
+        self.pool.shutdown()
+        entries = {}
+        errors = []
+        for rel, future in sorted(futures.items()):
+            try:
+                entries[rel] = future.result()
+            except Exception as e:
+                errors.append((rel, str(e)))
+        return entries, errors
+
+    def cancel(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+def write_output_manifest(path, source, scale, output, files, archive=False, complete=True):
+    """Write the integrity record of a run's output: path, size and sha256 of every file"""
+    manifest = {
+        'tool_version': TOOL_VERSION,
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'source': os.path.abspath(source),
+        'multiplier': scale,
+        'output': os.path.abspath(output),
+        'archive': archive,
+        'complete': complete,
+        'files': files,
+    }
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(path + ".tmp", path)
+
+class SourceBackup:
+    """Backup of a source folder or archive, copied on its own low I/O priority threads.
+
+    HKXShift never writes to the source, so processing does not have to wait
+    for the backup; the run only waits for it before it finishes. Files are
+    hashed while they are copied, for the restore manifest.
+
+    The zip format deals the files into one deflated part per thread, so the
+    parts compress in parallel. Each part's central directory is the per-file
+    index that lets restore pull out single files.
+
+    The copies go to a staging folder next to backup_dir, which replaces the
+    previous backup only once finish() has every file and the manifest; an
+    incomplete or cancelled backup leaves the previous one as it was.
+    """
+    def __init__(self, source_tree, backup_dir, threads=2, lock=None, backup_format='folder'):
+        self.source_tree = source_tree
+        self.backup_dir = backup_dir
+        self.lock_file = lock
+        self.threads = threads
+        self.format = backup_format
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="hkxshift-backup",
+                                       initializer=lower_io_priority)
+        self.futures = []
+        self.files = []
+        self.entries = {}
+        self.failed = {}
+        self.kind = None
+        self.total_bytes = 0
+        self.copied_bytes = 0
+        self.stored_bytes = 0
+        self.count = 0
+        self.started = None
+        self.finished = None
+        self.cancelled = False
+        self.staging_dir = None
+        self.published = False
+        self.lock = threading.Lock()
+
+    def start(self):
+        """List the source and queue every copy"""
+        self.started = time.time()
+        self.clean_up_previous()
+        parent, name = os.path.split(os.path.abspath(self.backup_dir))
+        self.staging_dir = tempfile.mkdtemp(prefix=f"{name}.", suffix=".new", dir=parent)
+        
+        # Zip archives are already a single self-contained copy, so back up the archive itself
+        if isinstance(self.source_tree, ZipSource):
+            self.kind = 'archive'
+            self.format = 'folder'
+            files = [(self.source_tree.path, os.path.basename(self.source_tree.path))]
+        else:
+            source = self.source_tree.path
+            files = []
+            # Single mode (source directory contains HKX files directly) backs up the top folder only
+            if any(is_hkx_file(f) for f in os.listdir(source)):
+                self.kind = 'single'
+                files = [(os.path.join(source, f), f) for f in os.listdir(source) if os.path.isfile(os.path.join(source, f))]
+            else:
+                self.kind = 'folder'
+                for root, dirs, names in os.walk(source):
+                    rel_path = os.path.relpath(root, source)
+                    if rel_path == '.':
+                        rel_path = ''
+                    if self.format == 'folder':
+                        os.makedirs(os.path.join(self.staging_dir, rel_path), exist_ok=True)
+                    files.extend((os.path.join(root, name), os.path.join(rel_path, name).replace("\\", "/")) for name in names)
+        
+        for src, rel in files:
+            try:
+                size = os.path.getsize(src)
+            except OSError:
+                size = 0
+            self.total_bytes += size
+            self.files.append((src, rel, size))
+        
+        if self.format == 'zip':
+            for number, part in enumerate(split_by_size(self.files, self.threads)):
+                self.futures.append(self.pool.submit(self._compress, BACKUP_PART.format(number), part))
+        else:
+            for src, rel, _ in self.files:
+                self.futures.append(self.pool.submit(self._copy, src, rel))
+
+    def clean_up_previous(self):
+        """Undo what an interrupted run left behind: staging folders, and a previous backup moved aside"""
+        parent, name = os.path.split(os.path.abspath(self.backup_dir))
+        os.makedirs(parent, exist_ok=True)
+        for entry in os.listdir(parent):
+            if entry.startswith(f"{name}.") and entry.endswith(".new"):
+                shutil.rmtree(os.path.join(parent, entry), ignore_errors=True)
+        previous = f"{self.backup_dir}.old"
+        if os.path.isdir(previous):
+            if os.path.isdir(self.backup_dir):
+                shutil.rmtree(previous)
+            else:
+                os.replace(previous, self.backup_dir)
+
+    def swap_in(self):
+        """Replace the previous backup with the staging folder"""
+        previous = f"{self.backup_dir}.old"
+        if os.path.isdir(self.backup_dir):
+            # Directories cannot be renamed over each other; the previous backup is moved aside first
+            os.replace(self.backup_dir, previous)
+        os.replace(self.staging_dir, self.backup_dir)
+        self.published = True
+        shutil.rmtree(previous, ignore_errors=True)
+
+    @property
+    def total(self):
+        return len(self.files)
+
+    def _copy(self, src, rel):
+        try:
+            entry = copy_and_hash(src, os.path.join(self.staging_dir, *rel.split("/")))
+        except OSError as e:
+            with self.lock:
+                self.failed[rel] = str(e)
+            return
+        with self.lock:
+            self.entries[rel] = entry
+            self.copied_bytes += entry['size']
+
+    def _compress(self, part, files):
+        """Stream files into one zip part, hashing them on the way"""
+        path = os.path.join(self.staging_dir, part)
+        try:
+            with zipfile.ZipFile(path + ".tmp", "w", zipfile.ZIP_DEFLATED) as zf:
+                for src, rel, size in files:
+                    if self.cancelled:
+                        break
+                    try:
+                        stat = os.stat(src)
+                        info = zipfile.ZipInfo.from_file(src, rel)
+                        info.compress_type = zipfile.ZIP_DEFLATED
+                        with open(src, "rb") as src_file, zf.open(info, "w", force_zip64=stat.st_size > 2**31) as dest_file:
+                            size, sha256 = copy_hashing(src_file, dest_file)
+                    except OSError as e:
+                        with self.lock:
+                            self.failed[rel] = str(e)
+                        continue
+                    with self.lock:
+                        # Restored files get the source's exact mtime back, which zip entries cannot hold
+                        self.entries[rel] = {'size': size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha256, 'part': part}
+                        self.copied_bytes += size
+            os.replace(path + ".tmp", path)
+            with self.lock:
+                self.stored_bytes += os.path.getsize(path)
+        except OSError as e:
+            with self.lock:
+                for _, rel, _ in files:
+                    self.entries.pop(rel, None)
+                    self.failed.setdefault(rel, str(e))
+
+    def done(self):
+        return all(future.done() for future in self.futures)
+
+    def progress(self):
+        """Percentage of the source's bytes copied so far"""
+        if not self.total_bytes:
+            return 100.0 if self.done() else 0.0
+        return min(100.0, self.copied_bytes / self.total_bytes * 100)
+
+    def finish(self, on_progress=None, interval=0.5):
+        """Wait for the remaining copies, write the manifest and swap the backup in.
+        
+        Returns [(file, error)] for every file that was not backed up; the
+        previous backup is only replaced when there are none.
+        """
+        pending = set(self.futures)
+        while pending:
+            _, pending = wait(pending, timeout=interval)
+            if on_progress:
+                on_progress(self.progress())
+        self.pool.shutdown()
+        self.finished = time.time()
+        
+        errors = [(rel, self.failed.get(rel, "cancelled")) for _, rel, _ in self.files if rel not in self.entries]
+        self.count = len(self.entries)
+        if self.kind == 'archive' and not errors:
+            self.count = len(self.source_tree.members)
+        if self.format == 'folder':
+            self.stored_bytes = self.copied_bytes
+        if not errors:
+            try:
+                write_backup_manifest(self.staging_dir, self.source_tree.path, self.kind, self.entries,
+                                      backup_format=self.format)
+                self.swap_in()
+            except OSError as e:
+                errors.append((BACKUP_MANIFEST, str(e)))
+        if not self.published:
+            shutil.rmtree(self.staging_dir, ignore_errors=True)
+        if self.lock_file:
+            self.lock_file.release()
+        return errors
+
+    def cancel(self):
+        """Stop copying and drop the staging folder; copies already running still finish"""
+        self.cancelled = True
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        if self.staging_dir and not self.published:
+            # Whatever a running copy still writes is removed by the next backup of this source
+            shutil.rmtree(self.staging_dir, ignore_errors=True)
+        if self.lock_file:
+            self.lock_file.release()
@@ -0,0 +1,169 @@
+"""Persistent result cache and in-process inventory/annotation caches"""
+import os
+import threading
+import time
+import sqlite3
+import hashlib
+from collections import OrderedDict
+
+from .common import TOOL_VERSION
+from .sources import FolderSource, ZipSource
+from .fileops import FileLock, link_or_copy
+
+class ResultCache:
+    """Persistent cache of merged HKX files.
+
+    Entries are keyed by source content hash, multiplier, preservation rules,
+    annotation backend, patch mode and tool version, and evicted least
+    recently used first once the cache grows past max_bytes. get() pins the
+    entry for its run until unpin(), so another run trimming the cache cannot
+    delete a file that is found but not copied yet.
+    """
+    # Pins older than this were left by a run that crashed
+    PIN_SECONDS = 24 * 3600
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(path, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(path, "index.sqlite"), timeout=30, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, size INTEGER, last_used REAL)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS pins (key TEXT, owner TEXT, pinned REAL, PRIMARY KEY (key, owner))")
+
+    @staticmethod
+    def make_key(content_hash, scale, rules_id, backend, binary_patch):
+        key = f"{content_hash}|{scale!r}|{rules_id}|{backend}|{int(bool(binary_patch))}|{TOOL_VERSION}"
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.path, key[:2], f"{key}.hkx")
+
+    def get(self, key, owner):
+        """Return the cached file for key, pinned for owner, or None"""
+        path = self.entry_path(key)
+        with self.lock, self.conn:
+            # Write-locked from the lookup on, so an eviction cannot slip in before the pin
+            self.conn.execute("BEGIN IMMEDIATE")
+            row = self.conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if not os.path.isfile(path) or os.path.getsize(path) != row[0]:
+                self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                return None
+            now = time.time()
+            self.conn.execute("UPDATE entries SET last_used = ? WHERE key = ?", (now, key))
+            self.conn.execute("INSERT OR REPLACE INTO pins (key, owner, pinned) VALUES (?, ?, ?)", (key, owner, now))
+        return path
+
+    def unpin(self, owner):
+        """Let eviction remove the entries get() returned to owner again"""
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM pins WHERE owner = ?", (owner,))
+
+    def put(self, key, src):
+        """Store a copy of src under key"""
+        path = self.entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+        # No hardlinks: staging files can be rewritten in place by later runs
+        link_or_copy(src, temp_path, hardlink=False)
+        os.replace(temp_path, path)
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO entries (key, size, last_used) VALUES (?, ?, ?)",
+                              (key, os.path.getsize(path), time.time()))
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes"""
+        removed = 0
+        # Runs sharing the cache take turns trimming it
+        with FileLock(os.path.join(self.path, "evict.lock")), self.lock, self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.execute("DELETE FROM pins WHERE pinned < ?", (time.time() - self.PIN_SECONDS,))
+            total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                return 0
+            for key, size in self.conn.execute("SELECT key, size FROM entries WHERE key NOT IN (SELECT key FROM pins) "
+                                               "ORDER BY last_used").fetchall():
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(self.entry_path(key))
+                except FileNotFoundError:
+                    pass
+                self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                total -= size
+                removed += 1
+        return removed
+
+class InventoryCache:
+    """Source listings remembered between jobs.
+
+    A cached listing is revalidated with one stat per folder (or one stat of the
+    archive), so repeat jobs on an unchanged source skip the directory scans.
+    """
+    def __init__(self):
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def _signature(self, source_tree, folders):
+        if isinstance(source_tree, ZipSource):
+            stat = os.stat(source_tree.path)
+            return (stat.st_size, stat.st_mtime_ns)
+        return tuple(os.stat(source_tree.full_path(folder)).st_mtime_ns for folder in folders)
+
+    def listing(self, source_tree):
+        """Return {folder: [files]} for the source root ("") and its immediate subfolders"""
+        key = os.path.abspath(source_tree.path)
+        with self.lock:
+            cached = self.entries.get(key)
+        if cached:
+            try:
+                if self._signature(source_tree, cached['folders']) == cached['signature']:
+                    with self.lock:
+                        self.hits += 1
+                    return cached['listing']
+            except OSError:
+                pass
+        
+        # Take the signature first so changes made while listing invalidate the entry
+        root_signature = self._signature(source_tree, [''])
+        listing = {'': source_tree.listdir()}
+        for item in listing['']:
+            if source_tree.isdir(item):
+                listing[item] = source_tree.listdir(item)
+        folders = list(listing)
+        signature = root_signature + self._signature(source_tree, folders[1:]) if isinstance(source_tree, FolderSource) else root_signature
+        with self.lock:
+            self.entries[key] = {'listing': listing, 'folders': folders, 'signature': signature}
+            self.misses += 1
+        return listing
+
+class AnnotationCache:
+    """LRU cache of dumped annotation text, so unchanged files skip the hkanno dump"""
+    def __init__(self, max_entries=20000):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            text = self.entries.get(key)
+            if text is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return text
+
+    def put(self, key, text):
+        with self.lock:
+            self.entries[key] = text
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
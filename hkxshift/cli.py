@@ -0,0 +1,423 @@
+"""Command line interface"""
+import os
+import sys
+import threading
+import time
+import json
+import sqlite3
+import argparse
+
+from .common import (DEFAULT_COORDINATOR_PORT, DEFAULT_METRICS_PORT, DEFAULT_OPTIONS, DEFAULT_SERVER_PORT, ShiftError,
+                     job_options)
+from .backup import BACKUP_FORMATS, output_manifest_path
+from .rules import RULES_FILE
+from .backends import ANNOTATION_BACKENDS
+from .profiling import PROFILE_PHASES
+from .annotations import AnnotationIndex
+from .resources import CONCURRENCY_MODES, EngineResources
+from .engine import ShiftEngine
+from .server import JobClient, JobServer
+from .worker import RemoteWorker
+
+class CliReporter:
+    """Prints engine output for command line runs, with a live progress line on terminals"""
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self.live = self.stream.isatty()
+        self.lock = threading.Lock()
+        self.status_line = ""
+
+    def on_log(self, formatted_message, message, debug):
+        with self.lock:
+            self._clear()
+            print(formatted_message, file=self.stream, flush=True)
+            self._draw()
+
+    def on_progress(self, value, message=None):
+        if not self.live:
+            return
+        with self.lock:
+            self._clear()
+            self.status_line = f"[{value:5.1f}%] {message or ''}"[:119]
+            self._draw()
+
+    def _clear(self):
+        if self.live and self.status_line:
+            self.stream.write("\r" + " " * len(self.status_line) + "\r")
+
+    def _draw(self):
+        if self.live and self.status_line:
+            self.stream.write(self.status_line)
+            self.stream.flush()
+
+    def done(self):
+        with self.lock:
+            self._clear()
+            self.status_line = ""
+
+
+def cli_options(args):
+    return {
+        'backup': not args.no_backup,
+        'backup_format': args.backup_format,
+        'delete_temp': not args.keep_temp,
+        'archive_output': args.archive,
+        'deduplicate': args.dedup,
+        'result_cache': args.cache,
+        'cache_size_mb': args.cache_size_mb,
+        'scratch_dir': os.path.abspath(args.scratch_dir) if args.scratch_dir else '',
+        'ram_scratch': args.ram_scratch,
+        'rules_file': os.path.abspath(args.rules) if args.rules else '',
+        'binary_patch': args.binary_patch,
+        'memory_profile': args.profile_memory,
+        'cpu_profile': args.profile_cpu,
+        'concurrency': args.concurrency,
+        'coordinator': args.coordinate,
+        'coordinator_token': args.token if args.coordinate else '',
+        'annotation_index': args.index,
+        'backend': args.backend,
+        'hkanno_path': os.path.abspath(args.hkanno) if args.hkanno else '',
+        'hkanno_wrapper': args.hkanno_wrapper,
+        'metrics': args.metrics,
+        'debug': args.debug,
+    }
+
+def cli_run(args):
+    """Run a job from the command line, locally or through the job server"""
+    reporter = CliReporter()
+    options = cli_options(args)
+    try:
+        if args.server:
+            client = JobClient(args.host, args.port, args.token)
+            job = client.submit(args.source, args.multiplier, job_options(options))
+            print(f"Submitted job {job['id']}", flush=True)
+            if args.no_wait:
+                return 0
+            status = client.follow(job['id'], on_log=reporter.on_log, on_progress=reporter.on_progress)
+            reporter.done()
+            if status['state'] == "failed":
+                raise ShiftError(status['error'])
+            summary = status['summary']
+        else:
+            resources = EngineResources(args.workers)
+            engine = ShiftEngine(resources, on_log=reporter.on_log, on_progress=reporter.on_progress)
+            try:
+                summary = engine.run(args.source, args.multiplier, options)
+            except KeyboardInterrupt:
+                engine.cancel()
+                raise
+            finally:
+                reporter.done()
+                resources.shutdown()
+    except ShiftError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    except OSError as e:
+        print(f"Error: could not reach the job server at {args.host}:{args.port}: {e}", file=sys.stderr)
+        return 2
+    print(f"Results saved to: {summary['output_path']}")
+    return 1 if summary['failed'] else 0
+
+def cli_status(args):
+    client = JobClient(args.host, args.port, args.token)
+    try:
+        if args.job_id:
+            print(json.dumps(client.job(args.job_id, since=0 if args.log else None), indent=2))
+        else:
+            status = client.status()
+            print(f"Workers: {status['workers']}  Running: {status['running']}  Queued: {status['queued']}")
+            for job in client.jobs():
+                print(f"  #{job['id']:>4} {job['state']:<9} {job['progress']:5.1f}%  x{job['multiplier']}  {job['source']}")
+    except (ShiftError, OSError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    return 0
+
+def cli_cancel(args):
+    try:
+        job = JobClient(args.host, args.port, args.token).cancel(args.job_id)
+    except (ShiftError, OSError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    print(f"Job {job['id']}: {job['state']}")
+    return 0
+
+def cli_restore(args):
+    """Restore a source from a <base>-backup folder"""
+    reporter = CliReporter()
+    resources = EngineResources(args.workers)
+    engine = ShiftEngine(resources, on_log=reporter.on_log, on_progress=reporter.on_progress)
+    engine.debug_mode = args.debug
+    mode = 'link' if args.link else 'move' if args.move else 'copy'
+    try:
+        summary = engine.restore_backup(args.backup, args.target or None, mode, args.delete_extra,
+                                        args.full_compare, args.dry_run, args.only)
+    except ShiftError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    finally:
+        reporter.done()
+        resources.shutdown()
+    return 1 if summary['failed'] else 0
+
+def cli_verify(args):
+    """Check a -merged folder or archive against its output manifest"""
+    reporter = CliReporter()
+    resources = EngineResources(args.workers)
+    engine = ShiftEngine(resources, on_log=reporter.on_log, on_progress=reporter.on_progress)
+    engine.debug_mode = args.debug
+    try:
+        summary = engine.verify_output(output_manifest_path(args.manifest), args.target or None)
+    except ShiftError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    finally:
+        reporter.done()
+        resources.shutdown()
+    return 0 if summary['ok'] == summary['checked'] else 1
+
+def cli_index(args):
+    """Build or update the annotation index of a source"""
+    reporter = CliReporter()
+    resources = EngineResources(args.workers)
+    engine = ShiftEngine(resources, on_log=reporter.on_log, on_progress=reporter.on_progress)
+    options = {'debug': args.debug, 'rules_file': os.path.abspath(args.rules) if args.rules else '',
+               'scratch_dir': os.path.abspath(args.scratch_dir) if args.scratch_dir else ''}
+    try:
+        summary = engine.index_source(args.source, options)
+    except KeyboardInterrupt:
+        engine.cancel()
+        raise
+    except ShiftError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    finally:
+        reporter.done()
+        resources.shutdown()
+    return 1 if summary['failed'] else 0
+
+def cli_query(args):
+    """Search the annotation index"""
+    path = os.path.join("HKXShift_results", "HKXShift_annotations.sqlite")
+    if not os.path.isfile(path):
+        print("Error: no annotation index yet, build one with: index SOURCE", file=sys.stderr)
+        return 2
+    started = time.perf_counter()
+    try:
+        rows = AnnotationIndex(path).query(args.text, args.min_time, args.max_time, args.path, args.limit, args.files)
+    except sqlite3.Error as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    elapsed = time.perf_counter() - started
+    # File keys are "<source root>|<relative path>"
+    rows = [(row[0].replace("|", os.sep, 1),) + row[1:] for row in rows]
+    
+    if args.json:
+        fields = ('file', 'track', 'time', 'matches' if args.files else 'text', 'content_hash')
+        print(json.dumps([dict(zip(fields, row)) for row in rows], indent=2))
+    else:
+        for file, track, at, text, content_hash in rows:
+            print(f"{file}  ({text} matching annotations)" if args.files else f"{file}  track {track}  {at:.6f}  {text}")
+    print(f"{len(rows)} {'files' if args.files else 'annotations'} found in {elapsed * 1000:.1f} ms", file=sys.stderr)
+    return 0
+
+def cli_worker(args):
+    """Process files for a coordinated run on another machine until interrupted"""
+    if args.hkanno and not os.path.isfile(args.hkanno):
+        print(f"Error: {args.hkanno} not found.", file=sys.stderr)
+        return 2
+    worker = RemoteWorker(args.coordinator, workers=args.workers, token=args.token, scratch_dir=args.scratch_dir,
+                          name=args.name, hkanno_path=os.path.abspath(args.hkanno) if args.hkanno else "",
+                          hkanno_wrapper=args.hkanno_wrapper,
+                          on_log=lambda message: print(f"{time.strftime('%H:%M:%S')} - {message}", flush=True))
+    print(f"HKXShift worker {worker.name} ({worker.resources.workers} threads) for coordinator {args.coordinator}", flush=True)
+    try:
+        worker.serve_forever()
+    except KeyboardInterrupt:
+        worker.stop()
+    return 0
+
+def cli_serve(args):
+    options = {
+        'scratch_dir': os.path.abspath(args.scratch_dir) if args.scratch_dir else '',
+        'rules_file': os.path.abspath(args.rules) if args.rules else '',
+        'hkanno_path': os.path.abspath(args.hkanno) if args.hkanno else '',
+        'hkanno_wrapper': args.hkanno_wrapper,
+    }
+    try:
+        server = JobServer(args.host, args.port, workers=args.workers, concurrent_jobs=args.jobs, token=args.token,
+                           options=options)
+    except ShiftError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    print(f"HKXShift job server listening on http://{args.host}:{args.port} "
+          f"({server.resources.workers} workers, {args.jobs} concurrent jobs)", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="HKXShift - Skyrim Animation Speed Adjuster v1.4")
+    commands = parser.add_subparsers(dest="command")
+
+    commands.add_parser("gui", help="Start the graphical interface (default)")
+
+    run_parser = commands.add_parser("run", help="Process a source folder or zip archive without the GUI")
+    run_parser.add_argument("source", help="Source folder or .zip mod archive")
+    run_parser.add_argument("-m", "--multiplier", type=float, required=True, help="Speed multiplier (0.1 to 2.0)")
+    run_parser.add_argument("--no-backup", action="store_true", help="Do not back up the source")
+    run_parser.add_argument("--backup-format", choices=BACKUP_FORMATS, default=DEFAULT_OPTIONS['backup_format'],
+                            help="folder: plain copy of the source; zip: compressed parts that restore file by file")
+    run_parser.add_argument("--keep-temp", action="store_true", help="Keep the -converted and -rescaled folders")
+    run_parser.add_argument("--scratch-dir", default="", help="Folder for intermediate files (default: the results folder)")
+    run_parser.add_argument("--ram-scratch", action="store_true",
+                            help="Keep intermediate files on a RAM-backed folder such as /dev/shm when it has room")
+    run_parser.add_argument("--archive", action="store_true", help="Write merged output to a .zip archive")
+    run_parser.add_argument("--dedup", action="store_true",
+                            help="Process byte-identical HKX files once (hashes every HKX file that shares its size)")
+    run_parser.add_argument("--rules", default="", help=f"Preservation rules file (default: {RULES_FILE} if present)")
+    run_parser.add_argument("--binary-patch", action="store_true",
+                            help="Scale annotation times directly in binary packfiles, using hkanno only as a fallback (experimental)")
+    run_parser.add_argument("--profile-memory", action="store_true",
+                            help="Trace memory use and write <source>_memory.txt to the results folder (slower)")
+    run_parser.add_argument("--profile-cpu", nargs="?", const="all", default="", metavar="PHASES",
+                            help=f"Write a CPU profile (pstats and collapsed stacks) to the results folder, "
+                                 f"optionally only for comma separated phases: {', '.join(PROFILE_PHASES)}")
+    run_parser.add_argument("--concurrency", choices=CONCURRENCY_MODES, default=DEFAULT_OPTIONS['concurrency'],
+                            help="adaptive: tune parallelism while running; fixed: always use --workers; "
+                                 "background: low load and priority while you play or work")
+    run_parser.add_argument("--index", action="store_true",
+                            help="Add every annotation dump to the annotation index and use it to detect annotation patches")
+    run_parser.add_argument("--backend", choices=ANNOTATION_BACKENDS, default=DEFAULT_OPTIONS['backend'],
+                            help="Annotation backend: auto (fastest that works on a sample file), hkanno, "
+                                 "packfile (in-process, binary packfiles only) or stub (testing)")
+    run_parser.add_argument("--hkanno", default="", help="Path to hkanno64.exe (default: the current directory)")
+    run_parser.add_argument("--hkanno-wrapper", default="", metavar="COMMAND",
+                            help="Start hkanno through a compatibility layer, e.g. wine")
+    run_parser.add_argument("--cache", action="store_true",
+                            help="Reuse and store cached merged results (hashes every HKX file up front)")
+    run_parser.add_argument("--cache-size-mb", type=int, default=DEFAULT_OPTIONS['cache_size_mb'],
+                            help="Maximum size of the result cache in MB")
+    run_parser.add_argument("--metrics", nargs="?", const=f"127.0.0.1:{DEFAULT_METRICS_PORT}", default="", metavar="ADDRESS",
+                            help=f"Serve live Prometheus metrics at http://ADDRESS/metrics while running "
+                                 f"(default address 127.0.0.1:{DEFAULT_METRICS_PORT})")
+    run_parser.add_argument("--debug", action="store_true", help="Enable debug logging")
+    run_parser.add_argument("--workers", type=int, help="Number of worker threads (local runs)")
+    run_parser.add_argument("--server", action="store_true", help="Submit the job to the local job server")
+    run_parser.add_argument("--no-wait", action="store_true", help="With --server, return right after submitting")
+    run_parser.add_argument("--host", default="127.0.0.1", help="Job server address")
+    run_parser.add_argument("--port", type=int, default=DEFAULT_SERVER_PORT, help="Job server port")
+    run_parser.add_argument("--coordinate", nargs="?", const=f"127.0.0.1:{DEFAULT_COORDINATOR_PORT}", default="",
+                            metavar="HOST:PORT", help="Hand files out to remote 'worker' processes instead of "
+                                                      f"processing them here (default: 127.0.0.1, port {DEFAULT_COORDINATOR_PORT}; "
+                                                      "other addresses need --token)")
+    run_parser.add_argument("--token", default="",
+                            help="Shared secret: sent to the job server with --server, required from workers with --coordinate")
+
+    restore_parser = commands.add_parser("restore", help="Restore a source from its -backup folder, rewriting only changed files")
+    restore_parser.add_argument("backup", help="Backup folder, e.g. HKXShift_results/MyMod-backup")
+    restore_parser.add_argument("--target", default="", help="Folder (or .zip) to restore (default: the backed up source)")
+    restore_how = restore_parser.add_mutually_exclusive_group()
+    restore_how.add_argument("--link", action="store_true",
+                             help="Hardlink files from the backup (fastest; do not edit restored files in place afterwards)")
+    restore_how.add_argument("--move", action="store_true", help="Move files out of the backup (fast, uses the backup up)")
+    restore_parser.add_argument("--delete-extra", action="store_true", help="Delete files that are not in the backup")
+    restore_parser.add_argument("--full-compare", action="store_true",
+                                help="Hash every file instead of trusting matching size and modification time")
+    restore_parser.add_argument("--dry-run", action="store_true", help="Only report what would be restored")
+    restore_parser.add_argument("--only", action="append", metavar="PATTERN",
+                                help="Restore only files matching this glob, e.g. MovesetA/*.hkx (repeatable)")
+    restore_parser.add_argument("--workers", type=int, help="Number of worker threads")
+    restore_parser.add_argument("--debug", action="store_true", help="Enable debug logging")
+
+    verify_parser = commands.add_parser("verify", help="Check a -merged folder or archive against the output manifest of its run")
+    verify_parser.add_argument("manifest", help="Output manifest (HKXShift_results/MyMod_manifest.json) or the -merged folder or .zip")
+    verify_parser.add_argument("--target", default="", help="Copy of the output to check (default: the output recorded in the manifest)")
+    verify_parser.add_argument("--workers", type=int, help="Number of worker threads")
+    verify_parser.add_argument("--debug", action="store_true", help="Enable debug logging")
+
+    index_parser = commands.add_parser("index", help="Add new and changed HKX files of a source to the annotation index")
+    index_parser.add_argument("source", help="Source folder or .zip mod archive")
+    index_parser.add_argument("--rules", default="", help=f"Preservation rules file (default: {RULES_FILE} if present)")
+    index_parser.add_argument("--scratch-dir", default="", help="Folder for intermediate files (default: the results folder)")
+    index_parser.add_argument("--workers", type=int, help="Number of worker threads")
+    index_parser.add_argument("--debug", action="store_true", help="Enable debug logging")
+
+    query_parser = commands.add_parser("query", help="Search the annotation index")
+    query_parser.add_argument("text", nargs="?", default="",
+                              help='Full-text query on annotation text, e.g. SCAR_ActionData or "HitFrame OR PowerAttack"')
+    query_parser.add_argument("--min-time", type=float, help="Only annotations at or after this time (seconds)")
+    query_parser.add_argument("--max-time", type=float, help="Only annotations at or before this time (seconds)")
+    query_parser.add_argument("--path", default="", help="Only files whose path matches this glob, e.g. '*MovesetA*'")
+    query_parser.add_argument("--files", action="store_true", help="List matching files instead of annotations")
+    query_parser.add_argument("--limit", type=int, default=1000, help="Maximum number of results")
+    query_parser.add_argument("--json", action="store_true", help="Print results as JSON")
+
+    worker_parser = commands.add_parser("worker", help="Process files for a run started with --coordinate")
+    worker_parser.add_argument("coordinator", help="Coordinator address as HOST[:PORT]")
+    worker_parser.add_argument("--workers", type=int, help="Number of files processed at the same time")
+    worker_parser.add_argument("--token", default="", help="Shared secret of the coordinator")
+    worker_parser.add_argument("--scratch-dir", default="HKXShift_worker", help="Folder for intermediate files")
+    worker_parser.add_argument("--name", help="Worker name shown by the coordinator (default: host-pid)")
+    worker_parser.add_argument("--hkanno", default="",
+                               help="Path to hkanno64.exe on this machine (default: the coordinator's --hkanno, "
+                                    "else the current directory)")
+    worker_parser.add_argument("--hkanno-wrapper", default="", metavar="COMMAND",
+                               help="Start hkanno through a compatibility layer, e.g. wine")
+
+    serve_parser = commands.add_parser("serve", help="Run the local job server")
+    serve_parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: localhost only)")
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_SERVER_PORT, help="Port to listen on")
+    serve_parser.add_argument("--workers", type=int, help="Size of the shared worker pool")
+    serve_parser.add_argument("--jobs", type=int, default=2, help="Number of jobs processed at the same time")
+    serve_parser.add_argument("--token", default="",
+                              help="Shared secret clients must send with --token (required beyond localhost)")
+    serve_parser.add_argument("--scratch-dir", default="", help="Folder for intermediate files of all jobs")
+    serve_parser.add_argument("--rules", default="", help=f"Preservation rules file (default: {RULES_FILE} if present)")
+    serve_parser.add_argument("--hkanno", default="", help="Path to hkanno64.exe (default: the current directory)")
+    serve_parser.add_argument("--hkanno-wrapper", default="", metavar="COMMAND",
+                              help="Start hkanno through a compatibility layer, e.g. wine")
+
+    status_parser = commands.add_parser("status", help="Show job server status or a single job")
+    status_parser.add_argument("job_id", nargs="?", help="Job to show")
+    status_parser.add_argument("--log", action="store_true", help="Include the job's log lines")
+    status_parser.add_argument("--host", default="127.0.0.1", help="Job server address")
+    status_parser.add_argument("--port", type=int, default=DEFAULT_SERVER_PORT, help="Job server port")
+    status_parser.add_argument("--token", default="", help="Job server token")
+
+    cancel_parser = commands.add_parser("cancel", help="Cancel a queued or running job")
+    cancel_parser.add_argument("job_id", help="Job to cancel")
+    cancel_parser.add_argument("--host", default="127.0.0.1", help="Job server address")
+    cancel_parser.add_argument("--port", type=int, default=DEFAULT_SERVER_PORT, help="Job server port")
+    cancel_parser.add_argument("--token", default="", help="Job server token")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        return cli_run(args)
+    if args.command == "serve":
+        return cli_serve(args)
+    if args.command == "worker":
+        return cli_worker(args)
+    if args.command == "index":
+        return cli_index(args)
+    if args.command == "restore":
+        return cli_restore(args)
+    if args.command == "verify":
+        return cli_verify(args)
+    if args.command == "query":
+        return cli_query(args)
+    if args.command == "status":
+        return cli_status(args)
+    if args.command == "cancel":
+        return cli_cancel(args)
+
+    # Only the GUI needs Tk, the commands above also run where it is not installed
+    import tkinter as tk
+    from .gui import ModernHKXShift
+    root = tk.Tk()
+    ModernHKXShift(root)
+    root.mainloop()
+    return 0
@@ -0,0 +1,135 @@
+"""Constants, options and helpers shared by every part of HKXShift"""
+import os
+import subprocess
+import re
+import zipfile
+import ipaddress
+
+def is_float(s):
+    try:
+        float(s)
+        return True
+    except:
+        return False
+
+def is_hkx_file(filename):
+    """Check if file is an HKX file (case insensitive)"""
+    return bool(re.search(r'\.hkx$', filename, re.IGNORECASE))
+
+def is_txt_or_json_file(filename):
+    """Check if file is a TXT or JSON file (case insensitive)"""
+    return bool(re.search(r'\.(txt|json)$', filename, re.IGNORECASE))
+
+TOOL_VERSION = "1.4"
+
+def is_zip_archive(path):
+    """Check if path points to a zip archive (case insensitive)"""
+    return os.path.isfile(path) and zipfile.is_zipfile(path)
+
+class ShiftError(Exception):
+    """Raised when a job cannot be run (missing source, hkanno64.exe, bad multiplier...)"""
+
+# Hide hkanno64.exe console windows on Windows
+NO_WINDOW_FLAGS = getattr(subprocess, "CREATE_NO_WINDOW", 0)
+
+DEFAULT_SERVER_PORT = 8757
+DEFAULT_COORDINATOR_PORT = 8758
+DEFAULT_METRICS_PORT = 8759
+
+DEFAULT_OPTIONS = {
+    'backup': True,
+    'backup_format': 'folder',
+    'delete_temp': True,
+    'archive_output': False,
+    'deduplicate': False,
+    'result_cache': False,
+    'cache_size_mb': 2048,
+    'scratch_dir': '',
+    'ram_scratch': False,
+    'rules_file': '',
+    'binary_patch': False,
+    'memory_profile': False,
+    'cpu_profile': '',
+    'concurrency': 'adaptive',
+    'coordinator': '',
+    'coordinator_token': '',
+    'annotation_index': False,
+    'backend': 'auto',
+    'hkanno_path': '',
+    'hkanno_wrapper': '',
+    'metrics': '',
+    'debug': False,
+}
+
+# Options that name programs, files or addresses on the machine running the job. The job server
+# takes them from its own command line (see 'serve --help') and never from a submitted job.
+SERVER_OPTIONS = ('scratch_dir', 'rules_file', 'coordinator', 'coordinator_token', 'hkanno_path', 'hkanno_wrapper', 'metrics')
+
+def job_options(options):
+    """The options a client submits to the job server; raise ShiftError if a server-side one is set"""
+    server_side = [key for key in SERVER_OPTIONS if options.get(key, DEFAULT_OPTIONS[key]) != DEFAULT_OPTIONS[key]]
+    if server_side:
+        raise ShiftError(f"The job server does not take {', '.join(server_side)} from clients, "
+                         "set them when starting it (see 'serve --help')")
+    return {key: value for key, value in options.items() if key not in SERVER_OPTIONS}
+
+def validate_source(source, check_hkanno=True, hkanno_path=""):
+    """Raise ShiftError if the source or hkanno64.exe is missing"""
+    if not os.path.isdir(source) and not is_zip_archive(source):
+        raise ShiftError("Source folder or zip archive does not exist.")
+    if check_hkanno and not os.path.isfile(hkanno_path or "hkanno64.exe"):
+        raise ShiftError(f"{hkanno_path} not found." if hkanno_path else "hkanno64.exe not found in current directory.")
+
+def validate_job(source, scale, check_hkanno=True, hkanno_path=""):
+    """Raise ShiftError if a job with these settings cannot run"""
+    validate_source(source, check_hkanno, hkanno_path)
+    if not 0 < scale < float("inf"):
+        raise ShiftError("Invalid speed multiplier.")
+    if scale == 1.0:
+        raise ShiftError("Speed multiplier is set to 1.0, which will not change animation speed.\n\n"
+                         "Please select a different multiplier value.")
+
+def extreme_multiplier(scale):
+    """True for multipliers outside the recommended range, which can break hit registration"""
+    return scale <= 0.6 or scale >= 1.4
+
+def new_summary(backed_up=0):
+    """Summary counters of a run (or of one file processed by a remote worker)"""
+    return {
+        'dumped': 0,
+        'scaled': 0,
+        'merged': 0,
+        'failed': 0,
+        'hkx_count': 0,
+        'txt_count': 0,
+        'json_count': 0,
+        'backed_up': backed_up,
+        'preserved_files': {},
+        'preserved_lines': {},
+        'skipped_files': 0,
+        'skipped_lines': 0,
+        'annotation_cache_hits': 0,
+        'deduplicated': 0,
+        'cached': 0,
+        'cache_lookups': 0,
+        'binary_patched': 0,
+        'unchanged': 0,
+        'copied_bytes': 0
+    }
+
+def parse_address(address, default_port, default_host="127.0.0.1"):
+    """Split "host:port", "host" or ":port" into (host, port)"""
+    host, _, port = address.rpartition(":") if ":" in address else (address, "", "")
+    try:
+        return host or default_host, int(port) if port else default_port
+    except ValueError:
+        raise ShiftError(f"Invalid address: {address}")
+
+def is_loopback(host):
+    """True if only this machine can reach a server bound to host"""
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
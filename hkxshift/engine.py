@@ -0,0 +1,2079 @@
+"""The processing engine: plans and runs dump/rescale/merge over a source tree"""
+import os
+import shutil
+import subprocess
+import threading
+import time
+import shlex
+import zipfile
+import json
+import contextlib
+import struct
+import fnmatch
+import functools
+import sqlite3
+import tempfile
+from concurrent.futures import as_completed, wait, FIRST_COMPLETED
+
+from .common import (DEFAULT_COORDINATOR_PORT, DEFAULT_METRICS_PORT, DEFAULT_OPTIONS, NO_WINDOW_FLAGS, ShiftError,
+                     TOOL_VERSION, extreme_multiplier, is_hkx_file, is_txt_or_json_file, is_zip_archive, new_summary,
+                     parse_address, validate_job, validate_source)
+from .sources import FolderSource, ZipSource, describe_file, file_sha256, hash_source_file, open_source, stream_sha256
+from .backup import BACKUP_MANIFEST, OutputManifest, RESTORE_MODES, SourceBackup, write_output_manifest
+from .fileops import (CopyBatcher, FileLock, MergedArchiveWriter, RUNS_DIR, fast_copy, find_ram_scratch, link_or_copy,
+                      new_run_id)
+from .caches import ResultCache
+from .logs import RecordCollector, RunLogWriter, log_level
+from .rules import DEFAULT_PRESERVATION_RULES, PreservationRules
+from .packfile import HkxPatchError, patch_annotation_times
+from .backends import (ANNOTATION_BACKENDS, CALIBRATION_CANDIDATES, CALIBRATION_SAMPLES, HkannoBackend,
+                       PackfileBackend, StubBackend, calibrate_backends)
+from .profiling import CpuProfiler, MemoryProfiler, PROFILE_PHASES
+from .stats import DEFAULT_STAGE_COSTS, format_duration
+from .annotations import AnnotationIndex, parse_annotation_dump, rescale_annotations
+from .resources import CONCURRENCY_MODES, ConcurrencyController
+from .metrics import MetricsServer, render_metrics
+from .remote import WorkCoordinator
+
+class FolderJob:
+    """State shared by the file tasks of one moveset folder"""
+    def __init__(self, source_tree, folder, subname, files, converted, rescaled, merged, scale):
+        self.source_tree = source_tree
+        self.folder = folder
+        self.subname = subname
+        self.files = files
+        self.total = len(files)
+        self.converted = converted
+        self.rescaled = rescaled
+        self.merged = merged
+        self.scale = scale
+
+class ShiftEngine:
+    """Runs HKXShift jobs without any UI.
+
+    Log lines and progress are reported through the on_log/on_progress callbacks,
+    so the same engine drives the GUI, the command line and the job server.
+    """
+    def __init__(self, resources, on_log=None, on_progress=None, results_dir="HKXShift_results"):
+        self.resources = resources
+        self.on_log = on_log
+        self.on_progress = on_progress
+        self.results_dir = results_dir
+        self.debug_mode = False
+        self.processing = False
+        self.run_log = None
+        self.archive_writer = None
+        self.memory_profiler = None
+        self.cpu_profiler = None
+        self.concurrency = None
+        self.coordinator = None
+        self.backup = None
+        self.output_manifest = None
+        self.copies = None
+        self.backend = HkannoBackend()
+        self.fallback_backend = None
+        self.run_id = None
+        self.workspace = None
+        self.scratch_workspace = None
+        self.merged_root = None
+        self.annotation_index = None
+        self.index_rules = {}
+        self.hkanno_flags = NO_WINDOW_FLAGS
+        self.summary = None
+        self.total_cost = 0.0
+        self.completed_cost = 0.0
+        self.started = None
+        self.last_progress = None
+        self.file_info = {}
+        self.file_costs = {}
+        self.stage_timings = []
+        self.duplicate_of = {}
+        self.duplicates = {}
+        self.content_hashes = {}
+        self.result_cache = None
+        self.cache_keys = {}
+        self.cached_results = {}
+        self.unchanged_files = {}
+        self.scratch_dir = results_dir
+        self.delete_temp = True
+        self.binary_patch = False
+        self.backend_options = {}
+        self.rules = PreservationRules(DEFAULT_PRESERVATION_RULES)
+        self.base = None
+        self.lock = threading.RLock()
+
+    def cancel(self):
+        if self.processing:
+            self.processing = False
+            self.log("⚠️ Operation cancelled by user")
+
+    def update_progress(self, value, message=None):
+        """Report progress (0-100) and a status message"""
+        if self.on_progress:
+            self.on_progress(value, message)
+
+    def log(self, message, debug=False, log_only=False, **fields):
+        """Log messages to the run log and the log callback.
+
+        Extra keyword fields (file, stage, duration, error) are added to the
+        structured JSON log record.
+        """
+        # Format message with timestamp for logs
+        timestamp = time.strftime("%H:%M:%S")
+        
+        # Prefix debug messages
+        if debug:
+            formatted_message = f"{timestamp} - [DEBUG] {message}"
+        else:
+            formatted_message = f"{timestamp} - {message}"
+        
+        # Always write to log file if it exists
+        run_log = self.run_log
+        if run_log:
+            run_log.write(formatted_message, dict(level=log_level(message, debug), message=message.strip(), **fields))
+        
+        # Skip console output for log_only messages
+        if log_only:
+            return
+        
+        # Skip debug messages in console unless debug mode is enabled
+        if debug and not self.debug_mode:
+            return
+        
+        if self.on_log:
+            self.on_log(formatted_message, message, debug)
+
+    def write_log_record(self, text, **fields):
+        """Write a raw record (e.g. "[ERROR - DUMP] ...") to the run log"""
+        run_log = self.run_log
+        if run_log:
+            run_log.write(text, dict(level="error", message=text, **fields))
+
+    def slot(self, kind):
+        """Context manager holding a 'subprocess' or 'io' concurrency slot"""
+        return self.concurrency.slot(kind) if self.concurrency else contextlib.nullcontext()
+
+    def parallelism(self):
+        return self.concurrency.parallelism() if self.concurrency else self.resources.workers
+
+    def cpu_phase(self, name):
+        """Context manager profiling a phase when CPU profiling is enabled"""
+        return self.cpu_profiler.phase(name) if self.cpu_profiler else contextlib.nullcontext()
+
+    def cpu_begin(self, name):
+        if self.cpu_profiler:
+            self.cpu_profiler.begin(name)
+
+    def cpu_end(self, name):
+        if self.cpu_profiler:
+            self.cpu_profiler.end(name)
+
+    def memory_checkpoint(self, label):
+        """Record memory usage at a phase or folder boundary (memory profiling only)"""
+        if self.memory_profiler:
+            self.memory_profiler.checkpoint(label)
+
+    def count(self, key, amount=1):
+        """Thread-safe summary counter update"""
+        with self.lock:
+            self.summary[key] += amount
+
+    def count_copy(self, path, method="copy"):
+        """Add a copied file's size to the summary; hardlinks copy nothing"""
+        if method in ("link", "archive"):
+            return
+        try:
+            self.count('copied_bytes', os.path.getsize(path))
+        except OSError:
+            pass
+
+    def count_rule(self, key, name, amount=1):
+        """Thread-safe per-rule summary counter update"""
+        with self.lock:
+            self.summary[key][name] = self.summary[key].get(name, 0) + amount
+
+    def advance(self, message=None, cost=0.0):
+        """Add completed work (in predicted seconds) and report progress with the time left"""
+        with self.lock:
+            self.completed_cost += cost
+            completed = self.completed_cost
+            if cost:
+                self.last_progress = time.time()
+        progress = min(100.0, completed / self.total_cost * 100) if self.total_cost else 0.0
+
+        # Scale the predicted remaining work by how fast predicted work is actually completing
+        remaining = max(0.0, self.total_cost - completed)
+        elapsed = time.time() - self.started
+        if completed > 0 and elapsed > 1:
+            eta = remaining * elapsed / completed
+        else:
+            eta = remaining / self.parallelism()
+        if message:
+            message = f"{message} (about {format_duration(eta)} left)"
+            backup = self.backup
+            if backup and not backup.done():
+                message = f"{message} - backup {backup.progress():.0f}%"
+        self.update_progress(progress, message)
+
+    def record_stage(self, job, file, stage, started):
+        """Remember how long a stage took for the run statistics database"""
+        key, size = self.file_info[(job.folder, file)]
+        duration = time.perf_counter() - started
+        with self.lock:
+            self.stage_timings.append((key, stage, size, duration))
+        run_log = self.run_log
+        if run_log:
+            run_log.write(None, dict(level="info", message=f"{stage} finished", file=f"{job.subname}/{file}",
+                                     stage=stage, duration=round(duration, 4)))
+
+    # Safe subprocess execution with proper shlex handling for paths with spaces
+    def run_hkanno_cmd(self, cmd_type, args, backend=None):
+        """Run hkanno64.exe command with proper argument parsing for paths with spaces"""
+        backend = backend or self.backend
+        
+        try:
+            # Log the command for debugging using shlex.quote for safe display - always to log file
+            cmd_str = " ".join(shlex.quote(str(arg)) for arg in backend.command(cmd_type, args))
+            self.log(f"Running command: {cmd_str}", debug=True)
+            
+            # Run the command without shell=True
+            with self.slot('subprocess'):
+                returncode, filtered = backend.run(cmd_type, args, creationflags=self.hkanno_flags)
+            
+            # Log return code for debugging - always to log file
+            self.log(f"Command return code: {returncode}", debug=True)
+            return filtered, None
+        except Exception as e:
+            error_msg = str(e)
+            self.log(f"Command execution error: {error_msg}", debug=True)
+            return None, error_msg
+
+    def annotations(self, action, hkx, path, rescale=None):
+        """Dump ('dump') or write back ('update') the annotations of hkx; returns an error message or None.
+        
+        Files the selected backend cannot handle go to the fallback backend (hkanno).
+        An update falls back on a fresh dump of the fallback backend, edited by
+        rescale(lines) -> lines, so hkanno only ever reads text it wrote itself.
+        """
+        error = self._annotations(self.backend, action, hkx, path)
+        if error and self.fallback_backend:
+            self.log(f"{self.backend.name} could not {action} {os.path.basename(hkx)} ({error}), using {self.fallback_backend.name}", debug=True)
+            if action == 'update' and rescale:
+                fresh = f"{path}.{self.fallback_backend.name}"
+                error = self._annotations(self.fallback_backend, 'dump', hkx, fresh)
+                if error:
+                    return error
+                with open(fresh, "r", encoding="utf-8") as f:
+                    lines = rescale(f.readlines())
+                with open(path, "w", encoding="utf-8") as f:
+                    f.writelines(lines)
+            error = self._annotations(self.fallback_backend, action, hkx, path)
+        return error
+
+    def _annotations(self, backend, action, hkx, path):
+        if isinstance(backend, HkannoBackend):
+            flag = "-o" if action == 'dump' else "-i"
+            return self.run_hkanno_cmd([action, flag, path], [hkx], backend)[1]
+        try:
+            getattr(backend, action)(hkx, path)
+            return None
+        except (HkxPatchError, OSError, struct.error, ValueError) as e:
+            return str(e) or type(e).__name__
+
+    def select_backend(self, options, source_tree, announce=True):
+        """Resolve the annotation backend for this run.
+        
+        With 'auto' the available backends are calibrated on the smallest HKX
+        file of the first run that has one; the choice is kept for the process.
+        """
+        choice = options['backend']
+        if choice not in ANNOTATION_BACKENDS:
+            raise ShiftError(f"Unknown annotation backend: {choice}. Use one of: {', '.join(ANNOTATION_BACKENDS)}")
+        key = (choice, options['hkanno_path'], options['hkanno_wrapper'])
+        with self.resources.lock:
+            resolved = self.resources.backends.get(key)
+        if resolved is None:
+            resolved = self._select_backend(choice, options, source_tree)
+        if resolved is None:
+            # Nothing to calibrate on yet, use hkanno without remembering the choice
+            hkanno = HkannoBackend(options['hkanno_path'] or "hkanno64.exe", options['hkanno_wrapper'])
+            resolved = (hkanno, None, "hkanno (not calibrated)")
+        else:
+            with self.resources.lock:
+                self.resources.backends[key] = resolved
+        self.backend, self.fallback_backend, description = resolved
+        if announce:
+            self.log(f"🔧 Annotation backend: {description}")
+        return description
+
+    def _select_backend(self, choice, options, source_tree):
+        hkanno = HkannoBackend(options['hkanno_path'] or "hkanno64.exe", options['hkanno_wrapper'])
+        if choice != 'auto':
+            backend = {'hkanno': hkanno, 'packfile': PackfileBackend(), 'stub': StubBackend()}[choice]
+            reason = backend.unavailable()
+            if reason:
+                raise ShiftError(f"Annotation backend {choice} unavailable: {reason}")
+            fallback = hkanno if choice == 'packfile' and not hkanno.unavailable() else None
+            return backend, fallback, choice + (f" (falls back to {fallback.name})" if fallback else "")
+        
+        # hkanno comes first: it is the reference the in-process parser has to agree with
+        candidates = [backend for backend in (hkanno, PackfileBackend()) if not backend.unavailable()]
+        if not self.file_info:
+            return None
+        
+        # Files without annotations match trivially, so they prove nothing about a backend
+        samples = sorted(self.file_info, key=lambda entry: self.file_info[entry][1])[:CALIBRATION_CANDIDATES]
+        totals = {backend: 0.0 for backend in candidates}
+        failures = {}
+        used = []
+        sample_dir = tempfile.mkdtemp(prefix="hkxshift-sample-")
+        try:
+            for folder, file in samples:
+                if len(used) == CALIBRATION_SAMPLES:
+                    break
+                sample = os.path.join(sample_dir, file)
+                source_tree.copy_file(os.path.join(folder, file), sample)
+                timings, sample_failures, annotated = calibrate_backends(candidates, sample)
+                os.remove(sample)
+                if not annotated and len(candidates) > 1 and timings:
+                    continue
+                used.append(file)
+                for name, reason in sample_failures.items():
+                    self.log(f"Backend {name} failed calibration on {file}: {reason}", debug=True)
+                    failures.setdefault(name, f"{file}: {reason}")
+                for seconds, backend in timings:
+                    totals[backend] += seconds
+        finally:
+            shutil.rmtree(sample_dir, ignore_errors=True)
+        if not used:
+            self.log(f"No annotated file among the {len(samples)} smallest to calibrate on", debug=True)
+            return None
+        timings = sorted(((seconds, backend) for backend, seconds in totals.items() if backend.name not in failures),
+                         key=lambda timing: timing[0])
+        if not timings:
+            raise ShiftError("No annotation backend could process the sample files: " +
+                             "; ".join(f"{name}: {reason}" for name, reason in failures.items()))
+        backend = timings[0][1]
+        fallback = hkanno if backend is not hkanno and not hkanno.unavailable() else None
+        measured = ", ".join(f"{b.name} {seconds * 1000:.1f} ms" for seconds, b in timings)
+        return backend, fallback, f"{backend.name} (calibrated on {', '.join(used)}: {measured})" + \
+            (f", falls back to {fallback.name}" if fallback else "")
+
+    def handle_file_path(self, path):
+        """Quote a file path for safe display in logs"""
+        return shlex.quote(path)
+
+    @staticmethod
+    def file_key(source_tree, rel):
+        """Key of a source file that stays the same between runs (run statistics, annotation index)"""
+        return os.path.abspath(source_tree.path) + "|" + rel.replace("\\", "/")
+
+    def publish_output(self, merged, subname, file, path=None, source_tree=None, rel=None):
+        """Place a finished file into the -merged layout (folder or archive)"""
+        if self.archive_writer:
+            arcname = f"{subname}/{file}"
+            if path is not None:
+                self.archive_writer.add_file(path, arcname)
+            else:
+                self.archive_writer.add_source(source_tree, rel, arcname)
+            return
+        
+        # Never write through an existing hardlink into another output
+        dest = os.path.join(merged, file)
+        if os.path.lexists(dest):
+            os.remove(dest)
+        with self.slot('io'):
+            if path is not None:
+                fast_copy(path, dest)
+            else:
+                source_tree.copy_file(rel, dest)
+        self.count_copy(dest)
+        self.output_written(dest)
+
+    def output_written(self, path):
+        """Queue a file written to -merged for the output manifest"""
+        if self.output_manifest:
+            self.output_manifest.add(path)
+
+    def hash_inputs(self, source_tree, entries):
+        """Hash (folder, file) entries on the worker pool; unreadable files map to None"""
+        def digest(entry):
+            try:
+                return hash_source_file(source_tree, os.path.join(*entry))
+            except Exception:
+                return None
+
+        return dict(zip(entries, self.resources.pool.map(digest, entries)))
+
+    def find_duplicates(self):
+        """Map every hashed HKX file to the first byte-identical file found before it"""
+        first = {}
+        duplicate_of = {}
+        for entry in self.file_info:
+            content_hash = self.content_hashes.get(entry)
+            if content_hash is None:
+                continue
+            primary = first.setdefault(content_hash, entry)
+            if primary != entry:
+                duplicate_of[entry] = primary
+        return duplicate_of
+
+    def file_size(self, folder, file):
+        """Size of a planned HKX file, 0 if unknown"""
+        return self.file_info.get((folder, file), (None, 0))[1]
+
+    def copy_preserved(self, merged, subname, folder, file, rule_name, source_tree):
+        """Copy a file a preservation rule keeps as it is"""
+        try:
+            self.publish_output(merged, subname, file, source_tree=source_tree, rel=os.path.join(folder, file))
+        except Exception as e:
+            self.log(f"  ⚠️ Error copying {rule_name} file {file}: {str(e)}")
+
+    def copy_support_file(self, merged, subname, folder, file, source_tree):
+        """Copy a TXT or JSON file next to the merged HKX files"""
+        try:
+            self.log(f"  Copying support file: {file}", debug=True)
+            self.publish_output(merged, subname, file, source_tree=source_tree, rel=os.path.join(folder, file))
+        except Exception as e:
+            self.log(f"  ⚠️ Error copying {file}: {str(e)}", debug=True)
+
+    def place_cached_result(self, folder, subname, merged, file):
+        """Put a merged file from the result cache into -merged"""
+        cached = self.cached_results[(folder, file)]
+        try:
+            if self.archive_writer:
+                self.archive_writer.add_file(cached, f"{subname}/{file}")
+                result, method = cached, "archive"
+            else:
+                result = os.path.join(merged, file)
+                # Never a hardlink: whoever edits the output in place would change the cache entry too
+                method = link_or_copy(cached, result, hardlink=False)
+                self.count_copy(result, method)
+                self.output_written(result)
+            self.count('cached')
+            self.log(f"  ♻️ Using cached result for {file} ({method})")
+            self.fan_out(folder, subname, file, result)
+        except Exception as e:
+            self.write_log_record(f"[ERROR - CACHE] {file}: {str(e)}", stage='cache', file=file, error=str(e))
+            self.count('failed')
+            self.log(f"  ⚠️ Error placing cached result for {file}: {str(e)}")
+
+    def indexed_unchanged_files(self, source_tree, scale):
+        """{(folder, file): preserved lines per rule} for unchanged indexed files that rescaling leaves as they are"""
+        unchanged = {}
+        try:
+            keys = {key: entry for entry, (key, size) in self.file_info.items()}
+            for key, (signature, lines) in self.annotation_index.lines(list(keys)).items():
+                folder, file = keys[key]
+                if signature != AnnotationIndex.signature(source_tree, os.path.join(folder, file)):
+                    continue
+                _, preserved, _, changed = rescale_annotations(lines, scale, self.rules.match_line)
+                if not changed:
+                    unchanged[(folder, file)] = preserved
+        except (OSError, KeyError, sqlite3.Error) as e:
+            self.log(f"⚠️ Could not read the annotation index: {str(e)}", debug=True)
+        return unchanged
+
+    def dumped_unchanged(self, job, file):
+        """Preserved lines per rule if rescaling would leave a freshly dumped file as it is, else None"""
+        anno = os.path.join(job.converted, file, f"{os.path.splitext(file)[0]}.txt")
+        try:
+            with open(anno, "r", encoding="utf-8") as anno_file:
+                _, preserved, _, changed = rescale_annotations(anno_file, job.scale, self.rules.match_line)
+        except (OSError, UnicodeDecodeError):
+            return None
+        return None if changed else preserved
+
+    def pass_through(self, folder, subname, merged, file, preserved, source_tree=None, hkx=None, dumped=False):
+        """Publish a file that rescaling would not change as it is, without hkanno update.
+        
+        hkx is the copy made for the dump; without one the file is copied (or
+        reflinked) straight from the source. Returns False if it could not be written.
+        """
+        result = os.path.join(merged, file)
+        try:
+            if hkx is None and self.archive_writer:
+                self.publish_output(merged, subname, file, source_tree=source_tree, rel=os.path.join(folder, file))
+                result, method = None, "archive"
+            elif hkx is None and isinstance(source_tree, FolderSource):
+                method = link_or_copy(source_tree.full_path(os.path.join(folder, file)), result, hardlink=False)
+                self.count_copy(result, method)
+                self.output_written(result)
+            elif hkx is None:
+                self.publish_output(merged, subname, file, source_tree=source_tree, rel=os.path.join(folder, file))
+                method = "copy"
+            elif self.archive_writer:
+                self.archive_writer.add_file(hkx, f"{subname}/{file}")
+                result, method = hkx, "archive"
+            else:
+                # The dump copy is never written to again, so the output may share it
+                method = link_or_copy(hkx, result)
+                self.count_copy(result, method)
+                self.output_written(result)
+        except Exception as e:
+            self.write_log_record(f"[ERROR - COPY] {file}: {str(e)}", stage='copy', file=file, error=str(e))
+            self.count('failed')
+            self.log(f"  ⚠️ Error copying {file}: {str(e)}")
+            return False
+        
+        for name, count in preserved.items():
+            self.log(f"⚔️ Preserved {count} {name} annotation lines in {file}", debug=True)
+            self.count_rule('preserved_lines', name, count)
+        for key in ('scaled', 'merged', 'unchanged') if dumped else ('dumped', 'scaled', 'merged', 'unchanged'):
+            self.count(key)
+        self.log(f"  📋 No annotations to rescale in {file}, copied as it is ({method})")
+        if result:
+            self.store_result(folder, file, result)
+            self.fan_out(folder, subname, file, result)
+        elif self.duplicates.get((folder, file)):
+            # Archive output without a local copy: the duplicates come from the source too
+            for dup_folder, dup_file in self.duplicates[(folder, file)]:
+                self.publish_output(merged, os.path.basename(dup_folder) or self.base, dup_file,
+                                    source_tree=source_tree, rel=os.path.join(folder, file))
+                self.count('deduplicated')
+        return True
+
+    def store_result(self, folder, file, hkx):
+        """Add a freshly merged file to the result cache"""
+        key = self.cache_keys.get((folder, file))
+        if self.result_cache is None or key is None:
+            return
+        try:
+            self.result_cache.put(key, hkx)
+        except (OSError, sqlite3.Error) as e:
+            self.log(f"⚠️ Could not cache result for {file}: {str(e)}", debug=True)
+
+    def fan_out(self, folder, subname, file, result):
+        """Give every byte-identical copy of a file the same finished result"""
+        for dup_folder, dup_file in self.duplicates.get((folder, file), []):
+            dup_subname = os.path.basename(dup_folder) or self.base
+            try:
+                if self.archive_writer:
+                    self.archive_writer.add_file(result, f"{dup_subname}/{dup_file}")
+                    method = "archive"
+                else:
+                    merged = os.path.join(self.merged_root, dup_subname)
+                    os.makedirs(merged, exist_ok=True)
+                    method = link_or_copy(result, os.path.join(merged, dup_file))
+                    self.count_copy(os.path.join(merged, dup_file), method)
+                    self.output_written(os.path.join(merged, dup_file))
+                self.count('deduplicated')
+                self.log(f"  🔗 Reused {subname}/{file} for {dup_subname}/{dup_file} ({method})")
+            except Exception as e:
+                self.write_log_record(f"[ERROR - DEDUP] {dup_subname}/{dup_file}: {str(e)}", stage='dedup', file=f"{dup_subname}/{dup_file}", error=str(e))
+                self.count('failed')
+                self.log(f"  ⚠️ Error writing {dup_subname}/{dup_file}: {str(e)}")
+
+    def detect_patches(self, files, source_tree=None, folder=""):
+        """Detect patched HKX files (SCAR, CPR and custom rules) in a folder listing.
+        
+        Returns {rule name: [files]} in listing order. With the annotation index
+        enabled, files whose indexed annotations match a line rule count too.
+        """
+        patches = {}
+        indexed = self.indexed_line_rules(source_tree, folder, files) if source_tree else {}
+        
+        # Check files in folder
+        for file in files:
+            if is_hkx_file(file):
+                rule = self.rules.match_file(file) or indexed.get(file)
+                if rule:
+                    patches.setdefault(rule['name'], []).append(file)
+        
+        # Other annotation line rules are checked during the annotation dump
+        return patches
+
+    def indexed_line_rules(self, source_tree, folder, files):
+        """{file: line rule} for HKX files whose indexed annotations match a line rule.
+        
+        Only files that have not changed since they were indexed are looked up.
+        """
+        if not self.annotation_index:
+            return {}
+        with self.lock:
+            cached = self.index_rules.get(folder)
+        if cached is not None:
+            return cached
+        
+        found = {}
+        try:
+            keys = {}
+            for file in files:
+                if is_hkx_file(file):
+                    rel = os.path.join(folder, file)
+                    keys[self.file_key(source_tree, rel)] = (file, AnnotationIndex.signature(source_tree, rel))
+            for key, (signature, lines) in self.annotation_index.lines(list(keys)).items():
+                file, current = keys[key]
+                if signature != current:
+                    continue
+                for line in lines:
+                    rule = self.rules.match_line(line)
+                    if rule:
+                        found[file] = rule
+                        break
+        except (OSError, KeyError, sqlite3.Error) as e:
+            self.log(f"⚠️ Could not read the annotation index: {str(e)}", debug=True)
+        with self.lock:
+            self.index_rules[folder] = found
+        return found
+
+    def index_annotations(self, job, file, content):
+        """Store a freshly dumped file's annotations in the annotation index"""
+        rel = os.path.join(job.folder, file)
+        try:
+            content_hash = self.content_hashes.get((job.folder, file)) or hash_source_file(job.source_tree, rel)
+            self.annotation_index.update(self.file_key(job.source_tree, rel), os.path.abspath(job.source_tree.path),
+                                         AnnotationIndex.signature(job.source_tree, rel), content_hash,
+                                         parse_annotation_dump(content))
+            return True
+        except (OSError, KeyError, sqlite3.Error) as e:
+            self.log(f"⚠️ Could not index {file}: {str(e)}", debug=True)
+            return False
+
+    def start_backup(self, source_tree, results_dir, base, enabled=True, backup_format='folder'):
+        """Start backing up the source folder structure and files alongside processing"""
+        if not enabled:
+            self.log("Backup skipped (disabled in options)")
+            return None
+        
+        self.log("\n--- Creating backup of original files ---")
+        
+        backup_dir = os.path.join(results_dir, f"{base}-backup")
+        self.log(f"Backup location: {self.handle_file_path(backup_dir)}")
+        
+        # Runs on same-named sources take turns writing the backup folder
+        lock = FileLock(backup_dir + ".lock")
+        lock.acquire(on_wait=lambda: self.log("⏳ Waiting for another run to finish writing this backup..."))
+        backup = SourceBackup(source_tree, backup_dir, threads=max(2, min(4, self.resources.workers // 2)), lock=lock,
+                              backup_format=backup_format)
+        try:
+            backup.start()
+        except OSError as e:
+            backup.cancel()
+            raise ShiftError(f"Could not start the backup: {e}")
+        if backup.format == 'zip':
+            self.log(f"💾 Backing up {backup.total} files in the background ({len(backup.futures)} compressed parts)")
+        else:
+            if backup_format == 'zip':
+                self.log("ℹ️ Zip sources are backed up as they are, they are already compressed", debug=True)
+            self.log(f"💾 Backing up {backup.total} files in the background")
+        return backup
+
+    def finish_backup(self, backup):
+        """Wait for the background backup; returns the files that could not be backed up"""
+        if not self.processing:
+            backup.cancel()
+        elif not backup.done():
+            self.log("⏳ Waiting for the backup to finish...")
+        progress = min(100.0, self.completed_cost / self.total_cost * 100) if self.total_cost else 100.0
+        errors = backup.finish(lambda percent: self.update_progress(progress, f"Finishing backup ({percent:.0f}%)..."))
+        
+        for file, error in errors:
+            self.log(f"⚠️ Error backing up {file}: {error}", debug=True)
+        if errors:
+            self.log(f"❌ Backup incomplete: {len(errors)} of {backup.total} files could not be copied, "
+                     f"the previous backup in {self.handle_file_path(backup.backup_dir)} was kept")
+        elif backup.kind == 'archive':
+            self.log(f"✅ Backed up archive with {backup.count} files")
+        elif backup.format == 'zip':
+            self.log(f"✅ Backed up {backup.count} files ({backup.copied_bytes / 1048576:.1f} MB compressed to "
+                     f"{backup.stored_bytes / 1048576:.1f} MB)")
+        else:
+            self.log(f"✅ Backed up {backup.count} files")
+        self.log(f"Backup took {backup.finished - backup.started:.2f} seconds", debug=True)
+        return errors
+
+    def publish_run(self, results_dir, base, output_path, publish_output=True):
+        """Move this run's output, output manifest and log from its workspace into place.
+        
+        Runs on the same base name take turns through a lock file, so the
+        published output, its manifest and the log always belong to one run.
+        A -merged folder is swapped in with two renames, so for the moment
+        between them output_path does not exist: a reader sees the old
+        output, no output, or the new one, never a mix of the two. Archives
+        replace the previous one in a single rename.
+        """
+        lock = FileLock(os.path.join(results_dir, f"{base}.lock"))
+        lock.acquire(on_wait=lambda: self.log(f"⏳ Waiting for another {base} run to publish its results..."))
+        try:
+            if publish_output:
+                if self.archive_writer:
+                    os.replace(self.archive_writer.part_path, output_path)
+                else:
+                    # Directories cannot be renamed over each other; the old one is moved aside first
+                    previous = f"{output_path}.{self.run_id}.old"
+                    if os.path.isdir(output_path):
+                        os.replace(output_path, previous)
+                    os.replace(self.merged_root, output_path)
+                    if os.path.isdir(previous):
+                        self.resources.cleaner.discard(previous)
+                manifest = os.path.join(self.workspace, "manifest.json")
+                if os.path.isfile(manifest):
+                    os.replace(manifest, os.path.join(results_dir, f"{base}_manifest.json"))
+            
+            # Rolled-over parts of the log go with it; those of an older log are dropped
+            for name in ("log.txt", "log.jsonl"):
+                staged = os.path.join(self.workspace, name)
+                final = os.path.join(results_dir, f"{base}_{name}")
+                for suffix in [""] + [f".{n}" for n in range(1, 10)]:
+                    try:
+                        if os.path.exists(staged + suffix):
+                            os.replace(staged + suffix, final + suffix)
+                        elif suffix and os.path.exists(final + suffix):
+                            os.remove(final + suffix)
+                    except OSError as e:
+                        self.log(f"⚠️ Could not publish {os.path.basename(final + suffix)}: {str(e)}", debug=True)
+        finally:
+            lock.release()
+
+    def read_backup_manifest(self, backup_dir):
+        """The backup's manifest, or one rebuilt from the folder for backups made without it"""
+        path = os.path.join(backup_dir, BACKUP_MANIFEST)
+        if os.path.isfile(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    return json.load(f)
+            except (OSError, ValueError) as e:
+                raise ShiftError(f"Could not read the backup manifest {path}: {e}")
+        
+        self.log("ℹ️ Backup has no manifest, hashing its files")
+        backup_tree = FolderSource(backup_dir)
+        files = [os.path.join(folder, file).replace("\\", "/") for folder, names in backup_tree.walk() for file in names]
+        files = [rel for rel in files if rel != BACKUP_MANIFEST]
+        paths = [os.path.join(backup_dir, *rel.split("/")) for rel in files]
+        return {'source': None, 'kind': 'folder', 'files': dict(zip(files, self.resources.pool.map(describe_file, paths)))}
+
+    def restore_backup(self, backup_dir, target=None, mode="copy", delete_extra=False, full_compare=False, dry_run=False,
+                       only=None):
+        """Bring a source back to the state of a <base>-backup folder, rewriting only files that differ.
+        
+        Files whose size and mtime match the manifest count as unchanged unless
+        full_compare is set, in which case every file is hashed. mode is one of
+        RESTORE_MODES; files of zip backups are always extracted. only limits
+        the restore to files matching any of its glob patterns. Every restored
+        file is verified against its manifest hash. Returns a summary dict.
+        """
+        started = time.time()
+        if mode not in RESTORE_MODES:
+            raise ShiftError(f"Unknown restore mode: {mode}. Use one of: {', '.join(RESTORE_MODES)}")
+        if not os.path.isdir(backup_dir):
+            raise ShiftError(f"Backup folder not found: {backup_dir}")
+        
+        if not target and not os.path.isfile(os.path.join(backup_dir, BACKUP_MANIFEST)):
+            raise ShiftError("This backup has no manifest, give the folder to restore with --target")
+        
+        self.log(f"--- Restoring backup {self.handle_file_path(backup_dir)} ---")
+        manifest = self.read_backup_manifest(backup_dir)
+        target = target or manifest['source']
+        files = manifest['files']
+        archive = manifest['kind'] == 'archive' or (manifest['source'] is None and is_zip_archive(target))
+        if archive and len(files) != 1:
+            raise ShiftError("An archive backup must hold exactly one file")
+        
+        def selected(rel):
+            return not only or any(fnmatch.fnmatch(rel.lower(), pattern.lower().replace("\\", "/")) for pattern in only)
+        
+        if only:
+            files = {rel: entry for rel, entry in files.items() if selected(rel)}
+            if not files:
+                raise ShiftError(f"No files in the backup match: {', '.join(only)}")
+        
+        def destination(rel):
+            return target if archive else os.path.join(target, *rel.split("/"))
+        
+        self.log(f"Restoring to: {self.handle_file_path(target)}")
+        if manifest.get('complete') is False:
+            self.log("⚠️ This backup did not finish; files missing from it are left as they are")
+        summary = {'checked': len(files), 'unchanged': 0, 'restored': 0, 'deleted': 0, 'extra': 0, 'failed': 0,
+                   'verified': 0, 'methods': {}}
+        
+        # Compare the target with the manifest on the worker pool
+        def compare(rel):
+            entry = files[rel]
+            try:
+                stat = os.stat(destination(rel))
+                if stat.st_size != entry['size']:
+                    return False
+                if not full_compare and stat.st_mtime_ns == entry['mtime_ns']:
+                    return True
+                return file_sha256(destination(rel)) == entry['sha256']
+            except OSError:
+                return False
+        
+        rels = list(files)
+        differing = [rel for rel, same in zip(rels, self.resources.pool.map(compare, rels)) if not same]
+        summary['unchanged'] = len(rels) - len(differing)
+        
+        # Files the backup does not know about (batch backups cover the whole tree, single mode only the root)
+        extra = []
+        if not archive and os.path.isdir(target):
+            for folder, names in FolderSource(target).walk():
+                if manifest['kind'] == 'single' and folder:
+                    continue
+                extra.extend(rel for rel in (os.path.join(folder, n).replace("\\", "/") for n in names)
+                             if rel not in files and selected(rel))
+        summary['extra'] = len(extra)
+        self.log(f"🔍 Compared {len(rels)} files: {len(differing)} differ from the backup, {len(extra)} not in the backup")
+        
+        if dry_run:
+            for rel in differing:
+                self.log(f"  Would restore {rel}")
+            for rel in extra if delete_extra else []:
+                self.log(f"  Would delete {rel}")
+            summary['duration'] = time.time() - started
+            return summary
+        
+        # Zip parts are opened once and shared by the restore threads
+        parts = {}
+        parts_lock = threading.Lock()
+        
+        def extract(rel, temp):
+            entry = files[rel]
+            with parts_lock:
+                if entry['part'] not in parts:
+                    parts[entry['part']] = zipfile.ZipFile(os.path.join(backup_dir, entry['part']))
+                zf = parts[entry['part']]
+            with zf.open(rel) as src_file, open(temp, "wb") as dest_file:
+                shutil.copyfileobj(src_file, dest_file, 1024 * 1024)
+            os.utime(temp, ns=(entry['mtime_ns'], entry['mtime_ns']))
+            return "extract"
+        
+        def restore(rel):
+            src = os.path.join(backup_dir, *rel.split("/"))
+            dest = destination(rel)
+            os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+            if 'part' in files[rel]:
+                temp = f"{dest}.hkxshift-restore"
+                method = extract(rel, temp)
+                os.replace(temp, dest)
+                return method
+            if mode == 'move':
+                try:
+                    os.replace(src, dest)
+                    return "move"
+                except OSError:
+                    pass  # Another filesystem, copy instead
+            # Write next to the target first, so a failed restore never leaves a half-written file
+            temp = f"{dest}.hkxshift-restore"
+            method = link_or_copy(src, temp, hardlink=mode == 'link')
+            os.replace(temp, dest)
+            return method
+        
+        def verify(rel):
+            return file_sha256(destination(rel)) == files[rel]['sha256']
+        
+        futures = {self.resources.pool.submit(restore, rel): rel for rel in differing}
+        restored = []
+        for done, future in enumerate(as_completed(futures), 1):
+            rel = futures[future]
+            try:
+                method = future.result()
+                summary['methods'][method] = summary['methods'].get(method, 0) + 1
+                restored.append(rel)
+                self.log(f"  Restored {rel} ({method})", debug=True)
+            except Exception as e:
+                summary['failed'] += 1
+                self.log(f"  ⚠️ Error restoring {rel}: {str(e)}")
+            self.update_progress(done / len(futures) * 100, f"Restoring {rel}...")
+        for zf in parts.values():
+            zf.close()
+        summary['restored'] = len(restored)
+        
+        if delete_extra:
+            for rel in extra:
+                try:
+                    os.remove(os.path.join(target, *rel.split("/")))
+                    summary['deleted'] += 1
+                except OSError as e:
+                    summary['failed'] += 1
+                    self.log(f"  ⚠️ Error deleting {rel}: {str(e)}")
+        
+        # Verify the restored state against the manifest hashes
+        for rel, ok in zip(restored, self.resources.pool.map(verify, restored)):
+            if ok:
+                summary['verified'] += 1
+            else:
+                summary['failed'] += 1
+                self.log(f"  ⚠️ {rel} does not match the backup after restoring")
+        
+        summary['duration'] = time.time() - started
+        methods = ", ".join(f"{count} {method}" for method, count in summary['methods'].items())
+        self.log("")
+        self.log("=== RESTORE COMPLETE ===")
+        self.log(f"✅ Files Restored: {summary['restored']}" + (f" ({methods})" if methods else ""))
+        self.log(f"✅ Restored Files Verified: {summary['verified']}")
+        self.log(f"♻️ Unchanged Files Skipped: {summary['unchanged']}")
+        if summary['deleted'] > 0:
+            self.log(f"🗑️ Files Not In Backup Deleted: {summary['deleted']}")
+        elif extra:
+            self.log(f"ℹ️ Files Not In Backup Kept: {len(extra)} (use --delete-extra to remove them)")
+        if summary['failed'] > 0:
+            self.log(f"⚠️ Files Failed: {summary['failed']}")
+        if mode == 'move' and summary['methods'].get('move'):
+            self.log("ℹ️ Restored files were moved out of the backup folder")
+        self.log(f"⏱️ Time Elapsed: {summary['duration']:.2f} seconds")
+        return summary
+
+    def verify_output(self, manifest_path, target=None):
+        """Re-hash a -merged folder (or archive) and compare it with the run's output manifest.
+        
+        target defaults to the output recorded in the manifest. Returns a summary dict.
+        """
+        started = time.time()
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            files = manifest['files']
+        except (OSError, ValueError, KeyError) as e:
+            raise ShiftError(f"Could not read output manifest {manifest_path}: {str(e)}")
+        target = target or manifest['output']
+        archive = manifest.get('archive', False)
+        if not (os.path.isfile(target) if archive else os.path.isdir(target)):
+            raise ShiftError(f"Output not found: {target}")
+        
+        self.log(f"--- Verifying {self.handle_file_path(target)} ---")
+        self.log(f"Manifest: {self.handle_file_path(manifest_path)} (multiplier {manifest.get('multiplier')}, {manifest.get('created')})")
+        if manifest.get('complete') is False:
+            self.log("⚠️ The run that wrote this manifest did not finish; only the files it recorded are checked")
+        
+        present = set()
+        if archive:
+            with zipfile.ZipFile(target) as zf:
+                present = {info.filename for info in zf.infolist() if not info.is_dir()}
+        else:
+            for folder, names in FolderSource(target).walk():
+                present.update(os.path.join(folder, n).replace("\\", "/") for n in names)
+        
+        # Each check opens its own handle, so zip members can be read in parallel too
+        def check(rel):
+            entry = files[rel]
+            if rel not in present:
+                return 'missing'
+            if archive:
+                with zipfile.ZipFile(target) as zf:
+                    if zf.getinfo(rel).file_size != entry['size']:
+                        return 'mismatched'
+                    with zf.open(rel) as stream:
+                        sha256 = stream_sha256(stream)
+            else:
+                path = os.path.join(target, *rel.split("/"))
+                if os.path.getsize(path) != entry['size']:
+                    return 'mismatched'
+                sha256 = file_sha256(path)
+            return 'ok' if sha256 == entry['sha256'] else 'mismatched'
+        
+        summary = {'checked': len(files), 'ok': 0, 'missing': 0, 'mismatched': 0, 'failed': 0,
+                   'extra': len(present - set(files))}
+        futures = {self.resources.pool.submit(check, rel): rel for rel in files}
+        for done, future in enumerate(as_completed(futures), 1):
+            rel = futures[future]
+            try:
+                status = future.result()
+            except Exception as e:
+                status = 'failed'
+                self.log(f"  ⚠️ Error checking {rel}: {str(e)}")
+            summary[status] += 1
+            if status == 'missing':
+                self.log(f"  ❌ Missing: {rel}")
+            elif status == 'mismatched':
+                self.log(f"  ❌ Does not match the manifest: {rel}")
+            self.update_progress(done / len(futures) * 100, f"Verifying {rel}...")
+        for rel in sorted(present - set(files)):
+            self.log(f"  Not in the manifest: {rel}", debug=True)
+        
+        summary['duration'] = time.time() - started
+        self.log("")
+        self.log("=== VERIFY COMPLETE ===")
+        self.log(f"✅ Files Matching: {summary['ok']}/{summary['checked']}")
+        if summary['mismatched'] > 0:
+            self.log(f"❌ Files Changed: {summary['mismatched']}")
+        if summary['missing'] > 0:
+            self.log(f"❌ Files Missing: {summary['missing']}")
+        if summary['failed'] > 0:
+            self.log(f"⚠️ Files Failed: {summary['failed']}")
+        if summary['extra'] > 0:
+            self.log(f"ℹ️ Files Not In Manifest: {summary['extra']}")
+        self.log(f"⏱️ Time Elapsed: {summary['duration']:.2f} seconds")
+        return summary
+
+    def run(self, source, scale, options=None):
+        """Process a source folder or zip archive and return the summary dict"""
+        options = dict(DEFAULT_OPTIONS, **(options or {}))
+        self.debug_mode = options['debug']
+        # A coordinator only hands files out, its workers need hkanno64.exe
+        validate_job(source, scale, check_hkanno=not options['coordinator'] and options['backend'] in ('auto', 'hkanno'),
+                     hkanno_path=options['hkanno_path'])
+        self.rules = PreservationRules.load(options['rules_file'])
+        
+        if options['concurrency'] not in CONCURRENCY_MODES:
+            raise ShiftError(f"Unknown concurrency mode: {options['concurrency']}. Use one of: {', '.join(CONCURRENCY_MODES)}")
+        
+        # CPU profiling: 'all' or a comma separated list of PROFILE_PHASES
+        phases = [p.strip() for p in options['cpu_profile'].split(",") if p.strip() and p.strip() != 'all']
+        unknown = [p for p in phases if p not in PROFILE_PHASES]
+        if unknown:
+            raise ShiftError(f"Unknown profiling phase: {', '.join(unknown)}. Use one of: all, {', '.join(PROFILE_PHASES)}")
+        
+        self.processing = True
+        self.concurrency = ConcurrencyController(options['concurrency'], self.resources.workers, self.resources.max_workers,
+                                                 on_change=lambda message: self.log(message, debug=True))
+        self.concurrency.start()
+        # Background runs also start hkanno at a lower priority (Windows)
+        self.hkanno_flags = NO_WINDOW_FLAGS
+        if options['concurrency'] == 'background':
+            self.hkanno_flags |= getattr(subprocess, "BELOW_NORMAL_PRIORITY_CLASS", 0)
+        if options['cpu_profile']:
+            self.cpu_profiler = CpuProfiler(phases)
+            self.cpu_profiler.start()
+        if options['memory_profile']:
+            self.memory_profiler = MemoryProfiler(self.resources)
+            self.memory_profiler.start()
+        metrics = None
+        try:
+            if options['metrics']:
+                host, port = parse_address(options['metrics'], DEFAULT_METRICS_PORT, default_host="127.0.0.1")
+                try:
+                    metrics = MetricsServer(host, port, lambda: render_metrics([({}, self)], self.resources))
+                except OSError as e:
+                    raise ShiftError(f"Could not start the metrics endpoint on {host}:{port}: {e}")
+                metrics.start()
+                self.log(f"📈 Metrics at http://{host}:{port}/metrics")
+            if options['coordinator']:
+                host, port = parse_address(options['coordinator'], DEFAULT_COORDINATOR_PORT)
+                try:
+                    self.coordinator = WorkCoordinator(host, port, options['coordinator_token'],
+                                                       on_log=lambda message, debug: self.log(message, debug=debug))
+                except OSError as e:
+                    raise ShiftError(f"Could not start the coordinator on {host}:{port}: {e}")
+                self.coordinator.start()
+                self.log(f"🌐 Coordinating on {host}:{port}, waiting for workers (HKXShift worker <this machine>:{port})")
+            return self._run(source, scale, options)
+        finally:
+            self.processing = False
+            self.annotation_index = None
+            if self.backup:
+                self.backup.cancel()
+                self.backup = None
+            if metrics:
+                metrics.stop()
+            if self.copies:
+                self.copies.cancel()
+                self.copies = None
+            if self.output_manifest:
+                self.output_manifest.cancel()
+                self.output_manifest = None
+            if self.coordinator:
+                self.coordinator.stop()
+                self.coordinator = None
+            if self.memory_profiler:
+                self.memory_profiler.stop()
+                self.memory_profiler = None
+            if self.cpu_profiler:
+                self.cpu_profiler.stop()
+                self.cpu_profiler = None
+            self.concurrency.stop()
+            # Make sure everything logged so far reaches disk, even if the run failed
+            if self.run_log:
+                self.run_log.close()
+                self.run_log = None
+            self.archive_writer = None
+
+    def index_source(self, source, options=None):
+        """Dump new and changed HKX files of a source into the annotation index and return a summary dict"""
+        options = dict(DEFAULT_OPTIONS, **(options or {}))
+        self.debug_mode = options['debug']
+        validate_source(source)
+        self.processing = True
+        try:
+            return self._index_source(source, options)
+        finally:
+            self.processing = False
+            self.annotation_index = None
+
+    def _index_source(self, source, options):
+        started = time.time()
+        source_tree = open_source(source)
+        os.makedirs(self.results_dir, exist_ok=True)
+        try:
+            self.annotation_index = self.resources.annotation_index(self.results_dir)
+            known = self.annotation_index.signatures(os.path.abspath(source_tree.path))
+        except sqlite3.Error as e:
+            source_tree.close()
+            raise ShiftError(f"Annotation index unavailable: {str(e)}")
+        
+        summary = new_summary()
+        summary.update(indexed=0, unchanged=0, removed=0)
+        self.summary = summary
+        self.rules = PreservationRules.load(options['rules_file'])
+        self.file_info = {}
+        self.stage_timings = []
+        self.content_hashes = {}
+        
+        # Only files that are new or changed since they were last indexed get dumped
+        changed = {}
+        present = set()
+        for folder, files in source_tree.walk():
+            for file in files:
+                if not is_hkx_file(file):
+                    continue
+                rel = os.path.join(folder, file)
+                key = self.file_key(source_tree, rel)
+                present.add(key)
+                summary['hkx_count'] += 1
+                if known.get(key) == AnnotationIndex.signature(source_tree, rel):
+                    summary['unchanged'] += 1
+                else:
+                    changed.setdefault(folder, []).append(file)
+                    self.file_info[(folder, file)] = (key, source_tree.getsize(rel))
+        summary['removed'] = self.annotation_index.prune(os.path.abspath(source_tree.path), present)
+        
+        summary['backend'] = self.select_backend(options, source_tree)
+        if not self.backend.cacheable:
+            source_tree.close()
+            raise ShiftError(f"The {self.backend.name} backend cannot be used to build the annotation index")
+        self.file_costs = {entry: dict(DEFAULT_STAGE_COSTS) for entry in self.file_info}
+        self.total_cost = sum(costs['dump'] for costs in self.file_costs.values())
+        self.completed_cost = 0.0
+        self.started = time.time()
+        self.scratch_dir = options['scratch_dir'] or self.results_dir
+        scratch = os.path.join(self.scratch_dir, RUNS_DIR, new_run_id(source_tree.base))
+        self.log(f"🔎 Indexing {len(self.file_info)} new or changed HKX files ({summary['unchanged']} unchanged)")
+        
+        for folder, files in changed.items():
+            if not self.processing:
+                break
+            subname = os.path.basename(folder) or source_tree.base
+            job = FolderJob(source_tree, folder, subname, files, os.path.join(scratch, folder), None, None, None)
+            futures = [self.resources.pool.submit(self.index_file, job, idx, file) for idx, file in enumerate(files, 1)]
+            for future in as_completed(futures):
+                future.result()
+        source_tree.close()
+        self.resources.cleaner.discard(scratch)
+        
+        files, annotations = self.annotation_index.counts()
+        duration = time.time() - started
+        self.log("")
+        self.log("=== INDEXING COMPLETE ===")
+        self.log(f"🔎 Files Indexed: {summary['indexed']}")
+        self.log(f"♻️ Unchanged Files Skipped: {summary['unchanged']}")
+        if summary['removed'] > 0:
+            self.log(f"🗑️ Deleted Files Removed From Index: {summary['removed']}")
+        if summary['failed'] > 0:
+            self.log(f"⚠️ Files Failed: {summary['failed']}")
+        self.log(f"📄 Index: {files} files, {annotations} annotations in {self.handle_file_path(self.annotation_index.path)}")
+        self.log(f"⏱️ Time Elapsed: {duration:.2f} seconds")
+        
+        summary['duration'] = duration
+        summary['cancelled'] = not self.processing
+        summary['output_path'] = self.annotation_index.path
+        return summary
+
+    def index_file(self, job, idx, file):
+        """Dump one HKX file into the annotation index (runs on the shared worker pool)"""
+        if not self.processing:
+            return
+        try:
+            if self.dump_file(job, idx, file):
+                self.count('indexed')
+        except Exception as e:
+            self.count('failed')
+            self.log(f"  ⚠️ Unexpected error while indexing {file}: {str(e)}")
+        self.advance(cost=self.file_costs[(job.folder, file)]['dump'])
+        self.resources.cleaner.discard(os.path.join(job.converted, file))
+
+    def _run(self, source, scale, options):
+        multiplier_str = f"{scale}"
+        
+        # Log path for debugging
+        self.log(f"Source path: {self.handle_file_path(source)}", debug=True)
+        
+        self.cpu_begin('prepare')
+        source_tree = open_source(source)
+        base = source_tree.base
+        self.base = base
+        results_dir = self.results_dir
+        os.makedirs(results_dir, exist_ok=True)
+        
+        # Each run stages its output and log in a workspace of its own and publishes them at the end
+        self.run_id = new_run_id(base)
+        self.workspace = os.path.join(results_dir, RUNS_DIR, self.run_id)
+        self.merged_root = os.path.join(self.workspace, "merged")
+        os.makedirs(self.merged_root)
+        self.log(f"Run workspace: {self.handle_file_path(self.workspace)}", debug=True)
+        
+        if isinstance(source_tree, ZipSource):
+            self.log(f"🗜️ Reading zip archive: {self.handle_file_path(source_tree.display_path())}")
+        
+        # Back up the source if enabled; the copy runs alongside processing
+        self.backup = self.start_backup(source_tree, results_dir, base, options['backup'], options['backup_format'])
+        
+        summary = new_summary()
+        self.summary = summary
+        
+        # Stream merged output into an archive instead of the -merged folder
+        archive_path = os.path.join(results_dir, f"{base}-merged.zip")
+        self.archive_writer = MergedArchiveWriter(archive_path, os.path.join(self.workspace, "merged.zip.part")) \
+            if options['archive_output'] else None
+        if self.archive_writer:
+            self.log(f"🗜️ Writing merged output to {self.handle_file_path(archive_path)}")
+        
+        # Every output file is hashed as it is written, for the output manifest
+        self.output_manifest = None if self.archive_writer else OutputManifest(self.merged_root)
+        self.copies = CopyBatcher(self.resources.io_pool)
+        
+        # Find folders with HKX files (case insensitive), relative to the source root
+        listing = self.resources.inventory_cache.listing(source_tree)
+        self.memory_checkpoint("source listed")
+        folders = [item for item in listing if item and any(is_hkx_file(f) for f in listing[item])]
+        
+        # Single mode detection with case-insensitive HKX check
+        if not folders and any(is_hkx_file(f) for f in listing['']):
+            folders = [""]  # Single mode
+            self.log("📁 Single folder mode detected.")
+        elif not folders:
+            source_tree.close()
+            if self.archive_writer:
+                self.archive_writer.close(publish=False)
+            self.resources.cleaner.discard(self.workspace)
+            raise ShiftError("No .hkx files or valid subfolders found.")
+        else:
+            self.log(f"🔁 Batch mode detected: {len(folders)} subfolders")
+        
+        # Log folder paths for debugging
+        if self.debug_mode:
+            self.log("Folders to process:", debug=True)
+            for folder in folders:
+                self.log(f"  - {self.handle_file_path(source_tree.display_path(folder))}", debug=True)
+        
+        # The annotation index records every dump and reports annotation patches up front
+        self.annotation_index = None
+        self.index_rules = {}
+        if options['annotation_index']:
+            try:
+                self.annotation_index = self.resources.annotation_index(results_dir)
+            except sqlite3.Error as e:
+                self.log(f"⚠️ Annotation index unavailable: {str(e)}")
+        
+        # Progress tracking and patch detection
+        total_files = 0
+        patched_folders = {}
+        
+        for folder in folders:
+            # Detect patches
+            for name in self.detect_patches(listing[folder], source_tree, folder):
+                patched_folders[name] = patched_folders.get(name, 0) + 1
+            
+            folder_files = listing[folder]
+            hkx_files = [f for f in folder_files if is_hkx_file(f)]
+            total_files += len(hkx_files)
+            summary['hkx_count'] += len(hkx_files)
+            
+            # Count TXT and JSON files
+            txt_files = [f for f in folder_files if f.lower().endswith('.txt')]
+            json_files = [f for f in folder_files if f.lower().endswith('.json')]
+            summary['txt_count'] += len(txt_files)
+            summary['json_count'] += len(json_files)
+        
+        # Predict per-file stage costs from earlier runs
+        self.file_info = {}
+        self.stage_timings = []
+        stats_root = os.path.abspath(source_tree.path)
+        for folder in folders:
+            for file in listing[folder]:
+                if is_hkx_file(file) and not self.rules.match_file(file):
+                    rel = os.path.join(folder, file)
+                    self.file_info[(folder, file)] = (self.file_key(source_tree, rel), source_tree.getsize(rel))
+        
+        # The backend is part of the result cache key, so it is resolved before the lookups
+        if self.coordinator:
+            # The coordinator never touches HKX files, each worker resolves the backend it is sent
+            summary['backend'] = f"{options['backend']} (resolved by each worker)"
+            self.log(f"🔧 Annotation backend: {summary['backend']}")
+            self.backend = StubBackend() if options['backend'] == 'stub' else self.backend
+        else:
+            summary['backend'] = self.select_backend(options, source_tree)
+        
+        # Content hashes drive deduplication and the result cache. Without the cache,
+        # only files that share their size with another file can be duplicates.
+        if options['result_cache']:
+            to_hash = list(self.file_info)
+        elif options['deduplicate']:
+            sizes = {}
+            for key, size in self.file_info.values():
+                sizes[size] = sizes.get(size, 0) + 1
+            to_hash = [entry for entry, (key, size) in self.file_info.items() if sizes[size] > 1]
+        else:
+            to_hash = []
+        self.content_hashes = self.hash_inputs(source_tree, to_hash)
+        self.memory_checkpoint("content hashed")
+        
+        # Byte-identical files (shared idles, equip animations...) are processed once
+        self.duplicate_of = self.find_duplicates() if options['deduplicate'] else {}
+        self.duplicates = {}
+        for entry, primary in self.duplicate_of.items():
+            self.duplicates.setdefault(primary, []).append(entry)
+            del self.file_info[entry]
+        if self.duplicate_of:
+            self.log(f"🔗 Found {len(self.duplicate_of)} duplicate HKX files, each will reuse its original's result")
+        
+        # Files merged by an earlier run with the same settings come straight from the cache
+        self.result_cache = None
+        self.cache_keys = {}
+        self.cached_results = {}
+        if options['result_cache']:
+            try:
+                self.result_cache = self.resources.result_cache(results_dir, options['cache_size_mb'] * 1024 * 1024)
+                # Workers resolve 'auto' themselves, so a coordinator can only key on the requested backend
+                backend = options['backend'] if self.coordinator else self.backend.name
+                for entry in list(self.file_info):
+                    content_hash = self.content_hashes.get(entry)
+                    if content_hash is None:
+                        continue
+                    key = ResultCache.make_key(content_hash, scale, self.rules.id, backend, options['binary_patch'])
+                    self.cache_keys[entry] = key
+                    cached = self.result_cache.get(key, self.run_id)
+                    if cached:
+                        self.cached_results[entry] = cached
+                        del self.file_info[entry]
+            except (OSError, sqlite3.Error) as e:
+                self.result_cache = None
+                self.log(f"⚠️ Result cache unavailable: {str(e)}")
+            summary['cache_lookups'] = len(self.cache_keys)
+            if self.cached_results:
+                self.log(f"♻️ {len(self.cached_results)} of {len(self.cache_keys)} files found in the result cache")
+        
+        # Files whose indexed annotations rescaling would not change skip hkanno altogether
+        self.unchanged_files = self.indexed_unchanged_files(source_tree, scale) if self.annotation_index else {}
+        for entry in self.unchanged_files:
+            del self.file_info[entry]
+        if self.unchanged_files:
+            self.log(f"📋 {len(self.unchanged_files)} files have no annotations to rescale and will be copied as they are")
+        
+        try:
+            stats_db = self.resources.stats_db(results_dir)
+            predictions = stats_db.predict(list(self.file_info.values()))
+        except sqlite3.Error as e:
+            stats_db = None
+            predictions = [dict(DEFAULT_STAGE_COSTS) for _ in self.file_info]
+            self.log(f"⚠️ Run statistics unavailable: {str(e)}", debug=True)
+        self.file_costs = dict(zip(self.file_info, predictions))
+        self.total_cost = sum(sum(costs.values()) for costs in predictions)
+        self.completed_cost = 0.0
+        self.started = time.time()
+        self.log(f"Predicted processing time: {format_duration(self.total_cost / self.parallelism())}", debug=True)
+        
+        # Intermediate files go to the scratch folder, optionally a RAM disk.
+        # Each file needs room for two HKX copies and their annotation dumps.
+        self.scratch_dir = options['scratch_dir'] or results_dir
+        if options['ram_scratch']:
+            required = sum(size for key, size in self.file_info.values()) * 3
+            ram_dir = find_ram_scratch(required)
+            if ram_dir:
+                self.scratch_dir = os.path.join(ram_dir, "HKXShift_scratch")
+                self.log(f"⚡ Using RAM-backed scratch folder {self.handle_file_path(self.scratch_dir)}")
+            else:
+                self.log(f"ℹ️ Not enough RAM-backed space for {required / (1024 * 1024):.0f} MB of scratch files, using {self.handle_file_path(self.scratch_dir)}")
+        self.scratch_workspace = os.path.join(self.scratch_dir, RUNS_DIR, self.run_id)
+        self.delete_temp = options['delete_temp']
+        self.binary_patch = options['binary_patch']
+        self.backend_options = {key: options[key] for key in ('backend', 'hkanno_path', 'hkanno_wrapper')}
+        self.log(f"Scratch folder: {self.handle_file_path(self.scratch_dir)}", debug=True)
+        if not self.backend.cacheable:
+            # Stand-in output must never reach the caches real runs read from
+            self.result_cache = None
+            self.annotation_index = None
+        self.memory_checkpoint("run planned")
+        
+        self.update_progress(0, f"Processing {total_files} files...")
+        
+        # Log file counts and patch detection
+        self.log(f"📄 Found {summary['hkx_count']} HKX files to process")
+        self.log(f"📄 Found {summary['txt_count']} TXT files to copy")
+        self.log(f"📄 Found {summary['json_count']} JSON files to copy")
+        
+        # Log patch detection results
+        for name, count in patched_folders.items():
+            self.log(f"🛡️ {name} patches detected in {count} folder(s)")
+        if not patched_folders:
+            self.log("ℹ️ No SCAR or CPR patches detected")
+        
+        start_time = time.time()
+        
+        # Initialize log files with header; the JSON-lines log sits next to the text log
+        run_log = RunLogWriter(os.path.join(self.workspace, "log.txt"), os.path.join(self.workspace, "log.jsonl"))
+        run_log.write(f"=== HKXShift Processing Log for {base} ===")
+        run_log.write(f"Started: {time.strftime('%Y-%m-%d %H:%M:%S')}")
+        run_log.write(f"Tool: HKXShift - Skyrim Animation Speed Adjuster v{TOOL_VERSION} by Hoverstein\n",
+                      dict(level="info", message="run started", source=source, multiplier=scale, tool_version=TOOL_VERSION))
+        
+        # Set current log for logging function
+        self.run_log = run_log
+        if extreme_multiplier(scale):
+            # The GUI asks before starting; runs from the CLI or the job server only get this warning
+            self.log(f"⚠️ Speed multiplier {scale} is outside the recommended range, hit registration may be inaccurate")
+        
+        self.cpu_end('prepare')
+        self.cpu_begin('process')
+        for folder in folders:
+            if not self.processing:
+                break
+            self.process_folder(source_tree, folder, listing[folder], base, scale, multiplier_str)
+            self.memory_checkpoint(f"folder {os.path.basename(folder) or base}")
+        
+        # Pass-through copies may still be running on the I/O pool
+        copy_errors = self.copies.finish() if self.processing else self.copies.cancel()
+        for error in copy_errors:
+            summary['failed'] += 1
+            self.log(f"⚠️ Unexpected error while copying: {error}")
+        self.cpu_end('process')
+        self.cpu_begin('finish')
+        
+        # The run is only complete once the backup that ran alongside it is
+        backup_errors = []
+        if self.backup:
+            backup_errors = self.finish_backup(self.backup)
+            summary['backed_up'] = self.backup.count
+            summary['backup_duration'] = self.backup.finished - self.backup.started
+        
+        # Write summary to log file
+        duration = time.time() - start_time
+        run_log.write(f"\nCompleted: {time.strftime('%Y-%m-%d %H:%M:%S')}",
+                      dict(level="info", message="run finished", duration=round(duration, 3), cancelled=not self.processing))
+        run_log.write("=== End of Log ===")
+        
+        # Flush and close the run log
+        self.run_log = None
+        run_log.close()
+        
+        # Store stage timings for future predictions
+        if stats_db and self.stage_timings:
+            try:
+                stats_db.record_run(start_time, stats_root, scale, len(self.file_info), duration, self.stage_timings)
+            except sqlite3.Error as e:
+                self.log(f"⚠️ Could not save run statistics: {str(e)}", debug=True)
+        
+        # Finish compressing before temporary files are removed
+        if self.archive_writer:
+            self.log("Finalizing merged archive...")
+            archive_errors = self.archive_writer.close(publish=False)
+            for arcname, error in archive_errors:
+                summary['failed'] += 1
+                self.log(f"⚠️ Error adding {arcname} to archive: {error}")
+            self.log(f"🗜️ Archived {self.archive_writer.count} files", debug=True)
+        
+        # Integrity record of everything this run produced
+        if self.archive_writer:
+            output_files, hash_errors = self.archive_writer.entries, []
+        else:
+            output_files, hash_errors = self.output_manifest.finish()
+        for file, error in hash_errors:
+            self.log(f"⚠️ Could not hash {file}: {error}", debug=True)
+        output_path = archive_path if self.archive_writer else os.path.join(results_dir, f"{base}-merged")
+        try:
+            write_output_manifest(os.path.join(self.workspace, "manifest.json"), source_tree.path, scale, output_path,
+                                  output_files, archive=bool(self.archive_writer), complete=self.processing and not hash_errors)
+        except OSError as e:
+            self.log(f"⚠️ Could not write output manifest: {str(e)}")
+        
+        # Cancelled runs leave the previous output in place
+        if self.processing:
+            try:
+                self.publish_run(results_dir, base, output_path)
+                if self.archive_writer:
+                    self.log(f"🗜️ Archived {self.archive_writer.count} files into {self.handle_file_path(archive_path)}")
+                self.log(f"🔏 Output manifest with {len(output_files)} files written to "
+                         f"{self.handle_file_path(os.path.join(results_dir, f'{base}_manifest.json'))}")
+            except OSError as e:
+                output_path = self.archive_writer.part_path if self.archive_writer else self.merged_root
+                self.log(f"⚠️ Could not publish the output ({str(e)}), it was left in {self.handle_file_path(output_path)}")
+        else:
+            self.publish_run(results_dir, base, output_path, publish_output=False)
+            self.log("⚠️ Run cancelled: the merged output was not published, earlier output is unchanged")
+        
+        source_tree.close()
+        
+        # Keep the result cache within its size limit
+        if self.result_cache:
+            try:
+                self.result_cache.unpin(self.run_id)
+                evicted = self.result_cache.evict()
+                if evicted:
+                    self.log(f"♻️ Evicted {evicted} old entries from the result cache", debug=True)
+            except (OSError, sqlite3.Error) as e:
+                self.log(f"⚠️ Could not trim the result cache: {str(e)}", debug=True)
+        
+        # Show summary
+        self.log("")
+        self.log("=== PROCESSING COMPLETE ===")
+        self.log(f"✅ Files Processed: {summary['dumped']}")
+        self.log(f"✅ Files Scaled: {summary['scaled']}")
+        self.log(f"✅ Files Merged: {summary['merged']}")
+        if summary['failed'] > 0:
+            self.log(f"⚠️ Files Failed: {summary['failed']}")
+        
+        self.log(f"📄 HKX Files Found: {summary['hkx_count']}")
+        self.log(f"📄 TXT Files Found: {summary['txt_count']}")
+        self.log(f"📄 JSON Files Found: {summary['json_count']}")
+        self.log(f"📄 Files Backed Up: {summary['backed_up']}")
+        if 'backup_duration' in summary:
+            self.log(f"💾 Backup Time: {summary['backup_duration']:.2f} seconds (alongside processing)")
+        
+        # Show patch preservation summary
+        for name, count in summary['preserved_files'].items():
+            self.log(f"🛡️ {name} Files Preserved: {count}")
+        for name, count in summary['preserved_lines'].items():
+            self.log(f"🛡️ {name} Annotations Preserved: {count}")
+        if summary['skipped_files'] > 0:
+            self.log(f"🚫 Files Left Out By Rules: {summary['skipped_files']}")
+        if summary['skipped_lines'] > 0:
+            self.log(f"🚫 Annotation Lines Dropped By Rules: {summary['skipped_lines']}")
+        if summary['annotation_cache_hits'] > 0:
+            self.log(f"♻️ Cached Annotation Dumps Reused: {summary['annotation_cache_hits']}")
+        if summary['deduplicated'] > 0:
+            self.log(f"🔗 Identical Files Reused: {summary['deduplicated']}")
+        if summary['binary_patched'] > 0:
+            self.log(f"⚡ Files Patched In Place: {summary['binary_patched']}")
+        if summary['unchanged'] > 0:
+            self.log(f"📋 Files Copied Unchanged (no annotations to rescale): {summary['unchanged']}")
+        if summary['cache_lookups'] > 0:
+            hit_rate = summary['cached'] / summary['cache_lookups'] * 100
+            self.log(f"♻️ Result Cache Hits: {summary['cached']}/{summary['cache_lookups']} ({hit_rate:.0f}%)")
+        
+        self.log(f"⏱️ Time Elapsed: {duration:.2f} seconds")
+        
+        # Scratch files were deleted as each file finished; drop the emptied workspaces in the background
+        if options['delete_temp']:
+            self.resources.cleaner.discard(os.path.join(self.scratch_workspace, "converted"),
+                                           os.path.join(self.scratch_workspace, "rescaled"))
+            if self.scratch_workspace != self.workspace:
+                self.resources.cleaner.discard(self.scratch_workspace)
+        else:
+            self.log(f"Temporary files kept in {self.handle_file_path(self.scratch_workspace)}")
+        # Unless publishing failed, the run workspace is empty now (or only holds kept temporary files)
+        left_in_workspace = os.path.abspath(output_path).startswith(os.path.abspath(self.workspace) + os.sep)
+        if not left_in_workspace and (options['delete_temp'] or self.scratch_workspace != self.workspace):
+            self.resources.cleaner.discard(self.workspace)
+        
+        if self.cpu_profiler:
+            self.cpu_end('finish')
+            self.cpu_profiler.stop()
+            try:
+                paths = self.cpu_profiler.write(os.path.join(results_dir, f"{base}_cpu"))
+                self.log(f"🔥 CPU profile written to {', '.join(self.handle_file_path(p) for p in paths)}")
+            except OSError as e:
+                self.log(f"⚠️ Could not write CPU profile: {str(e)}")
+        
+        if self.memory_profiler:
+            self.memory_checkpoint("finished")
+            memory_report = os.path.join(results_dir, f"{base}_memory.txt")
+            try:
+                self.memory_profiler.write_report(memory_report, base)
+                self.log(f"🧠 Memory report written to {self.handle_file_path(memory_report)}")
+            except OSError as e:
+                self.log(f"⚠️ Could not write memory report: {str(e)}")
+        
+        summary['duration'] = duration
+        summary['cancelled'] = not self.processing
+        summary['output_path'] = os.path.abspath(output_path)
+        summary['run_id'] = self.run_id
+        if backup_errors and not summary['cancelled']:
+            raise ShiftError(f"Backup incomplete: {len(backup_errors)} files could not be copied to {self.backup.backup_dir}.\n\n"
+                             f"The merged output was written, but the source has no complete backup "
+                             f"(a previous backup there was kept).")
+        return summary
+
+    def process_folder(self, source_tree, folder, folder_files, base, scale, multiplier_str):
+        """Triage one moveset folder and run its HKX files through the worker pool"""
+        subname = os.path.basename(folder) or base
+        self.log("")
+        self.log(f"--- Processing: {subname} ---")
+        
+        # Detect patches for this folder
+        patches = self.detect_patches(folder_files, source_tree, folder)
+        
+        # Log patch detection details - always to log file
+        self.log(f"Moveset: {subname}", debug=True)
+        self.log(f"Source path: {source_tree.display_path(folder)}", debug=True)
+        self.log(f"Speed multiplier: {multiplier_str.replace('.', ',')}", debug=True)
+        
+        if patches:
+            self.log("Detected patches:", debug=True)
+            for name, files in patches.items():
+                self.log(f"  {name}-patched: {', '.join(files)}", debug=True)
+        
+        # Count files for debug info - always to log file
+        hkx_files_for_debug = [f for f in folder_files if is_hkx_file(f)]
+        patch_file_count = sum(len(files) for files in patches.values())
+        processable_count = len(hkx_files_for_debug) - patch_file_count
+        txt_json_count = len([f for f in folder_files if is_txt_or_json_file(f)])
+        
+        self.log("File analysis:", debug=True)
+        self.log(f"  Total HKX files: {len(hkx_files_for_debug)}", debug=True)
+        self.log(f"  Processable HKX files: {processable_count}", debug=True)
+        self.log(f"  Patch files matched by rules: {patch_file_count}", debug=True)
+        self.log(f"  Support files (TXT/JSON): {txt_json_count}", debug=True)
+        
+        # Log patch detection for this folder (non-debug)
+        if not self.debug_mode:
+            for name, files in patches.items():
+                self.log(f"🛡️ {name} patch detected - Files: {', '.join(files)}")
+        
+        converted = os.path.join(self.scratch_workspace, "converted", subname)
+        rescaled = os.path.join(self.scratch_workspace, "rescaled", subname)
+        merged = os.path.join(self.merged_root, subname)
+        
+        # Log path debug info
+        self.log(f"Converted dir: {self.handle_file_path(converted)}", debug=True)
+        self.log(f"Rescaled dir: {self.handle_file_path(rescaled)}", debug=True)
+        self.log(f"Merged dir: {self.handle_file_path(merged)}", debug=True)
+        
+        os.makedirs(converted, exist_ok=True)
+        os.makedirs(rescaled, exist_ok=True)
+        if not self.archive_writer:
+            os.makedirs(merged, exist_ok=True)
+        
+        # Get all HKX files (case-insensitive)
+        hkx_files = [f for f in folder_files if is_hkx_file(f)]
+        
+        # Filter out SCAR, CPR and other rule-matched files
+        processable_files = []
+        for file in hkx_files:
+            rule = self.rules.match_file(file)
+            if rule and rule['action'] == 'preserve':
+                self.log(f"  ⏭️ Skipping {rule['name']} file: {file}")
+                self.count_rule('preserved_files', rule['name'])
+                # Copy patch file to merged folder without processing
+                self.copies.add(functools.partial(self.copy_preserved, merged, subname, folder, file, rule['name'], source_tree),
+                                self.file_size(folder, file))
+            elif rule:
+                self.log(f"  🚫 Leaving out {file} ({rule['name']} rule)")
+                self.count('skipped_files')
+            elif (folder, file) in self.cached_results:
+                self.copies.add(functools.partial(self.place_cached_result, folder, subname, merged, file),
+                                self.file_size(folder, file))
+            elif (folder, file) in self.unchanged_files:
+                self.copies.add(functools.partial(self.pass_through, folder, subname, merged, file,
+                                                  self.unchanged_files[(folder, file)], source_tree=source_tree),
+                                self.file_size(folder, file))
+            elif (folder, file) in self.duplicate_of:
+                primary_folder, primary_file = self.duplicate_of[(folder, file)]
+                self.log(f"  {file} is identical to {os.path.basename(primary_folder) or base}/{primary_file}", debug=True)
+            else:
+                processable_files.append(file)
+        
+        # Get all TXT and JSON files to copy
+        txt_json_files = [f for f in folder_files if is_txt_or_json_file(f)]
+        
+        # Copy TXT and JSON files to merged output folder
+        for file in txt_json_files:
+            self.copies.add(functools.partial(self.copy_support_file, merged, subname, folder, file, source_tree))
+        self.copies.flush()
+        
+        if not processable_files:
+            return
+        
+        # Each file is dumped, rescaled and merged as one task on the shared worker pool
+        self.log(f"=== Processing {len(processable_files)} files with {self.parallelism()} hkanno workers ({self.concurrency.mode}) ===", debug=True)
+        
+        # Start the files expected to take longest first
+        processable_files.sort(key=lambda f: sum(self.file_costs[(folder, f)].values()), reverse=True)
+        
+        job = FolderJob(source_tree, folder, subname, processable_files, converted, rescaled, merged, scale)
+        if self.coordinator:
+            self.process_remote(job)
+            return
+        
+        futures = {self.resources.pool.submit(self.process_hkx, job, idx, file): file
+                   for idx, file in enumerate(processable_files, 1)}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                file = futures[future]
+                self.write_log_record(f"[ERROR] {file}: {str(e)}", file=file, error=str(e))
+                self.count('failed')
+                self.log(f"  ⚠️ Unexpected error while processing {file}: {str(e)}")
+
+    def process_hkx(self, job, idx, file):
+        """Dump, rescale and merge one HKX file (runs on the shared worker pool)"""
+        if not self.processing:
+            return
+        
+        costs = self.file_costs[(job.folder, file)]
+        with self.cpu_phase('patch'):
+            patched = self.binary_patch and self.patch_file(job, idx, file)
+        if patched:
+            self.advance(cost=sum(costs.values()))
+            if self.delete_temp:
+                self.discard_scratch(job, file)
+            return
+        
+        ok = True
+        finished = False
+        for stage, step in (('dump', self.dump_file), ('rescale', self.rescale_file), ('merge', self.merge_file)):
+            if ok and not finished and self.processing:
+                with self.cpu_phase(stage):
+                    ok = step(job, idx, file)
+                # Nothing to rescale: the dumped copy already is the result
+                preserved = self.dumped_unchanged(job, file) if ok and stage == 'dump' else None
+                if preserved is not None:
+                    ok = self.pass_through(job.folder, job.subname, job.merged, file, preserved,
+                                           hkx=os.path.join(job.converted, file, file), dumped=True)
+                    finished = True
+            # Skipped stages count as done so overall progress stays accurate
+            self.advance(cost=costs[stage])
+        
+        if self.delete_temp:
+            self.discard_scratch(job, file)
+        if not ok:
+            self.fail_duplicates(job, file)
+
+    def fail_duplicates(self, job, file):
+        """Count the identical copies of a failed file as failed too"""
+        duplicates = self.duplicates.get((job.folder, file), [])
+        if duplicates and self.processing:
+            self.count('failed', len(duplicates))
+            self.log(f"  ⚠️ {len(duplicates)} identical copies of {file} were not written")
+
+    def process_remote(self, job):
+        """Hand a folder's HKX files to the coordinator's workers and publish what they send back"""
+        futures = {}
+        for idx, file in enumerate(job.files, 1):
+            key, size = self.file_info[(job.folder, file)]
+            payload = {'file': file, 'subname': job.subname, 'index': idx, 'total': job.total, 'scale': job.scale,
+                       'size': size, 'stats_key': key, 'rules': self.rules.rules, 'binary_patch': self.binary_patch,
+                       'debug': self.debug_mode, **self.backend_options}
+            futures[self.coordinator.submit(job, idx, file, payload)] = file
+        
+        pending = set(futures)
+        while pending and self.processing:
+            done, pending = wait(pending, timeout=1.0, return_when=FIRST_COMPLETED)
+            for future in done:
+                file = futures[future]
+                try:
+                    task, result = future.result()
+                    self.finish_remote(job, task, result)
+                except Exception as e:
+                    self.write_log_record(f"[ERROR] {file}: {str(e)}", file=file, error=str(e))
+                    self.count('failed')
+                    self.log(f"  ⚠️ Error while processing {file}: {str(e)}")
+                    self.fail_duplicates(job, file)
+        
+        # Cancelled: files nobody picked up yet are dropped from the queue
+        for future in pending:
+            future.cancel()
+
+    def finish_remote(self, job, task, result):
+        """Publish a file merged by a remote worker exactly like a locally merged one"""
+        file = task.file
+        worker = result['worker']
+        if self.on_log:
+            for formatted_message, message, debug in result['console']:
+                self.on_log(formatted_message, message, debug)
+        run_log = self.run_log
+        if run_log:
+            for text, record in result['records']:
+                run_log.write(text, dict(record, worker=worker) if record else None)
+        with self.lock:
+            self.stage_timings.extend(tuple(timing) for timing in result['timings'])
+        for key, value in result['summary'].items():
+            if isinstance(value, dict):
+                for name, amount in value.items():
+                    self.count_rule(key, name, amount)
+            elif value:
+                self.count(key, value)
+        
+        ok = result['ok'] and task.output is not None
+        if ok:
+            try:
+                self.check_remote_output(job, file, task.output)
+                self.publish_output(job.merged, job.subname, file, path=task.output)
+                self.store_result(job.folder, file, task.output)
+                self.fan_out(job.folder, job.subname, file, task.output if self.archive_writer else os.path.join(job.merged, file))
+            except Exception as e:
+                self.write_log_record(f"[ERROR - MERGE] {file}: {str(e)}", stage='merge', file=file, error=str(e))
+                self.count('merged', -1)
+                self.count('failed')
+                self.log(f"  ⚠️ Error writing {file}: {str(e)}")
+                ok = False
+        
+        self.advance(f"Received {file} from {worker}...", cost=sum(self.file_costs[(job.folder, file)].values()))
+        if self.delete_temp:
+            self.discard_scratch(job, file)
+        if not ok:
+            self.fail_duplicates(job, file)
+
+    def check_remote_output(self, job, file, path):
+        """Reject an uploaded file that does not start with the same HKX header as its source"""
+        with job.source_tree.open(os.path.join(job.folder, file)) as stream:
+            expected = stream.read(8)
+        with open(path, "rb") as f:
+            header = f.read(len(expected))
+        if header != expected:
+            raise ShiftError(f"The file sent back by the worker is not an HKX file like {file}")
+
+    def run_task(self, task, source_dir, work_dir):
+        """Worker side of a coordinated run: process one file handed out by a WorkCoordinator.
+        
+        Returns the merged HKX path (None if the file failed) and the summary
+        counters, stage timings and log records to send back to the coordinator.
+        """
+        file = task['file']
+        self.debug_mode = task['debug']
+        self.rules = PreservationRules(task['rules'])
+        self.binary_patch = task['binary_patch']
+        self.delete_temp = False
+        self.summary = new_summary()
+        self.file_info = {('', file): (task['stats_key'], task['size'])}
+        self.file_costs = {('', file): dict(DEFAULT_STAGE_COSTS)}
+        self.stage_timings = []
+        self.started = time.time()
+        collector = RecordCollector()
+        self.run_log = collector
+        
+        merged = os.path.join(work_dir, "merged")
+        os.makedirs(merged, exist_ok=True)
+        job = FolderJob(FolderSource(source_dir), '', task['subname'], [file], os.path.join(work_dir, "converted"),
+                        os.path.join(work_dir, "rescaled"), merged, task['scale'])
+        job.total = task['total']
+        options = dict(DEFAULT_OPTIONS, backend=task['backend'], hkanno_path=task['hkanno_path'],
+                       hkanno_wrapper=task['hkanno_wrapper'])
+        self.select_backend(options, job.source_tree, announce=False)
+        self.processing = True
+        try:
+            self.process_hkx(job, task['index'], file)
+        finally:
+            self.processing = False
+            self.run_log = None
+        
+        output = os.path.join(merged, file)
+        result = {'summary': self.summary, 'timings': self.stage_timings, 'records': collector.records}
+        return (output if os.path.isfile(output) else None), result
+
+    def patch_file(self, job, idx, file):
+        """Fast path: copy the HKX and scale its annotation times in place, without hkanno.
+
+        Returns False (after cleaning up) when the file has to go through dump/rescale/merge.
+        """
+        self.advance(f"Patching {file}...")
+        out_dir = os.path.join(job.rescaled, file)
+        hkx = os.path.join(out_dir, file)
+        patched = False
+        try:
+            os.makedirs(out_dir, exist_ok=True)
+            with self.slot('io'):
+                job.source_tree.copy_file(os.path.join(job.folder, file), hkx)
+            self.count_copy(hkx)
+            preserved = patch_annotation_times(hkx, job.scale, self.rules)
+            patched = True
+        except (HkxPatchError, OSError, struct.error) as e:
+            self.log(f"Binary patch not possible for {file} ({str(e)}), using hkanno", debug=True)
+            return False
+        finally:
+            # The hkanno path starts over from the source, never from a partial copy
+            if not patched and os.path.exists(hkx):
+                os.remove(hkx)
+        
+        try:
+            self.publish_output(job.merged, job.subname, file, path=hkx)
+        except Exception as e:
+            self.write_log_record(f"[ERROR - PATCH] {file}: {str(e)}", stage='patch', file=file, error=str(e))
+            self.count('failed')
+            self.log(f"  ⚠️ Error writing {file}: {str(e)}")
+            return True
+        for name, count in preserved.items():
+            self.log(f"⚔️ Preserved {count} {name} annotation lines in {file}", debug=True)
+            self.count_rule('preserved_lines', name, count)
+        for key in ('dumped', 'scaled', 'merged', 'binary_patched'):
+            self.count(key)
+        self.log(f"  ⚡ Patched {file} in place ({idx}/{job.total})")
+        self.store_result(job.folder, file, hkx)
+        self.fan_out(job.folder, job.subname, file, hkx if self.archive_writer else os.path.join(job.merged, file))
+        return True
+
+    def discard_scratch(self, job, file):
+        """Delete a file's intermediate folders once its output no longer needs them"""
+        paths = [os.path.join(job.converted, file), os.path.join(job.rescaled, file)]
+        if self.archive_writer:
+            # The archive still reads the merged HKX from the rescaled folder
+            self.archive_writer.when_written(lambda: self.resources.cleaner.discard(*paths))
+        else:
+            self.resources.cleaner.discard(*paths)
+
+    def dump_file(self, job, idx, file):
+        """Step 1: copy the HKX into the converted folder and dump its annotations"""
+        started = time.perf_counter()
+        self.advance(f"Dumping {file}...")
+        self.log(f"  Dumping {file} ({idx}/{job.total})")
+        
+        try:
+            src = os.path.join(job.folder, file)
+            dest_dir = os.path.join(job.converted, file)
+            os.makedirs(dest_dir, exist_ok=True)
+            dest_hkx = os.path.join(dest_dir, file)
+            
+            # Log file paths for debugging - always to log file
+            self.log(f"Source file: {self.handle_file_path(job.source_tree.display_path(src))}", debug=True)
+            self.log(f"Destination HKX: {self.handle_file_path(dest_hkx)}", debug=True)
+            
+            with self.slot('io'):
+                job.source_tree.copy_file(src, dest_hkx)
+            self.count_copy(dest_hkx)
+            
+            # Changed filename from anno.txt to [filename].txt
+            base_filename = os.path.splitext(file)[0]
+            out_anno_file = os.path.join(dest_dir, f"{base_filename}.txt")
+            
+            # Reuse the dump from an earlier job when the source file is unchanged
+            cache_key = (self.backend.name, job.source_tree.identity(src))
+            content = self.resources.annotation_cache.get(cache_key) if self.backend.cacheable else None
+            if content is not None:
+                with open(out_anno_file, "w", encoding="utf-8") as anno_file:
+                    anno_file.write(content)
+                self.count('annotation_cache_hits')
+                error = None
+            else:
+                error = self.annotations('dump', dest_hkx, out_anno_file)
+            
+            if error:
+                self.write_log_record(f"[ERROR - DUMP] {file}: {error}", stage='dump', file=file, error=error)
+                self.count('failed')
+                self.log(f"  ⚠️ Error dumping {file}: {error}", debug=True)
+                return False
+            
+            # Don't write full command output to log anymore, just success
+            self.count('dumped')
+            if content is None:
+                self.record_stage(job, file, 'dump', started)
+            self.log(f"Successfully dumped {file} -> {base_filename}.txt", debug=True)
+            
+            # Check for SCAR annotations during dump - always to log file
+            try:
+                if content is None:
+                    with open(out_anno_file, "r", encoding="utf-8") as anno_file:
+                        content = anno_file.read()
+                    if self.backend.cacheable:
+                        self.resources.annotation_cache.put(cache_key, content)
+                rule = self.rules.match_line(content)
+                if rule:
+                    self.log(f"⚔️ {rule['name']} annotations detected in {file}", debug=True)
+            except:
+                pass
+            
+            # Keep the annotation index up to date with every dump
+            if self.annotation_index and content is not None:
+                self.index_annotations(job, file, content)
+            return True
+        
+        except Exception as e:
+            error_msg = str(e)
+            self.write_log_record(f"[ERROR - DUMP] {file}: {error_msg}", stage='dump', file=file, error=error_msg)
+            self.count('failed')
+            self.log(f"  ⚠️ Exception while dumping {file}: {error_msg}")
+            return False
+
+    def rescale_file(self, job, idx, sub):
+        """Step 2: rescale the dumped annotation times"""
+        started = time.perf_counter()
+        self.advance(f"Rescaling {sub}...")
+        self.log(f"  Rescaling {sub} ({idx}/{job.total})")
+        
+        in_path = os.path.join(job.converted, sub)
+        out_path = os.path.join(job.rescaled, sub)
+        base_filename = os.path.splitext(sub)[0]
+        anno_in = os.path.join(in_path, f"{base_filename}.txt")
+        anno_out = os.path.join(out_path, f"{base_filename}.txt")
+        hkx_file = os.path.join(in_path, sub)
+        hkx_copy = os.path.join(out_path, sub)
+        
+        # Log paths for debugging - always to log file
+        self.log(f"Anno in: {self.handle_file_path(anno_in)}", debug=True)
+        self.log(f"Anno out: {self.handle_file_path(anno_out)}", debug=True)
+        
+        if not os.path.isfile(anno_in):
+            return False
+        
+        os.makedirs(out_path, exist_ok=True)
+        try:
+            with self.slot('io'):
+                fast_copy(hkx_file, hkx_copy)
+            self.count_copy(hkx_copy)
+        except Exception as e:
+            error_msg = str(e)
+            self.write_log_record(f"[ERROR - COPY] {hkx_file}: {error_msg}", stage='copy', file=hkx_file, error=error_msg)
+            self.count('failed')
+            self.log(f"  ⚠️ Error copying HKX file: {error_msg}")
+            return False
+        
+        try:
+            with open(anno_in, "r", encoding="utf-8") as file:
+                modified_lines, preserved_lines, skipped_lines, changed = rescale_annotations(file, job.scale, self.rules.match_line)
+            
+            with open(anno_out, "w", encoding="utf-8") as file:
+                file.writelines(modified_lines)
+            self.count('scaled')
+            
+            for name, count in preserved_lines.items():
+                self.log(f"⚔️ Preserved {count} {name} annotation lines in {sub}", debug=True)
+                self.count_rule('preserved_lines', name, count)
+            if skipped_lines:
+                self.log(f"Dropped {skipped_lines} annotation lines in {sub}", debug=True)
+                self.count('skipped_lines', skipped_lines)
+            
+            self.log(f"Successfully rescaled {sub} -> {base_filename}.txt", debug=True)
+            self.record_stage(job, sub, 'rescale', started)
+            return True
+        
+        except Exception as e:
+            error_msg = str(e)
+            self.write_log_record(f"[ERROR - SCALE] {anno_in}: {error_msg}", stage='scale', file=anno_in, error=error_msg)
+            self.count('failed')
+            self.log(f"  ⚠️ Error scaling {sub}: {error_msg}")
+            return False
+
+    def merge_file(self, job, idx, sub):
+        """Step 3: merge the rescaled annotations back into the HKX file"""
+        started = time.perf_counter()
+        self.advance(f"Merging {sub}...")
+        self.log(f"  Merging {sub} ({idx}/{job.total})")
+        
+        path = os.path.join(job.rescaled, sub)
+        base_filename = os.path.splitext(sub)[0]
+        anno = os.path.join(path, f"{base_filename}.txt")
+        hkx = os.path.join(path, sub)
+        merged_hkx = os.path.join(job.merged, sub)
+        
+        # Log paths for debugging - always to log file
+        self.log(f"Anno path: {self.handle_file_path(anno)}", debug=True)
+        self.log(f"HKX path: {self.handle_file_path(hkx)}", debug=True)
+        self.log(f"Output path: {self.handle_file_path(merged_hkx)}", debug=True)
+        
+        if not (os.path.isfile(anno) and os.path.isfile(hkx)):
+            return False
+        
+        try:
+            # Write the rescaled annotations back with the selected backend
+            error = self.annotations('update', hkx, anno,
+                                     rescale=lambda lines: rescale_annotations(lines, job.scale, self.rules.match_line)[0])
+            
+            if error:
+                self.write_log_record(f"[ERROR - MERGE] {sub}: {error}", stage='merge', file=sub, error=error)
+                self.count('failed')
+                self.log(f"  ⚠️ Error merging {sub}: {error}")
+                return False
+            else:
+                # Don't write full command output to log anymore, just success
+                self.publish_output(job.merged, job.subname, sub, path=hkx)
+                self.count('merged')
+                self.store_result(job.folder, sub, hkx)
+                self.fan_out(job.folder, job.subname, sub, hkx if self.archive_writer else merged_hkx)
+                self.log(f"Successfully merged {sub} using {base_filename}.txt", debug=True)
+                self.record_stage(job, sub, 'merge', started)
+                return True
+        
+        except Exception as e:
+            error_msg = str(e)
+            self.write_log_record(f"[ERROR - MERGE] {sub}: {error_msg}", stage='merge', file=sub, error=error_msg)
+            self.count('failed')
+            self.log(f"  ⚠️ Exception while merging {sub}: {error_msg}")
+            return False
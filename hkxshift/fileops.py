@@ -0,0 +1,394 @@
+"""File copies, locks, merged-output archives and scratch folders"""
+import os
+import sys
+import shutil
+import threading
+import queue
+import time
+import zipfile
+try:
+    import fcntl  # Used for reflink copies where the filesystem supports them
+except ImportError:
+    fcntl = None
+try:
+    import msvcrt  # File locks between runs on Windows (fcntl.flock elsewhere)
+except ImportError:
+    msvcrt = None
+import hashlib
+import errno
+from concurrent.futures import CancelledError
+
+def copy_hashing(src, dst, chunk_size=1024 * 1024):
+    """Copy between open binary streams and return (size, sha256) of what was copied"""
+    digest = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = src.read(chunk_size)
+        if not chunk:
+            break
+        digest.update(chunk)
+        dst.write(chunk)
+        size += len(chunk)
+    return size, digest.hexdigest()
+
+def copy_and_hash(src, dest):
+    """Copy a file keeping its timestamps and return its manifest entry, reading it only once"""
+    with open(src, "rb") as src_file, open(dest, "wb") as dest_file:
+        _, sha256 = copy_hashing(src_file, dest_file)
+    shutil.copystat(src, dest)
+    stat = os.stat(dest)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha256}
+
+# ioprio_set syscall numbers (the call has no libc wrapper)
+IOPRIO_SET_SYSCALLS = {'x86_64': 251, 'amd64': 251, 'aarch64': 30, 'arm64': 30, 'i386': 289, 'i686': 289}
+
+def lower_io_priority():
+    """Put the calling thread in the idle I/O class (Linux) or background mode (Windows). Best effort."""
+    try:
+        import ctypes
+        if sys.platform == "win32":
+            # THREAD_MODE_BACKGROUND_BEGIN lowers the thread's I/O and memory priority
+            kernel32 = ctypes.windll.kernel32
+            kernel32.SetThreadPriority(kernel32.GetCurrentThread(), 0x00010000)
+        elif sys.platform.startswith("linux"):
+            import platform
+            syscall = IOPRIO_SET_SYSCALLS.get(platform.machine().lower())
+            if syscall:
+                # ioprio_set(IOPRIO_WHO_PROCESS, 0 = this thread, IOPRIO_CLASS_IDLE)
+                ctypes.CDLL(None, use_errno=True).syscall(syscall, 1, 0, 3 << 13)
+    except (ImportError, OSError, AttributeError):
+        pass
+
+FICLONE = 0x40049409  # Linux ioctl for reflink (copy-on-write) clones
+
+# Errors that mean a copy method does not work between two filesystems, rather than that the copy failed
+UNSUPPORTED_COPY_ERRNOS = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTTY}
+
+# (method, source device, destination device) combinations found not to support a copy method
+UNSUPPORTED_COPIES = set()
+
+def kernel_copy(method, src_file, dest_file, size):
+    """Copy size bytes between open files with a kernel-side method; False if the method is unsupported here"""
+    copied = 0
+    try:
+        if method == 'reflink':
+            if fcntl is None:
+                return False
+            fcntl.ioctl(dest_file.fileno(), FICLONE, src_file.fileno())
+            return True
+        if not sys.platform.startswith("linux") or not hasattr(os, method):
+            return False
+        while copied < size:
+            if method == 'copy_file_range':
+                sent = os.copy_file_range(src_file.fileno(), dest_file.fileno(), size - copied, copied, copied)
+            else:
+                sent = os.sendfile(dest_file.fileno(), src_file.fileno(), copied, size - copied)
+            if not sent:
+                break
+            copied += sent
+        if copied != size:
+            # The kernel stopped early (the file changed size under us): finish in userspace
+            src_file.seek(copied)
+            dest_file.seek(copied)
+            dest_file.truncate()
+            shutil.copyfileobj(src_file, dest_file, 1024 * 1024)
+        return True
+    except OSError as e:
+        if copied or e.errno not in UNSUPPORTED_COPY_ERRNOS:
+            raise
+        return False
+
+def fast_copy(src, dest, clone_only=False):
+    """Copy src to dest keeping its timestamps, with the data staying in the kernel where the OS allows.
+
+    Tries a reflink clone, then copy_file_range and sendfile (Linux), or
+    CopyFileW (Windows, which clones on ReFS and Dev Drives itself), before a
+    buffered copy. Methods a pair of filesystems does not support are skipped
+    from then on. With clone_only, raises OSError instead of copying the data.
+    Returns the method used.
+    """
+    if sys.platform == "win32":
+        if clone_only:
+            raise OSError("reflinks are not supported on this platform")
+        import ctypes
+        if ctypes.windll.kernel32.CopyFileW(str(src), str(dest), False):
+            return "copyfile"
+        shutil.copy2(src, dest)
+        return "copy"
+
+    devices = (os.stat(src).st_dev, os.stat(os.path.dirname(os.path.abspath(dest))).st_dev)
+    methods = [m for m in ('reflink', 'copy_file_range', 'sendfile') if (m,) + devices not in UNSUPPORTED_COPIES]
+    if clone_only:
+        methods = methods[:1] if methods[:1] == ['reflink'] else []
+        if not methods:
+            raise OSError("reflinks are not supported on this filesystem")
+    method = None
+    try:
+        with open(src, "rb") as src_file, open(dest, "wb") as dest_file:
+            size = os.fstat(src_file.fileno()).st_size
+            for candidate in methods:
+                if kernel_copy(candidate, src_file, dest_file, size):
+                    method = candidate
+                    break
+                UNSUPPORTED_COPIES.add((candidate,) + devices)
+            if method is None and clone_only:
+                raise OSError("reflinks are not supported on this filesystem")
+            if method is None:
+                src_file.seek(0)
+                dest_file.seek(0)
+                dest_file.truncate()
+                shutil.copyfileobj(src_file, dest_file, 1024 * 1024)
+                method = "copy"
+    except OSError:
+        if os.path.exists(dest):
+            os.remove(dest)
+        raise
+    shutil.copystat(src, dest)
+    return method
+
+def link_or_copy(src, dest, hardlink=True):
+    """Reflink or hardlink src to dest where the filesystem allows it, otherwise copy.
+
+    Returns the method used. Hardlinks share the file with src, so callers must
+    never write into dest in place afterwards.
+    """
+    if os.path.lexists(dest):
+        os.remove(dest)
+    if hardlink:
+        try:
+            return fast_copy(src, dest, clone_only=True)
+        except OSError:
+            pass
+        try:
+            os.link(src, dest)
+            return "link"
+        except OSError:
+            pass
+    return fast_copy(src, dest)
+
+class CopyBatcher:
+    """Pass-through copies run in batches on the I/O pool, alongside the hkanno work.
+
+    Each task is a callable that reports its own errors. Tasks are grouped
+    until a batch holds batch_files files or batch_bytes bytes, so thousands
+    of small support files cost a handful of pool submissions.
+    """
+    def __init__(self, pool, batch_files=64, batch_bytes=16 * 1024 * 1024):
+        self.pool = pool
+        self.batch_files = batch_files
+        self.batch_bytes = batch_bytes
+        self.batch = []
+        self.batch_size = 0
+        self.futures = []
+        self.cancelled = False
+
+    def add(self, task, size=0):
+        self.batch.append(task)
+        self.batch_size += size
+        if len(self.batch) >= self.batch_files or self.batch_size >= self.batch_bytes:
+            self.flush()
+
+    def flush(self):
+        """Start the tasks queued so far"""
+        if self.batch:
+            self.futures.append(self.pool.submit(self._run, self.batch))
+            self.batch = []
+            self.batch_size = 0
+
+    def _run(self, tasks):
+        for task in tasks:
+            if self.cancelled:
+                return
+            task()
+
+    def finish(self):
+        """Wait for every batch; returns the errors tasks did not handle themselves"""
+        self.flush()
+        errors = []
+        for future in self.futures:
+            try:
+                future.result()
+            except CancelledError:
+                pass
+            except Exception as e:
+                errors.append(str(e))
+        self.futures = []
+        return errors
+
+    def cancel(self):
+        """Drop queued batches and wait for the running ones to stop"""
+        self.cancelled = True
+        self.batch = []
+        for future in self.futures:
+            future.cancel()
+        return self.finish()
+
+class MergedArchiveWriter:
+    """Streams finished output files into a zip archive on a background thread.
+
+    The archive is written to a .part file and renamed into place on close, so a
+    cancelled or crashed run never leaves a half-written archive behind.
+    """
+    def __init__(self, path, part_path=None):
+        self.path = path
+        self.part_path = part_path or path + ".part"
+        self.count = 0
+        self.errors = []
+        self.entries = {}  # arcname -> {size, sha256} of the uncompressed file
+        self.queue = queue.Queue()
+        self.archive = zipfile.ZipFile(self.part_path, "w", zipfile.ZIP_DEFLATED, allowZip64=True)
+        self.thread = threading.Thread(target=self._worker, daemon=True)
+        self.thread.start()
+
+    def add_file(self, path, arcname):
+        """Queue a file on disk for compression"""
+        self.queue.put((arcname, path, None, None))
+
+    def add_source(self, source_tree, rel, arcname):
+        """Queue a source tree member for compression without staging it on disk"""
+        self.queue.put((arcname, None, source_tree, rel))
+
+    def when_written(self, callback):
+        """Call callback once every file queued so far has been compressed"""
+        self.queue.put((None, None, None, callback))
+
+    def _worker(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            arcname, path, source_tree, rel = item
+            if arcname is None:
+                rel()
+                continue
+            try:
+                # Files are hashed while they are compressed, for the output manifest
+                if path is not None:
+                    info = zipfile.ZipInfo.from_file(path, arcname)
+                    source = open(path, "rb")
+                else:
+                    info = zipfile.ZipInfo(arcname, time.localtime()[:6])
+                    source = source_tree.open(rel)
+                info.compress_type = zipfile.ZIP_DEFLATED
+                with source as src, self.archive.open(info, "w", force_zip64=True) as dst:
+                    size, sha256 = copy_hashing(src, dst)
+                self.entries[arcname] = {'size': size, 'sha256': sha256}
+                self.count += 1
+            except Exception as e:
+                self.errors.append((arcname, str(e)))
+
+    def close(self, publish=True):
+        """Wait for queued files to be compressed and finalize the archive.
+        
+        With publish=False the finished archive stays at part_path.
+        """
+        self.queue.put(None)
+        self.thread.join()
+        self.archive.close()
+        if publish:
+            os.replace(self.part_path, self.path)
+        return self.errors
+
+class FileLock:
+    """Advisory lock on a lock file, honoured by every HKXShift run on the machine.
+    
+    Each acquire opens its own handle, so runs inside one process (job server
+    jobs) keep out of each other's way too.
+    """
+    def __init__(self, path, poll_interval=0.2):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.file = None
+
+    def _try_lock(self):
+        try:
+            if fcntl:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            elif msvcrt:
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+
+    def acquire(self, timeout=None, on_wait=None):
+        """Wait for the lock, at most timeout seconds; on_wait is called once if another run holds it"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.file = open(self.path, "a+")
+        deadline = None if timeout is None else time.monotonic() + timeout
+        waiting = False
+        while not self._try_lock():
+            if deadline is not None and time.monotonic() >= deadline:
+                self.file.close()
+                self.file = None
+                return False
+            if not waiting and on_wait:
+                on_wait()
+            waiting = True
+            time.sleep(self.poll_interval)
+        return True
+
+    def release(self):
+        if self.file is None:
+            return
+        try:
+            if fcntl:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+            elif msvcrt:
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        except OSError:
+            pass
+        self.file.close()
+        self.file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+# Every run works in <results>/HKXShift_runs/<run id> (and the same under the scratch folder)
+RUNS_DIR = "HKXShift_runs"
+
+def new_run_id(base):
+    """Unique name of a run's workspace"""
+    return f"{base}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{os.urandom(3).hex()}"
+
+class ScratchCleaner:
+    """Deletes scratch folders on a background thread so cleanup never blocks a job"""
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._worker, daemon=True)
+        self.thread.start()
+
+    def discard(self, *paths):
+        """Queue folders for deletion"""
+        for path in paths:
+            self.queue.put(path)
+
+    def _worker(self):
+        while True:
+            path = self.queue.get()
+            if path is None:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+
+    def close(self):
+        """Finish queued deletions"""
+        self.queue.put(None)
+        self.thread.join()
+
+# RAM-backed folders tried for scratch files, in order
+RAM_SCRATCH_DIRS = ["/dev/shm"]
+
+def find_ram_scratch(required_bytes):
+    """Return a writable RAM-backed folder with room for required_bytes (plus 25%), or None"""
+    for path in RAM_SCRATCH_DIRS:
+        try:
+            if os.access(path, os.W_OK) and shutil.disk_usage(path).free >= required_bytes * 1.25:
+                return path
+        except OSError:
+            continue
+    return None
@@ -0,0 +1,895 @@
+"""Tkinter user interface"""
+import os
+import tkinter as tk
+from tkinter import filedialog, messagebox, ttk
+from tkinter.scrolledtext import ScrolledText
+import tkinter.font as tkfont
+import threading
+import queue
+import time
+import bisect
+
+from .common import DEFAULT_SERVER_PORT, ShiftError, extreme_multiplier, is_float, job_options, validate_job
+from .logs import log_level
+from .resources import EngineResources
+from .engine import ShiftEngine
+from .server import JobClient
+
+CONSOLE_LEVELS = ("info", "debug", "error")
+
+class ConsoleBuffer:
+    """Fixed-size ring buffer of console lines.
+
+    Every line gets a sequence number; once the buffer is full the oldest
+    lines are overwritten, so memory stays flat however long a run gets.
+    """
+    def __init__(self, capacity=200000):
+        self.capacity = capacity
+        self.lines = [None] * capacity
+        self.levels = [None] * capacity
+        self.total = 0
+
+    @property
+    def first(self):
+        """Sequence number of the oldest line still held"""
+        return max(0, self.total - self.capacity)
+
+    def __len__(self):
+        return self.total - self.first
+
+    def append(self, text, level):
+        seq = self.total
+        self.lines[seq % self.capacity] = text
+        self.levels[seq % self.capacity] = level
+        self.total += 1
+        return seq
+
+    def get(self, seq):
+        return self.lines[seq % self.capacity], self.levels[seq % self.capacity]
+
+    def seqs(self, levels):
+        """Sequence numbers of held lines whose level is in levels"""
+        return [seq for seq in range(self.first, self.total) if self.levels[seq % self.capacity] in levels]
+
+    def clear(self):
+        self.lines = [None] * self.capacity
+        self.levels = [None] * self.capacity
+        self.total = 0
+
+class ConsoleView:
+    """Console backed by a ConsoleBuffer that only renders the visible lines.
+
+    The Text widget never holds more than one screen of lines, so inserts cost
+    the same on line 10 and line 10 million. Scrolling, level filters and
+    jumping to errors all work on the buffer.
+    """
+    def __init__(self, parent, capacity=200000, font=("Consolas", 10)):
+        self.buffer = ConsoleBuffer(capacity)
+        self.font = tkfont.Font(font=font)
+        self.show = {level: tk.BooleanVar(value=True) for level in CONSOLE_LEVELS}
+        self.view = None  # None shows every line, otherwise a sorted list of sequence numbers
+        self.top = 0
+        self.rows = 20
+        self.follow = True
+        self.highlight = None
+        self.render_pending = False
+        
+        self.frame = ttk.Frame(parent)
+        self.text = tk.Text(self.frame, width=80, height=20, wrap=tk.NONE, font=self.font)
+        self.scrollbar = ttk.Scrollbar(self.frame, orient=tk.VERTICAL, command=self.on_scrollbar)
+        xscroll = ttk.Scrollbar(self.frame, orient=tk.HORIZONTAL, command=self.text.xview)
+        self.text.configure(xscrollcommand=xscroll.set, state=tk.DISABLED)
+        self.text.tag_configure("debug", foreground="#777777")
+        self.text.tag_configure("error", foreground="#c0392b")
+        self.text.tag_configure("highlight", background="#fff3b0")
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        xscroll.pack(side=tk.BOTTOM, fill=tk.X)
+        self.text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        
+        self.text.bind("<Configure>", self.on_resize)
+        self.text.bind("<MouseWheel>", lambda e: self.scroll(-1 if e.delta > 0 else 1, "units"))
+        self.text.bind("<Button-4>", lambda e: self.scroll(-1, "units"))
+        self.text.bind("<Button-5>", lambda e: self.scroll(1, "units"))
+        self.text.bind("<Prior>", lambda e: self.scroll(-1, "pages"))
+        self.text.bind("<Next>", lambda e: self.scroll(1, "pages"))
+        self.text.bind("<End>", lambda e: self.scroll_to_end())
+
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+
+    def append(self, text, level):
+        seq = self.buffer.append(text, level)
+        if self.view is not None and level in self.shown_levels():
+            self.view.append(seq)
+        self.schedule_render()
+
+    def shown_levels(self):
+        return {level for level, var in self.show.items() if var.get()}
+
+    def apply_filter(self):
+        """Rebuild the visible line list after a level filter changed"""
+        levels = self.shown_levels()
+        self.view = None if levels == set(CONSOLE_LEVELS) else self.buffer.seqs(levels)
+        self.follow = True
+        self.schedule_render()
+
+    def _trim_view(self):
+        """Drop sequence numbers the ring buffer has already overwritten"""
+        if self.view:
+            evicted = bisect.bisect_left(self.view, self.buffer.first)
+            if evicted:
+                del self.view[:evicted]
+                self.top = max(0, self.top - evicted)
+
+    def count(self):
+        return len(self.buffer) if self.view is None else len(self.view)
+
+    def seq_at(self, index):
+        return self.buffer.first + index if self.view is None else self.view[index]
+
+    def index_of(self, seq):
+        if self.view is None:
+            return seq - self.buffer.first
+        return bisect.bisect_left(self.view, seq)
+
+    def schedule_render(self):
+        if not self.render_pending:
+            self.render_pending = True
+            self.text.after_idle(self.render)
+
+    def render(self):
+        self.render_pending = False
+        self._trim_view()
+        total = self.count()
+        if self.follow:
+            self.top = max(0, total - self.rows)
+        self.top = max(0, min(self.top, total - self.rows))
+        
+        self.text.configure(state=tk.NORMAL)
+        self.text.delete("1.0", tk.END)
+        for index in range(self.top, min(total, self.top + self.rows)):
+            seq = self.seq_at(index)
+            line, level = self.buffer.get(seq)
+            tags = (level, "highlight") if seq == self.highlight else (level,)
+            self.text.insert(tk.END, line + "\n", tags)
+        self.text.configure(state=tk.DISABLED)
+        
+        if total:
+            self.scrollbar.set(self.top / total, min(1.0, (self.top + self.rows) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def on_resize(self, event):
+        rows = max(1, event.height // self.font.metrics("linespace"))
+        if rows != self.rows:
+            self.rows = rows
+            self.schedule_render()
+
+    def on_scrollbar(self, action, *args):
+        if action == "moveto":
+            self.move_to(int(float(args[0]) * self.count()))
+        elif action == "scroll":
+            self.scroll(int(args[0]), args[1])
+
+    def scroll(self, amount, what="units"):
+        step = self.rows if what == "pages" else 3
+        self.move_to(self.top + amount * step)
+        return "break"
+
+    def move_to(self, top):
+        total = self.count()
+        self.top = max(0, min(top, total - self.rows))
+        # Scrolling back to the bottom resumes following new output
+        self.follow = self.top >= total - self.rows
+        self.schedule_render()
+
+    def scroll_to_end(self):
+        self.follow = True
+        self.schedule_render()
+        return "break"
+
+    def jump_to_error(self):
+        """Scroll to the next error after the last one found, wrapping around. Returns False if there is none."""
+        self._trim_view()
+        total = self.count()
+        if self.highlight is not None and self.highlight >= self.buffer.first:
+            start = self.index_of(self.highlight) + 1
+        else:
+            start = self.top
+        for offset in range(total):
+            index = (start + offset) % total
+            seq = self.seq_at(index)
+            if self.buffer.get(seq)[1] == "error":
+                self.highlight = seq
+                self.follow = False
+                self.top = max(0, min(index, total - self.rows))
+                self.schedule_render()
+                return True
+        return False
+
+    def export(self):
+        """Every held line that passes the level filter, for the clipboard"""
+        self._trim_view()
+        return "\n".join(self.buffer.get(self.seq_at(index))[0] for index in range(self.count()))
+
+    def clear(self):
+        self.buffer.clear()
+        self.view = None if self.view is None else []
+        self.top = 0
+        self.follow = True
+        self.highlight = None
+        self.schedule_render()
+
+class ModernHKXShift:
+    def __init__(self, root):
+        self.root = root
+        self.root.title("HKXShift - Skyrim Animation Speed Adjuster v1.4")
+        self.root.geometry("900x650")
+        self.root.configure(bg="#f5f5f5")
+        self.root.minsize(800, 600)
+        
+        # Debug mode for verbose logging
+        self.debug_mode = False
+        
+        # Track last used values
+        self.last_used_directory = ""
+        self.last_used_multiplier = 1.0
+        
+        # Job server port used when jobs are sent to the server
+        self.server_port = DEFAULT_SERVER_PORT
+        
+        # Set app icon if available
+        try:
+            self.root.iconbitmap("hkxshift.ico")
+        except:
+            pass
+            
+        # Main frame
+        self.main_frame = ttk.Frame(root)
+        self.main_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=20)
+        
+        # Create a style
+        self.style = ttk.Style()
+        self.style.configure("TFrame", background="#f5f5f5")
+        self.style.configure("TButton", padding=5, font=("Segoe UI", 10))
+        self.style.configure("TLabel", background="#f5f5f5", font=("Segoe UI", 10))
+        self.style.configure("Header.TLabel", font=("Segoe UI", 14, "bold"))
+        self.style.configure("Subheader.TLabel", font=("Segoe UI", 12))
+        
+        # Header
+        header_frame = ttk.Frame(self.main_frame)
+        header_frame.pack(fill=tk.X, pady=(0, 15))
+        
+        ttk.Label(header_frame, text="HKXShift", style="Header.TLabel").pack(side=tk.LEFT)
+        ttk.Label(header_frame, text="by Hoverstein", foreground="#666666").pack(side=tk.LEFT, padx=(5, 0), pady=5)
+        
+        # Create notebook for tabs
+        self.notebook = ttk.Notebook(self.main_frame)
+        self.notebook.pack(fill=tk.BOTH, expand=True)
+        
+        # Create tabs
+        self.setup_tab = ttk.Frame(self.notebook)
+        self.console_tab = ttk.Frame(self.notebook)
+        self.help_tab = ttk.Frame(self.notebook)
+        
+        self.notebook.add(self.setup_tab, text="Setup")
+        self.notebook.add(self.console_tab, text="Console")
+        self.notebook.add(self.help_tab, text="Help")
+        
+        # Setup Tab Content
+        self.create_setup_tab()
+        
+        # Console Tab Content
+        self.create_console_tab()
+        
+        # Help Tab Content
+        self.create_help_tab()
+        
+        # Status bar
+        self.status_var = tk.StringVar()
+        self.status_var.set("Ready")
+        status_bar = ttk.Label(root, textvariable=self.status_var, relief=tk.SUNKEN, anchor=tk.W)
+        status_bar.pack(side=tk.BOTTOM, fill=tk.X)
+        
+        # Processing state
+        self.processing = False
+        self.engine = None
+        self.resources = None  # Worker pool and caches, kept warm between runs
+        
+        # Log lines and progress from the processing thread are applied on the Tk thread
+        self.ui_queue = queue.Queue()
+        self.root.after(50, self.drain_ui_queue)
+
+    def create_setup_tab(self):
+        # Input folder section
+        input_frame = ttk.LabelFrame(self.setup_tab, text="Input Settings")
+        input_frame.pack(fill=tk.X, padx=10, pady=10)
+        
+        ttk.Label(input_frame, text="Source Folder / Zip:").grid(row=0, column=0, sticky=tk.W, padx=5, pady=5)
+        
+        self.input_frame_path = ttk.Frame(input_frame)
+        self.input_frame_path.grid(row=0, column=1, sticky=tk.EW, padx=5, pady=5)
+        input_frame.columnconfigure(1, weight=1)
+        
+        self.input_entry = ttk.Entry(self.input_frame_path)
+        self.input_entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        
+        ttk.Button(self.input_frame_path, text="Browse Zip", command=self.browse_archive).pack(side=tk.RIGHT, padx=(5, 0))
+        ttk.Button(self.input_frame_path, text="Browse", command=self.browse_folder).pack(side=tk.RIGHT, padx=(5, 0))
+        
+        # Speed multiplier section
+        speed_frame = ttk.Frame(input_frame)
+        speed_frame.grid(row=1, column=0, columnspan=2, sticky=tk.W, padx=5, pady=10)
+        
+        ttk.Label(speed_frame, text="Speed Multiplier:").pack(side=tk.LEFT)
+        
+        # Create a frame for the scale and entry
+        scale_entry_frame = ttk.Frame(speed_frame)
+        scale_entry_frame.pack(side=tk.LEFT, padx=(10, 0))
+        
+        # Create the scale
+        self.speed_scale = ttk.Scale(scale_entry_frame, from_=0.1, to=2.0, orient=tk.HORIZONTAL, length=200)
+        self.speed_scale.set(1.0)
+        self.speed_scale.pack(side=tk.LEFT)
+        
+        # Create speed entry with validation
+        vcmd = (self.root.register(self.validate_float), '%P')
+        self.speed_entry = ttk.Entry(scale_entry_frame, width=5, validate="key", validatecommand=vcmd)
+        self.speed_entry.insert(0, "1.0")
+        self.speed_entry.pack(side=tk.LEFT, padx=(10, 0))
+        
+        # Link scale and entry
+        self.speed_scale.configure(command=self.update_speed_entry)
+        self.speed_entry.bind("<FocusOut>", self.update_speed_scale)
+        self.speed_entry.bind("<Return>", self.update_speed_scale)
+        
+        # Preset buttons
+        presets_frame = ttk.LabelFrame(self.setup_tab, text="Recommended Speed Presets")
+        presets_frame.pack(fill=tk.X, padx=10, pady=10)
+        
+        preset_buttons_frame = ttk.Frame(presets_frame)
+        preset_buttons_frame.pack(pady=5)
+        
+        presets = [
+            ("x0.7 (Faster)", 0.7),
+            ("x0.8", 0.8),
+            ("x0.9", 0.9),
+            ("x1.0 (Original)", 1.0),
+            ("x1.1", 1.1),
+            ("x1.2", 1.2),
+            ("x1.3 (Slower)", 1.3),
+        ]
+        
+        for i, (label, value) in enumerate(presets):
+            btn = ttk.Button(preset_buttons_frame, text=label, 
+                             command=lambda v=value: self.set_preset_speed(v))
+            btn.grid(row=0, column=i, padx=5, pady=5)
+        
+        # Options section
+        options_frame = ttk.LabelFrame(self.setup_tab, text="Options")
+        options_frame.pack(fill=tk.X, padx=10, pady=10)
+        
+        self.delete_temp_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(options_frame, text="Delete temporary files after completion", 
+                       variable=self.delete_temp_var).pack(anchor=tk.W, padx=5, pady=5)
+        
+        self.open_folder_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(options_frame, text="Open results folder when complete", 
+                       variable=self.open_folder_var).pack(anchor=tk.W, padx=5, pady=5)
+        
+        # Add backup option
+        self.backup_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(options_frame, text="Create backup of original files", 
+                       variable=self.backup_var).pack(anchor=tk.W, padx=5, pady=5)
+        
+        # Compressed backup option
+        self.backup_zip_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(options_frame, text="Compress the backup (smaller, restores file by file)", 
+                       variable=self.backup_zip_var).pack(anchor=tk.W, padx=5, pady=5)
+        
+        # Archive output option
+        self.archive_output_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(options_frame, text="Write merged output to a mod-manager-ready .zip archive", 
+                       variable=self.archive_output_var).pack(anchor=tk.W, padx=5, pady=5)
+        
+        # Deduplication option
+        self.deduplicate_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(options_frame, text="Process byte-identical HKX files only once", 
+                       variable=self.deduplicate_var).pack(anchor=tk.W, padx=5, pady=5)
+        
+        # Result cache option
+        self.result_cache_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(options_frame, text="Reuse results cached from earlier runs with the same multiplier", 
+                       variable=self.result_cache_var).pack(anchor=tk.W, padx=5, pady=5)
+        
+        # Background priority option
+        self.background_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(options_frame, text="Background priority (keep the PC responsive while playing or working)", 
+                       variable=self.background_var).pack(anchor=tk.W, padx=5, pady=5)
+        
+        # Annotation index option
+        self.annotation_index_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(options_frame, text="Add annotations to the searchable annotation index (HKXShift query)", 
+                       variable=self.annotation_index_var).pack(anchor=tk.W, padx=5, pady=5)
+        
+        # Binary fast path option
+        self.binary_patch_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(options_frame, text="Patch annotation times directly in HKX files when possible (experimental)", 
+                       variable=self.binary_patch_var).pack(anchor=tk.W, padx=5, pady=5)
+        
+        # Scratch location for intermediate files
+        self.ram_scratch_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(options_frame, text="Keep temporary files in RAM (/dev/shm) when there is enough space", 
+                       variable=self.ram_scratch_var).pack(anchor=tk.W, padx=5, pady=5)
+        
+        scratch_frame = ttk.Frame(options_frame)
+        scratch_frame.pack(fill=tk.X, padx=5, pady=5)
+        ttk.Label(scratch_frame, text="Temporary files folder:").pack(side=tk.LEFT)
+        self.scratch_entry = ttk.Entry(scratch_frame)
+        self.scratch_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(10, 0))
+        ttk.Button(scratch_frame, text="Browse", command=self.browse_scratch).pack(side=tk.RIGHT, padx=(5, 0))
+        
+        # Job server option
+        self.use_server_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(options_frame, text=f"Send jobs to the local HKXShift job server (port {self.server_port})", 
+                       variable=self.use_server_var).pack(anchor=tk.W, padx=5, pady=5)
+        
+        # Memory report option
+        self.memory_profile_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(options_frame, text="Write a memory usage report (slower, for troubleshooting)", 
+                       variable=self.memory_profile_var).pack(anchor=tk.W, padx=5, pady=5)
+        
+        # CPU profile option
+        self.cpu_profile_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(options_frame, text="Write a CPU profile of the run (slower, for troubleshooting)", 
+                       variable=self.cpu_profile_var).pack(anchor=tk.W, padx=5, pady=5)
+        
+        # Debug mode option
+        self.debug_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(options_frame, text="Enable debug logging", 
+                       variable=self.debug_var, command=self.toggle_debug).pack(anchor=tk.W, padx=5, pady=5)
+        
+        # Action buttons
+        buttons_frame = ttk.Frame(self.setup_tab)
+        buttons_frame.pack(fill=tk.X, padx=10, pady=(20, 10))
+        
+        self.run_button = ttk.Button(buttons_frame, text="Run HKXShift", command=self.run_shift_threaded)
+        self.run_button.pack(side=tk.RIGHT, padx=(5, 0))
+        
+        self.cancel_button = ttk.Button(buttons_frame, text="Cancel", command=self.cancel_operation, state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.RIGHT, padx=(5, 0))
+
+    def toggle_debug(self):
+        """Toggle debug mode"""
+        self.debug_mode = self.debug_var.get()
+        if self.engine:
+            self.engine.debug_mode = self.debug_mode
+        if self.debug_mode:
+            self.log("Debug mode enabled")
+        else:
+            self.log("Debug mode disabled")
+
+    def create_console_tab(self):
+        console_frame = ttk.Frame(self.console_tab)
+        console_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        
+        # Progress bar frame
+        progress_frame = ttk.Frame(console_frame)
+        progress_frame.pack(fill=tk.X, pady=(0, 10))
+        
+        ttk.Label(progress_frame, text="Overall Progress:").pack(side=tk.LEFT)
+        
+        # Progress bar
+        self.progress_var = tk.DoubleVar()
+        self.progress_bar = ttk.Progressbar(progress_frame, variable=self.progress_var, 
+                                           length=500, mode="determinate")
+        self.progress_bar.pack(side=tk.LEFT, padx=(10, 5), fill=tk.X, expand=True)
+        
+        # Progress percentage label
+        self.progress_percent = tk.StringVar(value="0%")
+        ttk.Label(progress_frame, textvariable=self.progress_percent, width=5).pack(side=tk.LEFT)
+        
+        # Level filters
+        filter_frame = ttk.Frame(console_frame)
+        filter_frame.pack(fill=tk.X, pady=(0, 5))
+        ttk.Label(filter_frame, text="Show:").pack(side=tk.LEFT)
+        
+        # Console output (only the visible lines are rendered, the rest stay in the buffer)
+        self.console_output = ConsoleView(console_frame)
+        self.console_output.pack(fill=tk.BOTH, expand=True)
+        
+        for level, label in (("info", "Info"), ("debug", "Debug"), ("error", "Errors")):
+            ttk.Checkbutton(filter_frame, text=label, variable=self.console_output.show[level],
+                           command=self.console_output.apply_filter).pack(side=tk.LEFT, padx=(10, 0))
+        
+        # Console buttons
+        console_buttons = ttk.Frame(console_frame)
+        console_buttons.pack(fill=tk.X, pady=(10, 0))
+        
+        ttk.Button(console_buttons, text="Next Error", 
+                  command=self.jump_to_error).pack(side=tk.LEFT)
+        
+        ttk.Button(console_buttons, text="Copy to Clipboard", 
+                  command=self.copy_output).pack(side=tk.RIGHT, padx=(5, 0))
+        
+        ttk.Button(console_buttons, text="Clear Console", 
+                  command=self.clear_console).pack(side=tk.RIGHT, padx=(5, 0))
+
+    def create_help_tab(self):
+        help_frame = ttk.Frame(self.help_tab)
+        help_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        
+        # Help text
+        help_text = ScrolledText(help_frame, width=80, height=20, wrap=tk.WORD)
+        help_text.pack(fill=tk.BOTH, expand=True)
+        
+        help_content = """# HKXShift - Skyrim Animation Speed Adjuster v1.4
+
+# UPDATE LOG
+## Changes in v1.4:
+- Added SCAR-patched and CPR-patched compatibility out of the box
+- Skips & directly copy files containing 'SCAR', 'equip', or 'unequip' in their names
+- Preserves SCAR_ActionData annotations in all HKX files
+- Detects and reports SCAR-patched and CPR-patched movesets
+- Changed annotation file naming from anno.txt to [hkx-filename].txt
+- Enhanced process logging and file tracking
+- More robust tool means possibly more robust bugs!
+
+## Changes in v1.3:
+- Added backup option feature
+- Adjusted recommended speed multiplier presets
+- Will show a warning if you use extreme speed multiplier (e.g. 0.5 or 1.5)
+- As always, might introduce more sneaky bugs!
+
+## Changes in v1.2:
+- Added support or compatibility for .HKX (uppercase) files
+- Added copying of TXT and/or JSON files from source to result folders
+- Your _conditions.txt and/or config.json will be copied now
+- Added display of HKX, TXT, and JSON file counts
+- Introduce hard limits on speed multiplier (0.1 to 2.0)
+- Show prevention of using 1.0 (no change in speed) multiplier
+- Show notice when source directory changes but multiplier doesn't
+- Might introduce even more new bugs!
+
+## Changes in v1.1:
+- Addressed security concerns revolving around shell=True code
+- Less likely to be flagged as false positive or unsafe by the system or antiviruses
+- Added debug logging option
+- Enhanced error reporting
+- Might introduce unexpected bugs, please report if you found any!
+
+## What does it do?
+HKXShift allows you to adjust the timing of Skyrim animation files (.hkx) by speeding them up or slowing them down while preserving SCAR and CPR patches.
+
+## SCAR and CPR Patch Preservation:
+- SCAR patches: Skips files with 'SCAR' in filename and preserves SCAR_ActionData annotations
+- CPR patches: Skips files with 'equip' or 'unequip' in filename
+- Automatically detects and reports if a moveset is SCAR-patched or CPR-patched
+- Other frameworks (e.g. MCO/DMCO) can be preserved with rules in hkxshift_rules.json next to hkanno64.exe:
+  {"rules": [{"name": "MCO", "target": "line", "match": "regex", "pattern": "MCO_", "action": "preserve"}]}
+  target is "file" or "line", match is "substring", "glob" or "regex", action is "preserve" or "skip"
+
+## How to use:
+1. Select the source folder (or .zip mod archive) containing .hkx files or subfolders with .hkx files
+2. Set your desired speed multiplier (below 1.0 speeds up, above 1.0 slows down)
+3. Click "Run HKXShift"
+4. Wait for processing to complete
+5. Find your results in the HKXShift_results folder in the same directory as this application
+6. Your usable folder has "-merged" in it's name
+
+## Requirements:
+- hkanno64.exe must be in the same folder as this application
+- Make sure you have read/write permissions for the folders
+- Speed multiplier cannot be 1.0 (as this would make no changes)
+
+## Tips:
+- Use the presets for common speed adjustments
+- The program will automatically detect single folder or batch mode
+- Check the Console tab for detailed processing information
+- The remaining time gets more accurate with every run (timings are kept in HKXShift_stats.sqlite)
+- Enable debug logging for more detailed output when troubleshooting
+- TXT and JSON files from the source folder will be copied to the result folder
+- Zip archives are read directly, no need to extract them first
+- Enable the .zip output option to get a "-merged.zip" you can install with your mod manager
+- Original files are backed up to the backup folder for safety
+- SCAR and CPR patches are automatically preserved
+- Byte-identical HKX files (e.g. shared idles) are processed once and reused everywhere they appear
+- The experimental in-place patch option scales annotation times directly in binary HKX packfiles (no hkanno needed); other files still use hkanno
+- Point "Temporary files folder" at a fast drive (or enable the RAM option) to keep intermediate files off the disk holding your mods
+- Merged files are cached in HKXShift_results/HKXShift_cache, so rebuilding with the same multiplier is almost instant
+
+## Command line and job server:
+- "HKXShift run <source> -m 1.2" processes a folder or zip without the GUI
+- "HKXShift serve" starts a local job server that keeps its caches warm between jobs
+- "HKXShift run <source> -m 1.2 --server" and the GUI option send jobs to that server
+- "HKXShift status" and "HKXShift cancel <id>" show and cancel server jobs
+
+## About:
+HKXShift was created by Hoverstein
+https://next.nexusmods.com/profile/Hoverstein
+"""
+        help_text.insert(tk.END, help_content)
+        help_text.configure(state=tk.DISABLED)
+
+    def browse_folder(self):
+        path = filedialog.askdirectory()
+        if path:
+            self.input_entry.delete(0, tk.END)
+            self.input_entry.insert(0, path)
+            self.notebook.select(self.setup_tab)
+
+    def browse_scratch(self):
+        path = filedialog.askdirectory()
+        if path:
+            self.scratch_entry.delete(0, tk.END)
+            self.scratch_entry.insert(0, path)
+
+    def browse_archive(self):
+        path = filedialog.askopenfilename(filetypes=[("Zip archives", "*.zip"), ("All files", "*.*")])
+        if path:
+            self.input_entry.delete(0, tk.END)
+            self.input_entry.insert(0, path)
+            self.notebook.select(self.setup_tab)
+
+    def validate_float(self, value):
+        if value == "":
+            return True
+        try:
+            val = float(value)
+            return 0.1 <= val <= 2.0  # Hard limits between 0.1 and 2.0
+        except:
+            return False
+
+    def update_speed_entry(self, val):
+        value = round(float(val), 2)
+        self.speed_entry.delete(0, tk.END)
+        self.speed_entry.insert(0, f"{value:.2f}")
+
+    def update_speed_scale(self, event=None):
+        try:
+            value = float(self.speed_entry.get())
+            if 0.1 <= value <= 2.0:
+                self.speed_scale.set(value)
+        except:
+            pass
+
+    def set_preset_speed(self, value):
+        self.speed_scale.set(value)
+        self.update_speed_entry(value)
+
+    def update_progress(self, value, message=None):
+        """Update progress bar and status message"""
+        self.progress_var.set(value)
+        self.progress_percent.set(f"{value:.1f}%")
+        if message:
+            self.status_var.set(message)
+
+    def log(self, message, debug=False, log_only=False):
+        """Log messages to console with debug option"""
+        if log_only or (debug and not self.debug_mode):
+            return
+        
+        # Format message with timestamp for logs
+        timestamp = time.strftime("%H:%M:%S")
+        
+        # Prefix debug messages
+        if debug:
+            formatted_message = f"{timestamp} - [DEBUG] {message}"
+        else:
+            formatted_message = f"{timestamp} - {message}"
+        
+        self.append_console(formatted_message, message, debug)
+
+    def append_console(self, formatted_message, message, debug):
+        """Append an already formatted line to the console (main thread only)"""
+        self.console_output.append(formatted_message, log_level(message, debug))
+        
+        # Only update status bar with non-debug messages
+        if not debug:
+            self.status_var.set(message.strip())
+
+    def drain_ui_queue(self):
+        """Apply log lines, progress and results posted by the processing thread"""
+        try:
+            while True:
+                item = self.ui_queue.get_nowait()
+                kind = item[0]
+                if kind == "log":
+                    self.append_console(*item[1:])
+                elif kind == "progress":
+                    self.update_progress(*item[1:])
+                elif kind == "done":
+                    self.finish_run(*item[1:])
+                elif kind == "error":
+                    self.fail_run(*item[1:])
+        except queue.Empty:
+            pass
+        self.root.after(50, self.drain_ui_queue)
+
+    def copy_output(self):
+        self.root.clipboard_clear()
+        self.root.clipboard_append(self.console_output.export())
+        messagebox.showinfo("Copied", "Console output copied to clipboard.")
+
+    def jump_to_error(self):
+        if not self.console_output.jump_to_error():
+            self.status_var.set("No errors in the console")
+
+    def clear_console(self):
+        self.console_output.clear()
+        self.progress_var.set(0)
+        self.progress_percent.set("0%")
+
+    def cancel_operation(self):
+        if self.processing:
+            self.processing = False
+            if self.engine:
+                self.engine.cancel()
+            else:
+                self.log("⚠️ Operation cancelled by user")
+            self.status_var.set("Cancelled")
+            self.update_button_states(False)
+            self.notebook.select(self.setup_tab)  # Return to setup tab
+
+    def update_button_states(self, is_processing):
+        if is_processing:
+            self.run_button.configure(state=tk.DISABLED)
+            self.cancel_button.configure(state=tk.NORMAL)
+        else:
+            self.run_button.configure(state=tk.NORMAL)
+            self.cancel_button.configure(state=tk.DISABLED)
+
+    def run_shift_threaded(self):
+        """Validate the settings and start processing on a background thread"""
+        if self.processing:
+            return
+        
+        source = self.input_entry.get().strip()
+        multiplier_str = self.speed_entry.get().strip()
+        use_server = self.use_server_var.get()
+        
+        if not is_float(multiplier_str):
+            messagebox.showerror("Error", "Invalid speed multiplier.")
+            return
+        
+        scale = float(multiplier_str)
+        try:
+            # The job server checks for hkanno64.exe on its own side
+            validate_job(source, scale, check_hkanno=not use_server)
+        except ShiftError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        
+        # Warning for extreme speed multipliers
+        if extreme_multiplier(scale):
+            warning_message = (
+                f"Warning: Speed multiplier {scale} is outside the recommended range.\n\n"
+                f"Extreme speed multipliers may cause animations to play\n"
+                f"significantly faster or slower but with inaccurate hit registration!\n\n"
+                f"Do you want to continue anyway?"
+            )
+            if not messagebox.askyesno("Speed Multiplier Warning", warning_message):
+                # User chose to cancel after the warning
+                return
+        
+        # Check if directory changed but multiplier is the same as last time
+        if self.last_used_directory != source and self.last_used_multiplier == scale and self.last_used_directory != "":
+            response = messagebox.askyesno("Notice",
+                                        f"You've changed the source directory but are using the same speed multiplier ({scale}).\n\n"
+                                        "Do you want to continue with this multiplier?")
+            if not response:
+                return
+        
+        # Store current values for next run
+        self.last_used_directory = source
+        self.last_used_multiplier = scale
+        
+        options = {
+            'backup': self.backup_var.get(),
+            'backup_format': 'zip' if self.backup_zip_var.get() else 'folder',
+            'delete_temp': self.delete_temp_var.get(),
+            'archive_output': self.archive_output_var.get(),
+            'deduplicate': self.deduplicate_var.get(),
+            'result_cache': self.result_cache_var.get(),
+            'scratch_dir': self.scratch_entry.get().strip(),
+            'ram_scratch': self.ram_scratch_var.get(),
+            'binary_patch': self.binary_patch_var.get(),
+            'annotation_index': self.annotation_index_var.get(),
+            'memory_profile': self.memory_profile_var.get(),
+            'cpu_profile': 'all' if self.cpu_profile_var.get() else '',
+            'concurrency': 'background' if self.background_var.get() else 'adaptive',
+            'debug': self.debug_mode,
+        }
+        
+        self.processing = True
+        self.update_button_states(True)
+        self.clear_console()
+        self.notebook.select(self.console_tab)
+        
+        # Create a thread to run the process
+        target = self.run_on_server if use_server else self.run_shift
+        threading.Thread(target=target, args=(source, scale, options), daemon=True).start()
+
+    def post_log(self, formatted_message, message, debug):
+        self.ui_queue.put(("log", formatted_message, message, debug))
+
+    def post_progress(self, value, message=None):
+        self.ui_queue.put(("progress", value, message))
+
+    def run_shift(self, source, scale, options):
+        """Run a job in this process (background thread)"""
+        if self.resources is None:
+            self.resources = EngineResources()
+        self.engine = ShiftEngine(self.resources, on_log=self.post_log, on_progress=self.post_progress)
+        try:
+            summary = self.engine.run(source, scale, options)
+        except ShiftError as e:
+            self.ui_queue.put(("error", str(e)))
+        except Exception as e:
+            self.ui_queue.put(("error", f"Unexpected error: {str(e)}"))
+        else:
+            self.ui_queue.put(("done", summary, options))
+
+    def run_on_server(self, source, scale, options):
+        """Submit a job to the local job server and follow it (background thread)"""
+        client = JobClient(port=self.server_port)
+        try:
+            job = client.submit(source, scale, job_options(options))
+            self.post_log(f"{time.strftime('%H:%M:%S')} - 📡 Submitted job {job['id']} to the job server",
+                          f"Submitted job {job['id']} to the job server", False)
+            status = client.follow(job['id'], on_log=self.post_log, on_progress=self.post_progress,
+                                   should_cancel=lambda: not self.processing)
+        except ShiftError as e:
+            self.ui_queue.put(("error", str(e)))
+        except OSError as e:
+            self.ui_queue.put(("error", f"Could not reach the job server on port {self.server_port}: {str(e)}"))
+        else:
+            if status['state'] == "failed":
+                self.ui_queue.put(("error", status['error']))
+            else:
+                self.ui_queue.put(("done", status['summary'], options))
+
+    def fail_run(self, message):
+        self.engine = None
+        self.processing = False
+        self.update_button_states(False)
+        messagebox.showerror("Error", message)
+        self.notebook.select(self.setup_tab)  # Return to setup tab
+
+    def finish_run(self, summary, options):
+        self.engine = None
+        
+        # Open results folder if requested
+        out_path = summary['output_path']
+        if summary['output_path'].lower().endswith(".zip"):
+            out_path = os.path.dirname(out_path)
+        if self.open_folder_var.get() and os.path.exists(out_path):
+            self.log("")
+            self.log("Opening results folder...")
+            try:
+                os.startfile(out_path)
+            except Exception as e:
+                self.log(f"⚠️ Error opening folder: {str(e)}")
+        
+        # Update UI
+        self.update_progress(100, "Complete!")
+        self.processing = False
+        self.update_button_states(False)
+        
+        # Show completion message with backup and patch information
+        backup_msg = f"Backup created: {summary['backed_up']} files" if options['backup'] else "Backup: Disabled"
+        patch_msg = ""
+        for name, count in summary['preserved_files'].items():
+            patch_msg += f"\n{name} files preserved: {count}"
+        for name, count in summary['preserved_lines'].items():
+            patch_msg += f"\n{name} annotations preserved: {count}"
+        if summary['deduplicated'] > 0:
+            patch_msg += f"\nIdentical files reused: {summary['deduplicated']}"
+        if summary['cached'] > 0:
+            patch_msg += f"\nReused from result cache: {summary['cached']}"
+        
+        messagebox.showinfo("Processing Complete",
+                           f"Successfully processed {summary['merged']} files.\n"
+                           f"Failed: {summary['failed']}\n"
+                           f"{backup_msg}{patch_msg}\n\n"
+                           f"Results saved to: {summary['output_path']}")
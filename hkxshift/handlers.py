@@ -0,0 +1,181 @@
+"""HTTP request handlers of the job server and the work coordinator"""
+import os
+import shutil
+import json
+import hmac
+from urllib.parse import urlparse, parse_qs
+
+from .common import ShiftError, is_loopback
+from .metrics import MetricsRequestHandler
+
+class JobRequestHandler(MetricsRequestHandler):
+    """JSON API of the job server:
+
+    GET  /status                 server, queue and cache status
+    GET  /metrics                Prometheus metrics of the running jobs
+    GET  /jobs                   all known jobs
+    POST /jobs                   submit {"source", "multiplier", "options"}
+    GET  /jobs/<id>?since=N      job status plus log lines from index N
+    POST /jobs/<id>/cancel       cancel a queued or running job
+
+    POST bodies must be sent as application/json, and when the server has a token every
+    request must send it in X-HKXShift-Token.
+    """
+    server_version = "HKXShift/1.4"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _authorized(self, json_body=False):
+        """Refuse what a web page could send: a foreign Host (DNS rebinding), a form post or no token"""
+        if self.server.loopback and not is_loopback(urlparse("//" + self.headers.get("Host", "")).hostname or ""):
+            self._send(403, {'error': "Invalid Host header"})
+            return False
+        if json_body and self.headers.get("Content-Type", "").split(";")[0].strip().lower() != "application/json":
+            self._send(415, {'error': "Expected Content-Type: application/json"})
+            return False
+        token = self.server.token
+        if token and not hmac.compare_digest(self.headers.get("X-HKXShift-Token", "").encode(), token.encode()):
+            self._send(403, {'error': "Invalid token"})
+            return False
+        return True
+
+    def _send(self, code, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        server = self.server.job_server
+        url = urlparse(self.path)
+        parts = [p for p in url.path.split("/") if p]
+        if parts == ["status"]:
+            return self._send(200, server.status())
+        if parts == ["metrics"]:
+            return self.send_metrics(server.metrics())
+        if parts == ["jobs"]:
+            return self._send(200, {'jobs': server.list_jobs()})
+        if len(parts) == 2 and parts[0] == "jobs":
+            job = server.get(parts[1])
+            if job is None:
+                return self._send(404, {'error': f"Unknown job {parts[1]}"})
+            since = parse_qs(url.query).get('since')
+            try:
+                since = int(since[0]) if since else None
+            except ValueError:
+                since = 0
+            return self._send(200, job.to_dict(since))
+        self._send(404, {'error': "Not found"})
+
+    def do_POST(self):
+        if not self._authorized(json_body=True):
+            return
+        server = self.server.job_server
+        parts = [p for p in urlparse(self.path).path.split("/") if p]
+        if parts == ["jobs"]:
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                job = server.submit(request['source'], float(request['multiplier']), request.get('options'))
+            except (ShiftError, KeyError, ValueError, TypeError) as e:
+                return self._send(400, {'error': str(e)})
+            return self._send(201, job.to_dict())
+        if len(parts) == 3 and parts[0] == "jobs" and parts[2] == "cancel":
+            job = server.cancel(parts[1])
+            if job is None:
+                return self._send(404, {'error': f"Unknown job {parts[1]}"})
+            return self._send(200, job.to_dict())
+        self._send(404, {'error': "Not found"})
+
+class CoordinatorRequestHandler(JobRequestHandler):
+    """HTTP API of the work coordinator, used by RemoteWorker:
+
+    GET  /status                        queue and worker status
+    POST /lease                         {"worker"} -> {"task": {...} or null}
+    GET  /tasks/<id>/source?worker=W    source HKX bytes
+    PUT  /tasks/<id>/output?worker=W    upload the merged HKX
+    POST /tasks/<id>/heartbeat          {"worker"} renew the lease
+    POST /tasks/<id>/complete           {"worker", "result"}
+    POST /tasks/<id>/release            {"worker", "error"} give the file back
+
+    When the coordinator has a token, every request must send it in X-HKXShift-Token.
+    """
+    def _request(self):
+        """Path parts and the worker name from the query string"""
+        url = urlparse(self.path)
+        worker = parse_qs(url.query).get('worker', [""])[0]
+        return [p for p in url.path.split("/") if p], worker
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        coordinator = self.server.coordinator
+        parts, worker = self._request()
+        if parts == ["status"]:
+            return self._send(200, coordinator.status())
+        if len(parts) == 3 and parts[0] == "tasks" and parts[2] == "source":
+            task = coordinator.source(parts[1], worker)
+            if task is None:
+                return self._send(409, {'error': f"Task {parts[1]} is not leased to {worker}"})
+            rel = os.path.join(task.job.folder, task.file)
+            try:
+                size = task.job.source_tree.getsize(rel)
+                stream = task.job.source_tree.open(rel)
+            except OSError as e:
+                return self._send(500, {'error': str(e)})
+            with stream:
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(size))
+                self.end_headers()
+                shutil.copyfileobj(stream, self.wfile)
+            return
+        self._send(404, {'error': "Not found"})
+
+    def do_PUT(self):
+        if not self._authorized():
+            return
+        parts, worker = self._request()
+        if len(parts) == 3 and parts[0] == "tasks" and parts[2] == "output":
+            try:
+                stored = self.server.coordinator.receive_output(parts[1], worker, self.rfile,
+                                                                int(self.headers.get("Content-Length", 0)))
+            except (OSError, ValueError) as e:
+                return self._send(500, {'error': str(e)})
+            if not stored:
+                return self._send(409, {'error': f"Task {parts[1]} is not leased to {worker}"})
+            return self._send(200, {})
+        self._send(404, {'error': "Not found"})
+
+    def do_POST(self):
+        if not self._authorized(json_body=True):
+            return
+        coordinator = self.server.coordinator
+        parts, _ = self._request()
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            worker = request['worker']
+        except (KeyError, ValueError, TypeError) as e:
+            return self._send(400, {'error': str(e)})
+        if parts == ["lease"]:
+            return self._send(200, {'task': coordinator.lease(worker)})
+        if len(parts) == 3 and parts[0] == "tasks":
+            task_id, action = parts[1], parts[2]
+            if action == "heartbeat":
+                accepted = coordinator.heartbeat(task_id, worker)
+            elif action == "complete":
+                accepted = coordinator.complete(task_id, worker, request.get('result'))
+            elif action == "release":
+                accepted = coordinator.release(task_id, worker, request.get('error', ""))
+            else:
+                return self._send(404, {'error': "Not found"})
+            if not accepted:
+                return self._send(409, {'error': f"Task {task_id} is not leased to {worker}"})
+            return self._send(200, {})
+        self._send(404, {'error': "Not found"})
@@ -0,0 +1,121 @@
+"""Text and JSON-lines run logs"""
+import os
+import threading
+import queue
+import time
+import json
+
+def log_level(message, debug):
+    """Classify a log message as info, debug or error"""
+    if debug:
+        return "debug"
+    text = message.lstrip()
+    if text.startswith("⚠️") or text.startswith("Error") or "[ERROR" in text:
+        return "error"
+    return "info"
+
+class RotatingLogFile:
+    """Append-only log file that rolls over to path.1, path.2... past max_bytes"""
+    def __init__(self, path, max_bytes, backups):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        # Rolled-over parts of an earlier run belong to the log being replaced
+        for n in range(1, backups + 1):
+            if os.path.exists(f"{path}.{n}"):
+                os.remove(f"{path}.{n}")
+        self.file = open(path, "w", encoding="utf-8")
+        # Counted here: tell() on a text file flushes and re-encodes its state on every call
+        self.size = 0
+
+    def write(self, text):
+        self.file.write(text)
+        self.size += len(text.encode("utf-8"))
+        if self.size >= self.max_bytes:
+            self.rotate()
+
+    def rotate(self):
+        self.file.close()
+        for n in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{n}"):
+                os.replace(f"{self.path}.{n}", f"{self.path}.{n + 1}")
+        if self.backups:
+            os.replace(self.path, f"{self.path}.1")
+        self.file = open(self.path, "w", encoding="utf-8")
+        self.size = 0
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+class RunLogWriter:
+    """Writes the text log and the structured JSON-lines log of a run on a background thread.
+
+    Records are batched and flushed at most every flush_interval seconds, so
+    logging from the worker pool never waits on disk.
+    """
+    def __init__(self, text_path, json_path, max_bytes=20 * 1024 * 1024, backups=3, flush_interval=0.5):
+        self.flush_interval = flush_interval
+        self.text_file = RotatingLogFile(text_path, max_bytes, backups)
+        self.json_file = RotatingLogFile(json_path, max_bytes, backups)
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._worker, daemon=True)
+        self.thread.start()
+
+    def write(self, text, record=None):
+        """Queue a text log line and/or a structured record (dict)"""
+        if record is not None:
+            now = time.time()
+            timestamp = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(now)) + f".{int(now % 1 * 1000):03d}"
+            record = dict(ts=timestamp, **record)
+        self.queue.put((text, record))
+
+    def _worker(self):
+        last_flush = time.monotonic()
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = False
+            if item is None:
+                break
+            if item:
+                text, record = item
+                try:
+                    if text is not None:
+                        self.text_file.write(text + "\n")
+                    if record is not None:
+                        self.json_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                except (OSError, ValueError):
+                    pass
+            if time.monotonic() - last_flush >= self.flush_interval:
+                self._flush()
+                last_flush = time.monotonic()
+        self._flush()
+
+    def _flush(self):
+        try:
+            self.text_file.flush()
+            self.json_file.flush()
+        except OSError:
+            pass
+
+    def close(self):
+        """Write everything still queued and close both files"""
+        self.queue.put(None)
+        self.thread.join()
+        self.text_file.close()
+        self.json_file.close()
+
+class RecordCollector:
+    """Stands in for a RunLogWriter on a remote worker, keeping the records to send to the coordinator"""
+    def __init__(self):
+        self.records = []
+
+    def write(self, text, record=None):
+        self.records.append((text, record))
+
+    def close(self):
+        pass
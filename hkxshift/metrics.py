@@ -0,0 +1,165 @@
+"""Prometheus metrics of running jobs"""
+import threading
+import bisect
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+# Upper bounds (seconds) of the stage latency histogram buckets
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Summary counters exported as files completed per stage
+STAGE_COUNTERS = ('dumped', 'scaled', 'merged', 'unchanged', 'binary_patched', 'cached', 'deduplicated', 'skipped_files')
+
+class MetricsText:
+    """Builds a Prometheus text format (0.0.4) page; samples are grouped by metric as the format requires"""
+    def __init__(self):
+        self.families = OrderedDict()
+
+    @staticmethod
+    def labels(labels):
+        if not labels:
+            return ""
+        escaped = (str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+                   for value in labels.values())
+        return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + "}"
+
+    @staticmethod
+    def value(value):
+        value = float(value)
+        return str(int(value)) if value.is_integer() else repr(value)
+
+    def family(self, name, kind, help_text):
+        if name not in self.families:
+            self.families[name] = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        return self.families[name]
+
+    def add(self, name, kind, help_text, value, labels=None):
+        self.family(name, kind, help_text).append(f"{name}{self.labels(labels)} {self.value(value)}")
+
+    def histogram(self, name, help_text, values, labels=None, buckets=STAGE_BUCKETS):
+        lines = self.family(name, "histogram", help_text)
+        labels = labels or {}
+        values = sorted(values)
+        for bound in buckets:
+            count = bisect.bisect_right(values, bound)
+            lines.append(f"{name}_bucket{self.labels(dict(labels, le=self.value(bound)))} {count}")
+        lines.append(f"{name}_bucket{self.labels(dict(labels, le='+Inf'))} {len(values)}")
+        lines.append(f"{name}_sum{self.labels(labels)} {self.value(sum(values))}")
+        lines.append(f"{name}_count{self.labels(labels)} {len(values)}")
+
+    def text(self):
+        return "\n".join(line for lines in self.families.values() for line in lines) + "\n"
+
+def render_metrics(runs, resources, extra=None):
+    """Prometheus page for [(labels, engine)] runs and the shared resources.
+
+    Counters are read from each run's summary dict, so they match the
+    summary the run ends with. extra(metrics) may add more samples.
+    """
+    metrics = MetricsText()
+    for labels, engine in runs:
+        with engine.lock:
+            summary = {key: dict(value) if isinstance(value, dict) else value
+                       for key, value in (engine.summary or {}).items()}
+            timings = list(engine.stage_timings)
+            total_cost, completed_cost = engine.total_cost, engine.completed_cost
+        metrics.add("hkxshift_run_active", "gauge", "1 while the run is processing", engine.processing, labels)
+        if engine.started:
+            metrics.add("hkxshift_run_start_timestamp_seconds", "gauge", "When processing started", engine.started, labels)
+        if engine.last_progress:
+            metrics.add("hkxshift_last_progress_timestamp_seconds", "gauge",
+                        "When the run last completed work; alert when it stops moving", engine.last_progress, labels)
+        if total_cost:
+            metrics.add("hkxshift_run_progress_ratio", "gauge", "Predicted share of the run completed",
+                        min(1.0, completed_cost / total_cost), labels)
+        if not summary:
+            continue
+        metrics.add("hkxshift_files_planned", "gauge", "HKX files found in the source", summary['hkx_count'], labels)
+        for stage in STAGE_COUNTERS:
+            metrics.add("hkxshift_files_total", "counter", "Files completed per stage",
+                        summary.get(stage, 0), dict(labels, stage=stage))
+        metrics.add("hkxshift_failures_total", "counter", "Files that failed", summary['failed'], labels)
+        metrics.add("hkxshift_copied_bytes_total", "counter", "Bytes copied into scratch and output folders",
+                    summary.get('copied_bytes', 0), labels)
+        
+        # Annotation cache lookups are only counted per process, below
+        metrics.add("hkxshift_cache_hits_total", "counter", "Cache hits", summary['cached'], dict(labels, cache="result"))
+        metrics.add("hkxshift_cache_hits_total", "counter", "Cache hits", summary['annotation_cache_hits'],
+                    dict(labels, cache="annotation"))
+        metrics.add("hkxshift_cache_lookups_total", "counter", "Cache lookups", summary['cache_lookups'],
+                    dict(labels, cache="result"))
+        metrics.add("hkxshift_cache_hit_ratio", "gauge", "Cache hits per lookup",
+                    summary['cached'] / summary['cache_lookups'] if summary['cache_lookups'] else 0,
+                    dict(labels, cache="result"))
+        
+        concurrency = engine.concurrency
+        if concurrency and engine.processing:
+            for kind, limiter in concurrency.limiters.items():
+                metrics.add("hkxshift_in_flight", "gauge", "Tasks holding a slot (running hkanno processes, copies)",
+                            limiter.in_use, dict(labels, kind=kind))
+                metrics.add("hkxshift_concurrency_limit", "gauge", "Current slot limit", limiter.limit, dict(labels, kind=kind))
+                metrics.add("hkxshift_queue_depth", "gauge", "Tasks waiting", limiter.waiting, dict(labels, queue=kind))
+        copies = engine.copies
+        if copies:
+            metrics.add("hkxshift_queue_depth", "gauge", "Tasks waiting",
+                        sum(1 for future in list(copies.futures) if not future.done()), dict(labels, queue="copy_batches"))
+        backup = engine.backup
+        if backup:
+            metrics.add("hkxshift_backup_progress_ratio", "gauge", "Share of the source backed up",
+                        backup.progress() / 100, labels)
+        
+        by_stage = {}
+        for _, stage, _, duration in timings:
+            by_stage.setdefault(stage, []).append(duration)
+        for stage, durations in by_stage.items():
+            metrics.histogram("hkxshift_stage_duration_seconds", "Time per file and stage", durations,
+                              dict(labels, stage=stage))
+
+    for name, cache in (('inventory', resources.inventory_cache), ('annotation', resources.annotation_cache)):
+        hits, misses = cache.hits, cache.misses
+        metrics.add("hkxshift_process_cache_hits_total", "counter", "Hits of caches shared by every run", hits,
+                    {'cache': name})
+        metrics.add("hkxshift_process_cache_misses_total", "counter", "Misses of caches shared by every run", misses,
+                    {'cache': name})
+        metrics.add("hkxshift_process_cache_hit_ratio", "gauge", "Hits per lookup of caches shared by every run",
+                    hits / (hits + misses) if hits + misses else 0, {'cache': name})
+    if extra:
+        extra(metrics)
+    return metrics.text()
+
+class MetricsServer:
+    """Local HTTP endpoint serving GET /metrics from a render() callback, on its own thread"""
+    def __init__(self, host, port, render):
+        self.httpd = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+        self.httpd.render_metrics = render
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """GET /metrics in the Prometheus text format"""
+    server_version = "HKXShift/1.4"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_metrics(self, text):
+        body = text.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if urlparse(self.path).path != "/metrics":
+            self.send_error(404)
+            return
+        self.send_metrics(self.server.render_metrics())
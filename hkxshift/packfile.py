@@ -0,0 +1,171 @@
+"""Reading and patching annotations in binary Havok packfiles"""
+import os
+import mmap
+import struct
+
+class HkxPatchError(ValueError):
+    """Raised when an HKX file cannot be patched in place safely"""
+
+PACKFILE_MAGIC = (0x57E0E057, 0x10C0C010)
+
+# Packfile classes deriving from hkaAnimation, which holds m_annotationTracks
+ANIMATION_CLASSES = {
+    "hkaSplineCompressedAnimation",
+    "hkaInterleavedUncompressedAnimation",
+    "hkaDeltaCompressedAnimation",
+    "hkaWaveletCompressedAnimation",
+    "hkaQuantizedAnimation",
+}
+
+# Offset of hkaAnimation::m_annotationTracks for 32-bit (Skyrim LE) and 64-bit (Skyrim SE) layouts
+ANNOTATION_TRACKS_OFFSET = {4: 28, 8: 40}
+
+# Animation classes whose first own member is the frame count hkanno reports as numOriginalFrames
+FRAME_COUNT_CLASSES = {"hkaSplineCompressedAnimation", "hkaDeltaCompressedAnimation", "hkaWaveletCompressedAnimation"}
+
+def read_packfile_annotations(data):
+    """Locate annotation time fields in a binary Havok packfile.
+
+    Returns (pointer size, [(offset of the time float, time, text, track)]). Raises
+    HkxPatchError for tagfiles, big-endian files, unknown layouts or anything
+    that does not parse cleanly.
+    """
+    pointer_size, annotations, _ = parse_packfile_animations(data)
+    return pointer_size, annotations
+
+def parse_packfile_animations(data):
+    """read_packfile_annotations() plus [(class name, duration, annotation tracks, original frames)]
+    for every animation object; frames is None for classes whose frame count is not known here.
+    """
+    if len(data) < 64 or struct.unpack_from("<2I", data, 0) != PACKFILE_MAGIC:
+        raise HkxPatchError("not a binary packfile")
+    file_version = struct.unpack_from("<i", data, 12)[0]
+    pointer_size, little_endian = data[16], data[17]
+    if pointer_size not in ANNOTATION_TRACKS_OFFSET or little_endian != 1:
+        raise HkxPatchError("unsupported packfile layout")
+    num_sections = struct.unpack_from("<i", data, 20)[0]
+    header_size = 64
+    section_size = 48
+    if file_version >= 11:
+        max_predicate, predicate_padding = struct.unpack_from("<hh", data, 60)
+        if max_predicate != -1:
+            header_size += predicate_padding
+        section_size = 64
+    
+    sections = {}
+    for index in range(num_sections):
+        offset = header_size + index * section_size
+        if offset + 48 > len(data):
+            raise HkxPatchError("truncated section headers")
+        tag = bytes(data[offset:offset + 19]).split(b"\0", 1)[0].decode("ascii", "replace")
+        sections[tag] = (index,) + struct.unpack_from("<7I", data, offset + 20)
+    if "__data__" not in sections or "__classnames__" not in sections:
+        raise HkxPatchError("missing data or classnames section")
+    
+    names_start = sections["__classnames__"][1]
+    names_end = names_start + sections["__classnames__"][2]
+    index, start, local_fixups, global_fixups, virtual_fixups, exports, imports, end = sections["__data__"]
+    if not start + local_fixups <= start + global_fixups <= start + virtual_fixups <= start + exports <= len(data):
+        raise HkxPatchError("inconsistent data section")
+    
+    def read_cstring(at, limit):
+        stop = data.find(b"\0", at, limit)
+        if at >= limit or stop < 0:
+            raise HkxPatchError("unterminated string")
+        return bytes(data[at:stop]).decode("utf-8", "replace")
+    
+    fixups = {}
+    for at in range(start + local_fixups, start + global_fixups - 7, 8):
+        src, dst = struct.unpack_from("<2I", data, at)
+        if src != 0xFFFFFFFF:
+            fixups[src] = dst
+    
+    objects = []
+    for at in range(start + virtual_fixups, start + exports - 11, 12):
+        src, section_index, name_offset = struct.unpack_from("<3I", data, at)
+        if src != 0xFFFFFFFF and section_index == index:
+            objects.append((src, read_cstring(names_start + name_offset, names_end)))
+    
+    array_size = pointer_size + 8
+    track_size = pointer_size + array_size
+    annotation_size = pointer_size * 2
+    tracks_offset = ANNOTATION_TRACKS_OFFSET[pointer_size]
+    
+    def array(at):
+        """(element data offset, count) of an hkArray in the data section"""
+        count = struct.unpack_from("<i", data, start + at + pointer_size)[0]
+        if count == 0:
+            return None, 0
+        if count < 0 or at not in fixups:
+            raise HkxPatchError("unresolved array")
+        return fixups[at], count
+    
+    annotations = []
+    animations = []
+    track_number = 0
+    animation_objects = [(src, name) for src, name in objects if name in ANIMATION_CLASSES]
+    if not animation_objects:
+        raise HkxPatchError("no animation object")
+    for obj, class_name in animation_objects:
+        duration = struct.unpack_from("<f", data, start + obj + pointer_size * 2 + 4)[0]
+        tracks, track_count = array(obj + tracks_offset)
+        # The first member after hkaAnimation holds the frame count (m_numFrames, m_numberOfPoses),
+        # interleaved animations store one transform per track and frame
+        frames = None
+        if class_name in FRAME_COUNT_CLASSES:
+            frames = struct.unpack_from("<i", data, start + obj + tracks_offset + array_size)[0]
+        elif class_name == "hkaInterleavedUncompressedAnimation":
+            transform_tracks = struct.unpack_from("<i", data, start + obj + pointer_size * 2 + 8)[0]
+            transforms = struct.unpack_from("<i", data, start + obj + tracks_offset + array_size + pointer_size)[0]
+            frames = transforms // transform_tracks if transform_tracks > 0 else 0
+        animations.append((class_name, duration, track_count, frames))
+        for track in range(track_count):
+            entries, entry_count = array(tracks + track * track_size + pointer_size)
+            for entry in range(entry_count):
+                at = entries + entry * annotation_size
+                if start + at + annotation_size > start + local_fixups:
+                    raise HkxPatchError("annotation outside data section")
+                time_value = struct.unpack_from("<f", data, start + at)[0]
+                text_at = fixups.get(at + pointer_size)
+                text = read_cstring(start + text_at, start + local_fixups) if text_at is not None else ""
+                # Times outside the clip mean the layout guess was wrong
+                if not -0.001 <= time_value <= duration + 0.001:
+                    raise HkxPatchError("annotation time outside animation duration")
+                annotations.append((start + at, time_value, text, track_number))
+            track_number += 1
+    return pointer_size, annotations, animations
+
+def hkanno_time(value):
+    """value rounded to the six decimals of hkanno's dump text"""
+    return float(f"{value:.6f}")
+
+def patch_annotation_times(path, scale, rules):
+    """Scale annotation times of the HKX file at path in place.
+
+    Lines preserved by the rules keep their time. New times are rounded to
+    the six decimals of hkanno's dump text first, so they come out the same as
+    through dump/rescale/merge. Returns {rule name: preserved count}. Raises
+    HkxPatchError (leaving the file unchanged) when the file needs the hkanno
+    path, e.g. when a rule would drop an annotation.
+    """
+    with open(path, "r+b") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            # mmap cannot map an empty file
+            raise HkxPatchError("empty file")
+        with mmap.mmap(f.fileno(), 0) as data:
+            pointer_size, annotations = read_packfile_annotations(data)
+            updates = []
+            preserved = {}
+            for offset, time_value, text, _ in annotations:
+                # Rules see the same "time text" lines as in an hkanno dump
+                rule = rules.match_line(f"{time_value:.6f} {text}\n")
+                if rule and rule['action'] != 'preserve':
+                    raise HkxPatchError(f"{rule['name']} rule drops annotations")
+                if rule:
+                    preserved[rule['name']] = preserved.get(rule['name'], 0) + 1
+                else:
+                    updates.append((offset, hkanno_time(hkanno_time(time_value) * scale)))
+            for offset, new_time in updates:
+                struct.pack_into("<f", data, offset, new_time)
+            data.flush()
+    return preserved
@@ -0,0 +1,280 @@
+"""Memory and CPU profiling of runs"""
+import os
+import sys
+import threading
+import time
+try:
+    import resource  # Peak RSS on Linux/macOS; Windows uses GetProcessMemoryInfo
+except ImportError:
+    resource = None
+import cProfile
+import pstats
+import contextlib
+import tracemalloc
+
+def process_memory():
+    """Current and peak resident set size of this process in bytes (None where unavailable)"""
+    if sys.platform == "win32":
+        try:
+            import ctypes
+            from ctypes import wintypes
+            
+            class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+                _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                            ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                            ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+            
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(counters)
+            get_info = ctypes.windll.psapi.GetProcessMemoryInfo
+            get_info.argtypes = [wintypes.HANDLE, ctypes.POINTER(PROCESS_MEMORY_COUNTERS), wintypes.DWORD]
+            if get_info(ctypes.windll.kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+                return counters.WorkingSetSize, counters.PeakWorkingSetSize
+        except (OSError, AttributeError):
+            pass
+        return None, None
+    
+    rss = peak = None
+    try:
+        with open("/proc/self/statm") as f:
+            rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource:
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak *= 1 if sys.platform == "darwin" else 1024
+    return rss, peak
+
+def format_bytes(size):
+    """Human readable size, e.g. 12.3 MB ("?" when unknown)"""
+    if size is None:
+        return "?"
+    sign = "-" if size < 0 else ""
+    size = abs(size)
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{sign}{size:.1f} {unit}" if unit != "B" else f"{sign}{size} B"
+        size /= 1024
+
+class MemoryProfiler:
+    """Opt-in tracemalloc instrumentation of a run.
+
+    checkpoint() is called at phase and folder boundaries; each one records
+    traced memory (current and peak since the previous checkpoint), process
+    RSS and a tracemalloc snapshot. write_report() lists the checkpoints, the
+    top allocation sites and what grew the most over the run.
+    tracemalloc is process-wide: tracing is shared through resources with
+    other profiled jobs, whose allocations then show up in this report too.
+    """
+    def __init__(self, resources, frames=10, top=20):
+        self.resources = resources
+        self.frames = frames
+        self.top = top
+        self.checkpoints = []
+        self.first_snapshot = None
+        self.last_snapshot = None
+        self.tracing = False
+
+    def start(self):
+        self.resources.start_tracing(self.frames)
+        self.tracing = True
+        self.checkpoint("start")
+
+    def checkpoint(self, label):
+        current, peak = tracemalloc.get_traced_memory()
+        # Resetting the peak would cut into the intervals of the other profiled jobs
+        shared = self.resources.tracing_shared()
+        if not shared and hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        rss, peak_rss = process_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ])
+        if self.first_snapshot is None:
+            self.first_snapshot = snapshot
+        previous = self.last_snapshot
+        self.last_snapshot = snapshot
+        growth = None
+        if previous is not None:
+            growth = sum(stat.size_diff for stat in snapshot.compare_to(previous, "filename"))
+        self.checkpoints.append((label, current, peak, rss, peak_rss, growth, shared))
+
+    def write_report(self, path, title):
+        lines = [f"=== HKXShift Memory Report for {title} ===",
+                 f"Written: {time.strftime('%Y-%m-%d %H:%M:%S')}", "",
+                 "--- Checkpoints (peak = traced peak since previous checkpoint) ---",
+                 f"{'checkpoint':<40} {'traced':>10} {'peak':>10} {'growth':>10} {'RSS':>10} {'peak RSS':>10}"]
+        for label, current, peak, rss, peak_rss, growth, shared in self.checkpoints:
+            peak = format_bytes(peak) + ("*" if shared else "")
+            lines.append(f"{label[:40]:<40} {format_bytes(current):>10} {peak:>10} "
+                         f"{format_bytes(growth):>10} {format_bytes(rss):>10} {format_bytes(peak_rss):>10}")
+        if any(checkpoint[-1] for checkpoint in self.checkpoints):
+            lines.append("* another profiled job was running: the peak is not reset while tracing is shared, "
+                         "and traced memory includes that job")
+        
+        if self.last_snapshot is not None:
+            lines += ["", f"--- Top {self.top} allocation sites at the end of the run ---"]
+            for stat in self.last_snapshot.statistics("lineno")[:self.top]:
+                frame = stat.traceback[0]
+                lines.append(f"{format_bytes(stat.size):>10} in {stat.count:>7} blocks  {frame.filename}:{frame.lineno}")
+            
+            lines += ["", f"--- Top {self.top} growth since the start of the run ---"]
+            for stat in self.last_snapshot.compare_to(self.first_snapshot, "traceback")[:self.top]:
+                if stat.size_diff <= 0:
+                    break
+                lines.append(f"{format_bytes(stat.size_diff):>10} in {stat.count_diff:>+7} blocks")
+                for line in stat.traceback.format()[-6:]:
+                    lines.append(f"    {line}")
+        
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def stop(self):
+        if self.tracing:
+            self.resources.stop_tracing()
+            self.tracing = False
+
+# Phases a CPU profile can be restricted to; 'process' includes the per-file stages
+PROFILE_PHASES = ('prepare', 'process', 'patch', 'dump', 'rescale', 'merge', 'finish')
+FILE_PHASES = ('patch', 'dump', 'rescale', 'merge')
+# From Python 3.12 on cProfile sees every thread, and only one profiler can be enabled at a time
+SHARED_CPROFILE = sys.version_info >= (3, 12)
+
+class CpuProfiler:
+    """Opt-in CPU profiling of a run.
+
+    Each thread inside a selected phase runs its own cProfile profiler (merged
+    into one pstats file at the end); on Python 3.12+ one profiler runs while
+    any thread is inside a selected phase. A sampling thread records the
+    stacks of those threads for a collapsed-stack file that flame graph tools
+    (flamegraph.pl, speedscope...) can read.
+    """
+    def __init__(self, phases=None, interval=0.005):
+        self.phases = set(phases) if phases else None
+        self.interval = interval
+        self.profiles = []
+        self.stacks = {}
+        self.active = set()
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.running = False
+        self.sampler = None
+        self.shared = None  # the SHARED_CPROFILE profiler while it is enabled
+
+    def selected(self, name):
+        if self.phases is None or name in self.phases:
+            return True
+        return name in FILE_PHASES and 'process' in self.phases
+
+    def start(self):
+        self.running = True
+        self.sampler = threading.Thread(target=self._sample, daemon=True)
+        self.sampler.start()
+
+    def begin(self, name):
+        """Start profiling the current thread if phase name is selected"""
+        depth = getattr(self.local, "depth", 0)
+        if depth == 0 and not self.selected(name):
+            return
+        self.local.depth = depth + 1
+        if depth:
+            return
+        if SHARED_CPROFILE:
+            with self.lock:
+                if not self.active:
+                    self._enable_shared()
+                self.active.add(threading.get_ident())
+            return
+        profile = cProfile.Profile()
+        profile.enable()
+        self.local.profile = profile
+        with self.lock:
+            self.active.add(threading.get_ident())
+
+    def _enable_shared(self):
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another job in this process is being profiled; this one only gets the sampled stacks
+            return
+        self.shared = profile
+        self.profiles.append(profile)
+
+    def end(self, name):
+        depth = getattr(self.local, "depth", 0)
+        if depth == 0:
+            return
+        self.local.depth = depth - 1
+        if depth > 1:
+            return
+        with self.lock:
+            self.active.discard(threading.get_ident())
+            if not SHARED_CPROFILE:
+                self.local.profile.disable()
+                self.profiles.append(self.local.profile)
+            elif not self.active and self.shared is not None:
+                # The last thread left the selected phases
+                self.shared.disable()
+                self.shared = None
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        self.begin(name)
+        try:
+            yield
+        finally:
+            self.end(name)
+
+    def _sample(self):
+        while self.running:
+            frames = sys._current_frames()
+            with self.lock:
+                for ident in self.active:
+                    frame = frames.get(ident)
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                        frame = frame.f_back
+                    if stack:
+                        key = ";".join(reversed(stack))
+                        self.stacks[key] = self.stacks.get(key, 0) + 1
+            time.sleep(self.interval)
+
+    def stop(self):
+        self.running = False
+        if self.sampler:
+            self.sampler.join()
+            self.sampler = None
+        # Close a phase left open by an exception on this thread
+        if getattr(self.local, "depth", 0):
+            self.local.depth = 1
+            self.end(None)
+
+    def write(self, base_path):
+        """Write base_path.pstats, .collapsed and a readable _top.txt summary; returns the paths"""
+        paths = []
+        with self.lock:
+            profiles = list(self.profiles)
+            stacks = dict(self.stacks)
+        if profiles:
+            stats = pstats.Stats(profiles[0])
+            for profile in profiles[1:]:
+                stats.add(profile)
+            stats.dump_stats(base_path + ".pstats")
+            paths.append(base_path + ".pstats")
+            with open(base_path + "_top.txt", "w", encoding="utf-8") as f:
+                stats = pstats.Stats(base_path + ".pstats", stream=f)
+                stats.sort_stats("cumulative").print_stats(40)
+                stats.sort_stats("tottime").print_stats(40)
+            paths.append(base_path + "_top.txt")
+        with open(base_path + ".collapsed", "w", encoding="utf-8") as f:
+            for stack, count in sorted(stacks.items()):
+                f.write(f"{stack} {count}\n")
+        paths.append(base_path + ".collapsed")
+        return paths
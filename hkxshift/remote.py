@@ -0,0 +1,264 @@
+"""Work coordinator that hands a run's files out to remote workers, and its client"""
+import os
+import shutil
+import threading
+import time
+import json
+import tempfile
+import urllib.request
+import urllib.error
+from collections import deque
+from concurrent.futures import Future, InvalidStateError
+from http.server import ThreadingHTTPServer
+from urllib.parse import quote
+
+from .common import DEFAULT_COORDINATOR_PORT, ShiftError, is_loopback, parse_address
+from .handlers import CoordinatorRequestHandler
+
+class RemoteTask:
+    """One HKX file of a coordinated run, queued for or leased to a remote worker"""
+    def __init__(self, task_id, job, idx, file, payload):
+        self.id = task_id
+        self.job = job
+        self.idx = idx
+        self.file = file
+        self.payload = dict(payload, id=task_id)
+        self.future = Future()
+        self.worker = None
+        self.deadline = 0.0
+        self.attempts = 0
+        self.output = None
+
+class WorkCoordinator:
+    """Hands the HKX files of a run out to remote workers over HTTP.
+
+    Workers lease one file at a time, download its source bytes, run
+    dump/rescale/merge with the backend they are sent and upload the merged HKX.
+    A lease that is not renewed within LEASE_SECONDS (the worker crashed or
+    lost its connection) puts the file back in the queue for another worker.
+    """
+    LEASE_SECONDS = 30
+    MAX_ATTEMPTS = 3
+
+    def __init__(self, host="127.0.0.1", port=DEFAULT_COORDINATOR_PORT, token="", on_log=None):
+        if not token and not is_loopback(host):
+            # Anyone who can reach the port could otherwise read the sources and plant merged files
+            raise ShiftError(f"Coordinating on {host} needs a token that the workers send with --token")
+        self.token = token
+        self.on_log = on_log
+        self.tasks = {}
+        self.pending = deque()
+        self.workers = {}
+        self.next_id = 1
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.httpd = ThreadingHTTPServer((host, port), CoordinatorRequestHandler)
+        self.httpd.coordinator = self
+        self.httpd.token = token
+        self.httpd.loopback = is_loopback(host)
+        self.threads = [threading.Thread(target=self.httpd.serve_forever, daemon=True),
+                        threading.Thread(target=self._reaper, daemon=True)]
+
+    def log(self, message, debug=False):
+        if self.on_log:
+            self.on_log(message, debug)
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        with self.lock:
+            tasks = list(self.tasks.values())
+            self.tasks.clear()
+            self.pending.clear()
+        for task in tasks:
+            task.future.cancel()
+
+    def submit(self, job, idx, file, payload):
+        """Queue a file for the workers; the returned Future resolves to (task, result)"""
+        with self.lock:
+            task = RemoteTask(str(self.next_id), job, idx, file, payload)
+            self.next_id += 1
+            self.tasks[task.id] = task
+            self.pending.append(task)
+        return task.future
+
+    def lease(self, worker):
+        """Give the next queued file to a worker, or None when the queue is empty"""
+        with self.lock:
+            new_worker = worker not in self.workers
+            self.workers[worker] = time.time()
+            task = None
+            while self.pending:
+                task = self.pending.popleft()
+                if not task.future.cancelled():
+                    task.worker = worker
+                    task.attempts += 1
+                    task.deadline = time.time() + self.LEASE_SECONDS
+                    break
+                self.tasks.pop(task.id, None)
+                task = None
+        if new_worker:
+            self.log(f"🌐 Worker {worker} connected")
+        if task:
+            self.log(f"{task.job.subname}/{task.file} leased to {worker}", debug=True)
+        return task.payload if task else None
+
+    def _leased(self, task_id, worker):
+        """The task if worker still holds its lease (call with the lock held)"""
+        task = self.tasks.get(task_id)
+        if task is None or task.worker != worker or task.future.done():
+            return None
+        return task
+
+    def heartbeat(self, task_id, worker):
+        with self.lock:
+            self.workers[worker] = time.time()
+            task = self._leased(task_id, worker)
+            if task:
+                task.deadline = time.time() + self.LEASE_SECONDS
+            return task is not None
+
+    def source(self, task_id, worker):
+        """The leased task whose source bytes the worker asks for, or None"""
+        with self.lock:
+            return self._leased(task_id, worker)
+
+    def receive_output(self, task_id, worker, stream, length):
+        """Store an uploaded merged HKX where the local pipeline would have left it"""
+        with self.lock:
+            task = self._leased(task_id, worker)
+        if task is None:
+            return False
+        out_dir = os.path.join(task.job.rescaled, task.file)
+        os.makedirs(out_dir, exist_ok=True)
+        fd, partial = tempfile.mkstemp(prefix=".upload-", dir=out_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                while length > 0:
+                    chunk = stream.read(min(length, 1024 * 1024))
+                    if not chunk:
+                        raise OSError("Upload ended early")
+                    f.write(chunk)
+                    length -= len(chunk)
+            path = os.path.join(out_dir, task.file)
+            os.replace(partial, path)
+        except OSError:
+            os.remove(partial)
+            raise
+        task.output = path
+        return True
+
+    def complete(self, task_id, worker, result):
+        """A worker finished a file (merged or failed); hand its result to the run"""
+        with self.lock:
+            task = self._leased(task_id, worker)
+            if task is None:
+                return False
+            del self.tasks[task_id]
+        self._resolve(task, result=(task, result))
+        return True
+
+    def release(self, task_id, worker, error):
+        """A worker gave a file back (transfer or disk problem), let another one try"""
+        with self.lock:
+            task = self._leased(task_id, worker)
+            if task is None:
+                return False
+            task.worker = None
+        self._retry(task, f"Worker {worker} gave back {task.file} ({error})")
+        return True
+
+    def _resolve(self, task, result=None, error=None):
+        try:
+            if error:
+                task.future.set_exception(error)
+            else:
+                task.future.set_result(result)
+        except InvalidStateError:
+            pass  # The run was cancelled meanwhile
+
+    def _retry(self, task, reason):
+        if task.attempts >= self.MAX_ATTEMPTS:
+            with self.lock:
+                self.tasks.pop(task.id, None)
+            self._resolve(task, error=ShiftError(f"{reason}, giving up after {task.attempts} attempts"))
+            return
+        self.log(f"  ♻️ {reason}, reassigning it")
+        with self.lock:
+            self.pending.appendleft(task)
+
+    def _reaper(self):
+        """Requeue files whose worker stopped renewing its lease"""
+        while not self.stopping.wait(1.0):
+            now = time.time()
+            expired = []
+            with self.lock:
+                for task in self.tasks.values():
+                    if task.worker and task.deadline < now and not task.future.done():
+                        expired.append((task, task.worker))
+                        task.worker = None
+            for task, worker in expired:
+                self._retry(task, f"Worker {worker} stopped responding while processing {task.file}")
+
+    def status(self):
+        now = time.time()
+        with self.lock:
+            return {
+                'queued': len(self.pending),
+                'leased': sum(1 for task in self.tasks.values() if task.worker),
+                'workers': {name: round(now - seen, 1) for name, seen in self.workers.items()},
+            }
+
+class CoordinatorClient:
+    """Worker-side client for the work coordinator's HTTP API"""
+    def __init__(self, address, token="", timeout=60):
+        host, port = parse_address(address, DEFAULT_COORDINATOR_PORT, default_host="127.0.0.1")
+        self.base_url = f"http://{host}:{port}"
+        self.token = token
+        self.timeout = timeout
+
+    def _open(self, method, path, data=None, headers=None):
+        headers = dict(headers or {})
+        if self.token:
+            headers["X-HKXShift-Token"] = self.token
+        request = urllib.request.Request(self.base_url + path, data=data, method=method, headers=headers)
+        try:
+            return urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read()).get('error', str(e))
+            except:
+                message = str(e)
+            raise ShiftError(message)
+
+    def _request(self, method, path, data):
+        body = json.dumps(data).encode("utf-8")
+        with self._open(method, path, body, {"Content-Type": "application/json"}) as response:
+            return json.loads(response.read())
+
+    def lease(self, worker):
+        return self._request("POST", "/lease", {'worker': worker})['task']
+
+    def download(self, task_id, worker, dest):
+        with self._open("GET", f"/tasks/{task_id}/source?worker={quote(worker)}") as response:
+            with open(dest, "wb") as f:
+                shutil.copyfileobj(response, f)
+
+    def upload(self, task_id, worker, path):
+        with open(path, "rb") as f:
+            headers = {"Content-Type": "application/octet-stream", "Content-Length": str(os.path.getsize(path))}
+            self._open("PUT", f"/tasks/{task_id}/output?worker={quote(worker)}", f, headers).close()
+
+    def heartbeat(self, task_id, worker):
+        self._request("POST", f"/tasks/{task_id}/heartbeat", {'worker': worker})
+
+    def complete(self, task_id, worker, result):
+        self._request("POST", f"/tasks/{task_id}/complete", {'worker': worker, 'result': result})
+
+    def release(self, task_id, worker, error):
+        self._request("POST", f"/tasks/{task_id}/release", {'worker': worker, 'error': error})
@@ -0,0 +1,261 @@
+"""Worker pools, concurrency control and state shared between runs"""
+import os
+import sys
+import threading
+import time
+import contextlib
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from .fileops import ScratchCleaner
+from .caches import AnnotationCache, InventoryCache, ResultCache
+from .stats import RunStatsDB
+from .annotations import AnnotationIndex
+
+class ResizableLimiter:
+    """Semaphore whose limit can change while tasks are waiting on it.
+
+    Also counts completions and hold time, which the concurrency controller
+    reads once per sampling window.
+    """
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_use = 0
+        self.waiting = 0
+        self.completed = 0
+        self.busy_time = 0.0
+        self.condition = threading.Condition()
+
+    def set_limit(self, limit):
+        with self.condition:
+            self.limit = limit
+            self.condition.notify_all()
+
+    @contextlib.contextmanager
+    def slot(self):
+        with self.condition:
+            self.waiting += 1
+            while self.in_use >= self.limit:
+                self.condition.wait()
+            self.waiting -= 1
+            self.in_use += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.in_use -= 1
+                self.completed += 1
+                self.busy_time += time.perf_counter() - started
+                self.condition.notify()
+
+    def take_window(self):
+        """(completions, busy seconds, tasks waiting) since the last call"""
+        with self.condition:
+            window = (self.completed, self.busy_time, self.waiting)
+            self.completed = 0
+            self.busy_time = 0.0
+            return window
+
+def system_cpu_times():
+    """(busy, io wait, total) CPU time counters of the whole machine, or None if unavailable.
+
+    io wait is None where the platform does not report it (Windows).
+    """
+    if sys.platform == "win32":
+        try:
+            import ctypes
+            idle, kernel, user = (ctypes.c_ulonglong(), ctypes.c_ulonglong(), ctypes.c_ulonglong())
+            if ctypes.windll.kernel32.GetSystemTimes(ctypes.byref(idle), ctypes.byref(kernel), ctypes.byref(user)):
+                # Kernel time includes idle time
+                total = kernel.value + user.value
+                return total - idle.value, None, total
+        except (OSError, AttributeError):
+            pass
+        return None
+    try:
+        with open("/proc/stat") as f:
+            values = [int(v) for v in f.readline().split()[1:]]
+    except (OSError, ValueError):
+        return None
+    idle, iowait = values[3], values[4] if len(values) > 4 else 0
+    total = sum(values[:8])
+    return total - idle - iowait, iowait, total
+
+# Concurrency presets: 'fixed' keeps the configured worker count, 'adaptive' tunes it
+# for throughput, 'background' keeps load low while the machine is in use.
+CONCURRENCY_MODES = ('adaptive', 'fixed', 'background')
+
+class ConcurrencyController:
+    """Adapts how many hkanno processes and file copies run at once.
+
+    Work on the shared pool takes a slot from the 'subprocess' or 'io'
+    limiter. Every few seconds the controller compares throughput, CPU
+    utilisation and I/O wait with the previous window and moves each limit
+    one step up or down within its bounds (hill climbing): it grows while
+    tasks are waiting and throughput keeps improving, and backs off when the
+    CPU or disk is saturated or a step up made things slower.
+    """
+    def __init__(self, mode, workers, max_workers, on_change=None, interval=2.0):
+        self.mode = mode
+        self.interval = interval
+        self.on_change = on_change
+        cpus = os.cpu_count() or 2
+        if mode == 'background':
+            self.bounds = {'subprocess': (1, max(1, cpus // 4)), 'io': (1, 2)}
+            self.cpu_high, self.iowait_high = 0.5, 0.1
+        else:
+            self.bounds = {'subprocess': (1, max_workers), 'io': (1, max_workers)}
+            self.cpu_high, self.iowait_high = 0.95, 0.25
+        start = {'subprocess': workers, 'io': workers}
+        if mode == 'background':
+            start = {name: low for name, (low, high) in self.bounds.items()}
+        self.limiters = {name: ResizableLimiter(max(low, min(high, start[name])))
+                         for name, (low, high) in self.bounds.items()}
+        self.previous = {name: None for name in self.limiters}
+        self.last_step = {name: 0 for name in self.limiters}
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def slot(self, name):
+        return self.limiters[name].slot()
+
+    def parallelism(self):
+        return self.limiters['subprocess'].limit
+
+    def start(self):
+        if self.mode == 'fixed':
+            return
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self._worker, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+    def _worker(self):
+        last_times = system_cpu_times()
+        last_tick = time.perf_counter()
+        while not self.stopped.wait(self.interval):
+            times = system_cpu_times()
+            now = time.perf_counter()
+            cpu = iowait = None
+            if times and last_times and times[2] > last_times[2]:
+                total = times[2] - last_times[2]
+                cpu = (times[0] - last_times[0]) / total
+                if times[1] is not None:
+                    iowait = (times[1] - last_times[1]) / total
+            last_times = times
+            elapsed, last_tick = now - last_tick, now
+            for name, limiter in self.limiters.items():
+                self._adjust(name, limiter, elapsed, cpu, iowait)
+
+    def _adjust(self, name, limiter, elapsed, cpu, iowait):
+        completed, busy, waiting = limiter.take_window()
+        throughput = completed / elapsed if elapsed > 0 else 0.0
+        latency = busy / completed if completed else None
+        previous = self.previous[name]
+        self.previous[name] = (throughput, latency)
+        low, high = self.bounds[name]
+        limit = limiter.limit
+        
+        saturated = (cpu is not None and cpu > self.cpu_high) or (iowait is not None and iowait > self.iowait_high)
+        # Where I/O wait is not reported, a sharp rise in per-task latency means the disk is saturated
+        if previous and previous[1] and latency and iowait is None and latency > previous[1] * 2 and throughput <= previous[0]:
+            saturated = True
+        
+        step = 0
+        if saturated and limit > low:
+            step = -1
+        elif previous and self.last_step[name] > 0 and throughput < previous[0] * 0.95 and limit > low:
+            # The last step up made things slower
+            step = -1
+        elif waiting and not saturated and limit < high and self.last_step[name] >= 0:
+            step = 1
+        elif self.last_step[name] < 0:
+            # Hold one window after backing off before probing upwards again
+            self.last_step[name] = 0
+            return
+        self.last_step[name] = step
+        if step:
+            limiter.set_limit(limit + step)
+            if self.on_change:
+                load = f"cpu {cpu * 100:.0f}%" if cpu is not None else "cpu ?"
+                if iowait is not None:
+                    load += f", io wait {iowait * 100:.0f}%"
+                self.on_change(f"⚙️ {name} workers {limit} → {limit + step} ({throughput:.1f} tasks/s, {load})")
+
+class EngineResources:
+    """Worker pool and caches shared by every job run in this process"""
+    def __init__(self, workers=None):
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        # Extra threads only wait on the concurrency limits, so adaptive runs can grow past workers
+        self.max_workers = max(self.workers, 2 * (os.cpu_count() or 2), 4)
+        self.pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="hkxshift-worker")
+        # Pass-through copies get their own threads, so they never wait behind hkanno tasks
+        self.io_pool = ThreadPoolExecutor(max_workers=max(2, min(8, self.workers)), thread_name_prefix="hkxshift-io")
+        self.inventory_cache = InventoryCache()
+        self.annotation_cache = AnnotationCache()
+        self.stats_dbs = {}
+        self.result_caches = {}
+        self.annotation_indexes = {}
+        self.backends = {}  # backend options -> (backend, fallback, description), resolved once
+        self.cleaner = ScratchCleaner()
+        self.lock = threading.Lock()
+        # tracemalloc is process-wide; memory profiles of concurrent jobs share it
+        self.tracing_users = 0
+        self.started_tracing = False
+
+    def start_tracing(self, frames):
+        """Start tracemalloc for a memory profile unless it is already tracing"""
+        with self.lock:
+            if self.tracing_users == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start(frames)
+                self.started_tracing = True
+            self.tracing_users += 1
+
+    def stop_tracing(self):
+        """Stop tracemalloc once the last memory profile is done, if start_tracing() started it"""
+        with self.lock:
+            self.tracing_users -= 1
+            if self.tracing_users == 0 and self.started_tracing:
+                tracemalloc.stop()
+                self.started_tracing = False
+
+    def tracing_shared(self):
+        with self.lock:
+            return self.tracing_users > 1
+
+    def stats_db(self, results_dir):
+        """Run statistics database kept in the results folder"""
+        path = os.path.abspath(os.path.join(results_dir, "HKXShift_stats.sqlite"))
+        with self.lock:
+            if path not in self.stats_dbs:
+                self.stats_dbs[path] = RunStatsDB(path)
+            return self.stats_dbs[path]
+
+    def annotation_index(self, results_dir):
+        """Annotation index kept in the results folder"""
+        path = os.path.abspath(os.path.join(results_dir, "HKXShift_annotations.sqlite"))
+        with self.lock:
+            if path not in self.annotation_indexes:
+                self.annotation_indexes[path] = AnnotationIndex(path)
+            return self.annotation_indexes[path]
+
+    def result_cache(self, results_dir, max_bytes):
+        """Merged-result cache kept in the results folder"""
+        path = os.path.abspath(os.path.join(results_dir, "HKXShift_cache"))
+        with self.lock:
+            if path not in self.result_caches:
+                self.result_caches[path] = ResultCache(path, max_bytes)
+            cache = self.result_caches[path]
+            cache.max_bytes = max_bytes
+            return cache
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        self.io_pool.shutdown(wait=False, cancel_futures=True)
+        self.cleaner.close()
@@ -0,0 +1,116 @@
+"""Preservation rules: files and annotation lines a run leaves untouched"""
+import os
+import re
+import json
+import fnmatch
+import hashlib
+
+from .common import ShiftError
+
+# Built-in patch framework rules. 'equip' also covers 'unequip' files.
+DEFAULT_PRESERVATION_RULES = [
+    {'name': 'SCAR', 'target': 'file', 'match': 'substring', 'pattern': 'scar', 'action': 'preserve'},
+    {'name': 'CPR', 'target': 'file', 'match': 'substring', 'pattern': 'equip', 'action': 'preserve'},
+    {'name': 'SCAR', 'target': 'line', 'match': 'substring', 'pattern': 'SCAR_ActionData', 'action': 'preserve'},
+]
+
+# Optional rules file next to hkanno64.exe:
+# {"rules": [{"name": "MCO", "target": "line", "match": "regex", "pattern": "MCO_", "action": "preserve"}],
+#  "replace_defaults": false}
+RULES_FILE = "hkxshift_rules.json"
+
+class PreservationRules:
+    """Filename and annotation-line rules compiled into one matcher per target.
+
+    Every rule becomes a named lookahead alternative of a single regular
+    expression, so a file name or annotation line is checked against all rules
+    in one match. When several rules match, the first one in rule order wins
+    (built-in rules before those from the rules file, SCAR before CPR).
+    Actions: 'preserve' copies a file (or keeps a line) unchanged, 'skip'
+    leaves the file out of the output (or drops the line).
+    """
+    TARGETS = ('file', 'line')
+    MATCHES = ('substring', 'glob', 'regex')
+    ACTIONS = ('preserve', 'skip')
+    # Group names of the alternatives; user patterns may not use names of this form
+    GROUP_NAME = re.compile(r"_rule\d+")
+    # \1 or (?(1)...) after an even number of backslashes: group numbers shift once rules are combined
+    NUMBERED_REFERENCE = re.compile(r"(?<!\\)(?:\\\\)*(?:\\[1-9]|\(\?\(\d+\))")
+
+    def __init__(self, rules):
+        self.rules = []
+        parts = {target: [] for target in self.TARGETS}
+        for rule in rules:
+            rule = dict(rule)
+            rule.setdefault('name', rule.get('pattern', ''))
+            rule.setdefault('match', 'substring')
+            rule.setdefault('action', 'preserve')
+            # File names have always matched case-insensitively, annotation lines exactly
+            rule.setdefault('ignore_case', rule.get('target') == 'file')
+            if rule.get('target') not in self.TARGETS or rule['match'] not in self.MATCHES \
+                    or rule['action'] not in self.ACTIONS or not rule.get('pattern'):
+                raise ShiftError(f"Invalid preservation rule: {json.dumps(rule)}")
+            parts[rule['target']].append(fr"(?=[\s\S]*?(?P<_rule{len(self.rules)}>{self._compile_rule(rule)}))")
+            self.rules.append(rule)
+        try:
+            self.patterns = {target: re.compile("|".join(parts[target])) if parts[target] else None
+                             for target in self.TARGETS}
+        except re.error as e:
+            raise ShiftError(f"Could not combine the preservation rules: {e}")
+        self.id = hashlib.sha256(json.dumps(self.rules, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+    @staticmethod
+    def _compile_rule(rule):
+        pattern = rule['pattern']
+        if rule['match'] == 'substring':
+            body = re.escape(pattern)
+        elif rule['match'] == 'glob':
+            # Globs match the whole name or line (ignoring the line ending)
+            body = "^" + fnmatch.translate(pattern)[:-2] + r"\r?\n?\Z"
+        else:
+            body = pattern
+        try:
+            compiled = re.compile(body)
+        except re.error as e:
+            raise ShiftError(f"Invalid pattern in preservation rule {rule['name']}: {e}")
+        if compiled.flags & ~re.UNICODE:
+            raise ShiftError(f"Invalid pattern in preservation rule {rule['name']}: global flags like (?i) "
+                             "are not supported, use a group like (?i:...) or \"ignore_case\"")
+        if PreservationRules.NUMBERED_REFERENCE.search(body):
+            raise ShiftError(f"Invalid pattern in preservation rule {rule['name']}: refer to groups by name, "
+                             "e.g. (?P<tag>...) and (?P=tag), not by number")
+        if any(PreservationRules.GROUP_NAME.fullmatch(name) for name in compiled.groupindex):
+            raise ShiftError(f"Invalid pattern in preservation rule {rule['name']}: group names like _rule0 are reserved")
+        return f"(?i:{body})" if rule['ignore_case'] else f"(?:{body})"
+
+    @classmethod
+    def load(cls, path=""):
+        """Built-in rules plus any from the rules file (default: hkxshift_rules.json if present)"""
+        path = path or RULES_FILE
+        rules = list(DEFAULT_PRESERVATION_RULES)
+        if os.path.isfile(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    config = json.load(f)
+            except (OSError, ValueError) as e:
+                raise ShiftError(f"Could not read preservation rules from {path}: {e}")
+            if config.get('replace_defaults'):
+                rules = []
+            rules.extend(config.get('rules', []))
+        elif path != RULES_FILE:
+            raise ShiftError(f"Preservation rules file not found: {path}")
+        return cls(rules)
+
+    def match(self, target, text):
+        """Return the rule matching text, or None"""
+        pattern = self.patterns[target]
+        if pattern is None:
+            return None
+        m = pattern.match(text)
+        return self.rules[int(m.lastgroup[5:])] if m else None
+
+    def match_file(self, filename):
+        return self.match('file', filename)
+
+    def match_line(self, line):
+        return self.match('line', line)
@@ -0,0 +1,252 @@
+"""Local job server and its client"""
+import os
+import threading
+import queue
+import time
+import json
+import urllib.request
+import urllib.error
+from collections import OrderedDict, deque
+from http.server import ThreadingHTTPServer
+
+from .common import DEFAULT_OPTIONS, DEFAULT_SERVER_PORT, SERVER_OPTIONS, ShiftError, is_loopback, validate_job
+from .resources import EngineResources
+from .engine import ShiftEngine
+from .metrics import render_metrics
+from .handlers import JobRequestHandler
+
+class ServerJob:
+    """A job queued on the local job server"""
+    def __init__(self, job_id, source, multiplier, options):
+        self.id = job_id
+        self.source = source
+        self.multiplier = multiplier
+        self.options = options
+        self.state = "queued"
+        self.progress = 0.0
+        self.message = "Queued"
+        self.summary = None
+        self.error = None
+        self.engine = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.log_lines = deque(maxlen=5000)
+        self.log_count = 0
+        self.lock = threading.Lock()
+
+    def add_log(self, formatted_message, message, debug):
+        with self.lock:
+            self.log_lines.append([formatted_message, message, debug])
+            self.log_count += 1
+        if not debug and message.strip():
+            self.message = message.strip()
+
+    def set_progress(self, value, message=None):
+        self.progress = value
+        if message:
+            self.message = message
+
+    def to_dict(self, since=None):
+        """JSON-friendly status; log lines from index `since` onwards are included when given"""
+        with self.lock:
+            data = {
+                'id': self.id,
+                'source': self.source,
+                'multiplier': self.multiplier,
+                'options': self.options,
+                'state': self.state,
+                'progress': self.progress,
+                'message': self.message,
+                'summary': self.summary,
+                'error': self.error,
+                'submitted': self.submitted,
+                'started': self.started,
+                'finished': self.finished,
+            }
+            if since is not None:
+                first = self.log_count - len(self.log_lines)
+                data['log'] = list(self.log_lines)[max(0, since - first):]
+                data['log_next'] = self.log_count
+        return data
+
+class JobServer:
+    """Local job server.
+
+    Jobs from any number of clients are queued and run on one EngineResources, so
+    the worker pool and the inventory/annotation caches stay warm between jobs.
+
+    `options` holds the server-side settings (SERVER_OPTIONS) that every job runs with;
+    clients can only choose the rest. Listening beyond localhost needs a token.
+    """
+    MAX_FINISHED_JOBS = 200
+
+    def __init__(self, host="127.0.0.1", port=DEFAULT_SERVER_PORT, workers=None, concurrent_jobs=2, token="",
+                 options=None):
+        if not token and not is_loopback(host):
+            # Anyone who can reach the port could run jobs on this machine's folders
+            raise ShiftError(f"Serving on {host} needs a token that clients send with --token")
+        self.options = dict(options or {})
+        self.resources = EngineResources(workers)
+        self.jobs = OrderedDict()
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.next_id = 1
+        self.runners = [threading.Thread(target=self._runner, daemon=True) for _ in range(max(1, concurrent_jobs))]
+        self.httpd = ThreadingHTTPServer((host, port), JobRequestHandler)
+        self.httpd.job_server = self
+        self.httpd.token = token
+        self.httpd.loopback = is_loopback(host)
+
+    def submit(self, source, multiplier, options=None):
+        options = options or {}
+        refused = sorted(set(options) - set(DEFAULT_OPTIONS) | set(options) & set(SERVER_OPTIONS))
+        if refused:
+            raise ShiftError(f"Options not accepted from clients: {', '.join(refused)}")
+        options = dict(DEFAULT_OPTIONS, **options, **self.options)
+        validate_job(source, multiplier, check_hkanno=not options['coordinator'] and options['backend'] in ('auto', 'hkanno'),
+                     hkanno_path=options['hkanno_path'])
+        with self.lock:
+            job = ServerJob(str(self.next_id), source, multiplier, options)
+            self.next_id += 1
+            self.jobs[job.id] = job
+            
+            # Forget the oldest finished jobs
+            finished = [j for j in self.jobs.values() if j.finished]
+            for old in finished[:max(0, len(finished) - self.MAX_FINISHED_JOBS)]:
+                del self.jobs[old.id]
+        self.queue.put(job)
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list_jobs(self):
+        with self.lock:
+            jobs = list(self.jobs.values())
+        return [job.to_dict() for job in jobs]
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is None:
+            return None
+        if job.state == "queued":
+            job.state = "cancelled"
+            job.finished = time.time()
+        elif job.state == "running" and job.engine:
+            job.engine.cancel()
+        return job
+
+    def status(self):
+        cache = self.resources
+        return {
+            'workers': cache.workers,
+            'queued': self.queue.qsize(),
+            'running': sum(1 for job in list(self.jobs.values()) if job.state == "running"),
+            'inventory_cache': {'hits': cache.inventory_cache.hits, 'misses': cache.inventory_cache.misses},
+            'annotation_cache': {'hits': cache.annotation_cache.hits, 'misses': cache.annotation_cache.misses,
+                                 'entries': len(cache.annotation_cache.entries)},
+        }
+
+    def metrics(self):
+        """Prometheus page for the running jobs and the queue"""
+        with self.lock:
+            jobs = list(self.jobs.values())
+        runs = [({'job': job.id}, job.engine) for job in jobs if job.state == "running" and job.engine]
+        
+        def server_metrics(metrics):
+            metrics.add("hkxshift_queue_depth", "gauge", "Tasks waiting", self.queue.qsize(), {'queue': "jobs"})
+            for state in ("queued", "running", "done", "failed", "cancelled"):
+                metrics.add("hkxshift_jobs", "gauge", "Known jobs by state",
+                            sum(1 for job in jobs if job.state == state), {'state': state})
+        return render_metrics(runs, self.resources, server_metrics)
+
+    def _runner(self):
+        while True:
+            job = self.queue.get()
+            if job.state == "cancelled":
+                continue
+            job.state = "running"
+            job.started = time.time()
+            job.engine = ShiftEngine(self.resources, on_log=job.add_log, on_progress=job.set_progress)
+            try:
+                job.summary = job.engine.run(job.source, job.multiplier, job.options)
+                job.state = "cancelled" if job.summary['cancelled'] else "done"
+                job.progress = 100.0
+                job.message = "Complete!"
+            except ShiftError as e:
+                job.state = "failed"
+                job.error = str(e)
+            except Exception as e:
+                job.state = "failed"
+                job.error = f"Unexpected error: {str(e)}"
+            job.finished = time.time()
+
+    def serve_forever(self):
+        for runner in self.runners:
+            runner.start()
+        try:
+            self.httpd.serve_forever()
+        finally:
+            self.httpd.server_close()
+            self.resources.shutdown()
+
+class JobClient:
+    """Client for the job server's HTTP API"""
+    def __init__(self, host="127.0.0.1", port=DEFAULT_SERVER_PORT, token="", timeout=10):
+        self.base_url = f"http://{host}:{port}"
+        self.token = token
+        self.timeout = timeout
+
+    def _request(self, method, path, data=None):
+        body = json.dumps(data).encode("utf-8") if data is not None else None
+        headers = {"Content-Type": "application/json"}
+        if self.token:
+            headers["X-HKXShift-Token"] = self.token
+        request = urllib.request.Request(self.base_url + path, data=body, method=method, headers=headers)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read()).get('error', str(e))
+            except:
+                message = str(e)
+            raise ShiftError(message)
+
+    def submit(self, source, multiplier, options=None):
+        return self._request("POST", "/jobs", {'source': os.path.abspath(source), 'multiplier': multiplier,
+                                               'options': options or {}})
+
+    def job(self, job_id, since=None):
+        query = f"?since={since}" if since is not None else ""
+        return self._request("GET", f"/jobs/{job_id}{query}")
+
+    def jobs(self):
+        return self._request("GET", "/jobs")['jobs']
+
+    def cancel(self, job_id):
+        return self._request("POST", f"/jobs/{job_id}/cancel", {})
+
+    def status(self):
+        return self._request("GET", "/status")
+
+    def follow(self, job_id, on_log=None, on_progress=None, should_cancel=None, interval=0.5):
+        """Poll a job until it finishes, streaming its log lines and progress"""
+        since = 0
+        cancel_sent = False
+        while True:
+            status = self.job(job_id, since)
+            since = status['log_next']
+            if on_log:
+                for formatted_message, message, debug in status['log']:
+                    on_log(formatted_message, message, debug)
+            if on_progress:
+                on_progress(status['progress'], status['message'])
+            if status['state'] in ("done", "failed", "cancelled"):
+                return status
+            if should_cancel and should_cancel() and not cancel_sent:
+                self.cancel(job_id)
+                cancel_sent = True
+            time.sleep(interval)
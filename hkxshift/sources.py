@@ -0,0 +1,179 @@
+"""Source trees: plain folders and zip archives, read without extracting them"""
+import os
+import shutil
+import time
+import zipfile
+import hashlib
+
+from .common import is_zip_archive
+from .fileops import fast_copy
+
+class FolderSource:
+    """Source tree backed by a folder on disk.
+
+    Paths passed to the methods are relative to the source root ("" is the root).
+    """
+    def __init__(self, path):
+        self.path = path
+        self.base = os.path.basename(os.path.normpath(path))
+
+    def full_path(self, rel):
+        return os.path.join(self.path, rel) if rel else self.path
+
+    def identity(self, rel):
+        """Hashable key that changes whenever the file changes"""
+        path = self.full_path(rel)
+        stat = os.stat(path)
+        return (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+    def display_path(self, rel=""):
+        return self.full_path(rel)
+
+    def listdir(self, rel=""):
+        return os.listdir(self.full_path(rel))
+
+    def isdir(self, rel):
+        return os.path.isdir(self.full_path(rel))
+
+    def isfile(self, rel):
+        return os.path.isfile(self.full_path(rel))
+
+    def getsize(self, rel):
+        return os.path.getsize(self.full_path(rel))
+
+    def walk(self):
+        """Yield (relative dir, files) for every directory in the source"""
+        for root, dirs, files in os.walk(self.path):
+            rel_path = os.path.relpath(root, self.path)
+            yield ('' if rel_path == '.' else rel_path), files
+
+    def open(self, rel):
+        return open(self.full_path(rel), "rb")
+
+    def copy_file(self, rel, dest):
+        return fast_copy(self.full_path(rel), dest)
+
+    def close(self):
+        pass
+
+class ZipSource:
+    """Source tree backed by a zip archive, read member by member without extraction.
+
+    If the archive wraps everything in a chain of single folders (e.g. "ModName/"),
+    the innermost of those folders is used as the root.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.base = os.path.splitext(os.path.basename(path))[0]
+        self.archive = zipfile.ZipFile(path)
+        self.members = {}  # relative path -> ZipInfo
+        self.children = {'': set()}  # relative dir -> entry names
+        self.subdirs = {''}
+
+        for info in self.archive.infolist():
+            name = info.filename.replace("\\", "/").strip("/")
+            if not name:
+                continue
+            parts = name.split("/")
+            for i in range(len(parts)):
+                parent = "/".join(parts[:i])
+                self.children.setdefault(parent, set()).add(parts[i])
+                if i < len(parts) - 1 or info.is_dir():
+                    sub = "/".join(parts[:i + 1])
+                    self.subdirs.add(sub)
+                    self.children.setdefault(sub, set())
+            if not info.is_dir():
+                self.members[name] = info
+
+        # Unwrap single top-level folders
+        self.root = ''
+        while True:
+            entries = self.children.get(self.root, set())
+            if len(entries) != 1:
+                break
+            only = self._join(self.root, next(iter(entries)))
+            if only not in self.subdirs:
+                break
+            self.root = only
+
+    @staticmethod
+    def _join(*parts):
+        return "/".join(p.replace("\\", "/").strip("/") for p in parts if p and p != ".")
+
+    def _name(self, rel):
+        return self._join(self.root, rel)
+
+    def identity(self, rel):
+        """Hashable key that changes whenever the member changes"""
+        info = self.members[self._name(rel)]
+        return (os.path.abspath(self.path), info.filename, info.CRC, info.file_size)
+
+    def display_path(self, rel=""):
+        name = self._name(rel)
+        return f"{self.path}:{name}" if name else self.path
+
+    def listdir(self, rel=""):
+        name = self._name(rel)
+        if name not in self.subdirs:
+            raise FileNotFoundError(f"No such folder in archive: {self.display_path(rel)}")
+        return sorted(self.children[name])
+
+    def isdir(self, rel):
+        return self._name(rel) in self.subdirs
+
+    def isfile(self, rel):
+        return self._name(rel) in self.members
+
+    def getsize(self, rel):
+        return self.members[self._name(rel)].file_size
+
+    def walk(self):
+        """Yield (relative dir, files) for every directory in the source"""
+        prefix = self.root + "/" if self.root else ""
+        for sub in sorted(self.subdirs):
+            if self.root and sub != self.root and not sub.startswith(prefix):
+                continue
+            files = [n for n in sorted(self.children[sub]) if self._join(sub, n) in self.members]
+            rel = sub[len(prefix):] if sub != self.root else ''
+            yield rel, files
+
+    def open(self, rel):
+        return self.archive.open(self.members[self._name(rel)])
+
+    def copy_file(self, rel, dest):
+        """Stream a single member to dest, keeping its timestamp"""
+        info = self.members[self._name(rel)]
+        with self.archive.open(info) as src, open(dest, "wb") as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        mtime = time.mktime(info.date_time + (0, 0, -1))
+        os.utime(dest, (mtime, mtime))
+
+    def close(self):
+        self.archive.close()
+
+def stream_sha256(stream, chunk_size=1024 * 1024):
+    """SHA-256 of an open binary stream, read in chunks"""
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(chunk_size), b""):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+def hash_source_file(source_tree, rel):
+    """SHA-256 of a source file or archive member"""
+    with source_tree.open(rel) as stream:
+        return stream_sha256(stream)
+
+def file_sha256(path):
+    with open(path, "rb") as stream:
+        return stream_sha256(stream)
+
+def describe_file(path):
+    """Manifest entry of a backed up file"""
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': file_sha256(path)}
+
+def open_source(path):
+    """Open a source folder or zip archive"""
+    if is_zip_archive(path):
+        return ZipSource(path)
+    return FolderSource(path)
@@ -0,0 +1,96 @@
+"""Per-file stage timings of earlier runs, used to predict run time"""
+import threading
+import sqlite3
+
+# Per-file stage costs in seconds, used until the stats database has history
+STAGES = ('dump', 'rescale', 'merge')
+DEFAULT_STAGE_COSTS = {'dump': 0.25, 'rescale': 0.01, 'merge': 0.25}
+
+def format_duration(seconds):
+    """Format a duration for status messages (e.g. "45s", "3m 12s", "1h 05m")"""
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m {seconds % 60:02d}s"
+    return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+
+def fit_stage_model(rows, default):
+    """Least-squares fit of duration = fixed + per_byte * size over (size, duration) rows"""
+    if not rows:
+        return (default, 0.0)
+    n = len(rows)
+    mean_size = sum(size for size, _ in rows) / n
+    mean_duration = sum(duration for _, duration in rows) / n
+    variance = sum((size - mean_size) ** 2 for size, _ in rows)
+    if n < 3 or variance == 0:
+        return (mean_duration, 0.0)
+    per_byte = sum((size - mean_size) * (duration - mean_duration) for size, duration in rows) / variance
+    per_byte = max(0.0, per_byte)
+    fixed = max(0.0, mean_duration - per_byte * mean_size)
+    return (fixed, per_byte)
+
+class RunStatsDB:
+    """SQLite history of per-file, per-stage durations from earlier runs.
+
+    Used to predict how long each file will take, so progress and the remaining
+    time reflect real stage costs and known-expensive files can be started first.
+    """
+    HISTORY_LIMIT = 5000
+
+    def __init__(self, path):
+        self.path = path
+        self.models = None
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, started REAL, source TEXT, "
+                              "multiplier REAL, files INTEGER, duration REAL)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS stage_times (run_id INTEGER, file TEXT, stage TEXT, "
+                              "size INTEGER, duration REAL)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS stage_times_file ON stage_times (file, stage)")
+
+    def _fit(self):
+        models = {}
+        for stage in STAGES:
+            rows = self.conn.execute("SELECT size, duration FROM stage_times WHERE stage = ? "
+                                     "ORDER BY rowid DESC LIMIT ?", (stage, self.HISTORY_LIMIT)).fetchall()
+            models[stage] = fit_stage_model(rows, DEFAULT_STAGE_COSTS[stage])
+        return models
+
+    def predict(self, files):
+        """Return predicted {stage: seconds} for each (file key, size) pair.
+
+        A file's own history is used when it was seen before at the same size,
+        otherwise the per-stage size model fitted over all recent history.
+        """
+        with self.lock:
+            if self.models is None:
+                self.models = self._fit()
+            history = {}
+            keys = [key for key, _ in files]
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = self.conn.execute(
+                    f"SELECT file, size, stage, AVG(duration) FROM stage_times WHERE file IN "
+                    f"({', '.join('?' * len(chunk))}) GROUP BY file, size, stage", chunk).fetchall()
+                for key, size, stage, duration in rows:
+                    history[(key, size, stage)] = duration
+
+        predictions = []
+        for key, size in files:
+            costs = {}
+            for stage in STAGES:
+                fixed, per_byte = self.models[stage]
+                costs[stage] = history.get((key, size, stage), fixed + per_byte * size)
+            predictions.append(costs)
+        return predictions
+
+    def record_run(self, started, source, multiplier, files, duration, timings):
+        """Store a finished run and its (file key, stage, size, seconds) timings"""
+        with self.lock, self.conn:
+            cursor = self.conn.execute("INSERT INTO runs (started, source, multiplier, files, duration) "
+                                       "VALUES (?, ?, ?, ?, ?)", (started, source, multiplier, files, duration))
+            self.conn.executemany("INSERT INTO stage_times (run_id, file, stage, size, duration) VALUES (?, ?, ?, ?, ?)",
+                                  [(cursor.lastrowid,) + timing for timing in timings])
+            self.models = None
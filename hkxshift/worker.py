@@ -0,0 +1,116 @@
+"""Worker process of a coordinated run"""
+import os
+import shutil
+import threading
+import socket
+import tempfile
+
+from .common import ShiftError
+from .resources import EngineResources
+from .engine import ShiftEngine
+from .remote import CoordinatorClient, WorkCoordinator
+
+class RemoteWorker:
+    """Worker process of a coordinated run.
+
+    Each worker thread leases one file at a time from the coordinator,
+    processes it with the annotation backend the coordinator asks for and
+    sends back the merged HKX together with its log lines and summary
+    counters. Leases of files in progress are renewed until they are done.
+    hkanno_path and hkanno_wrapper, when given, replace the coordinator's
+    hkanno settings, which name paths on the coordinator's machine.
+    """
+    def __init__(self, address, workers=None, token="", scratch_dir="HKXShift_worker", name=None,
+                 on_log=None, poll_interval=1.0, hkanno_path="", hkanno_wrapper=""):
+        self.address = address
+        self.overrides = {key: value for key, value in (('hkanno_path', hkanno_path), ('hkanno_wrapper', hkanno_wrapper))
+                          if value}
+        self.client = CoordinatorClient(address, token)
+        self.resources = EngineResources(workers)
+        self.scratch_dir = scratch_dir
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.on_log = on_log
+        self.poll_interval = poll_interval
+        self.active = set()
+        self.connected = None
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+
+    def log(self, message):
+        if self.on_log:
+            self.on_log(message)
+
+    def set_connected(self, connected, reason=""):
+        """Log connection changes once, not once per worker thread"""
+        with self.lock:
+            changed = connected != self.connected
+            self.connected = connected
+        if changed and connected:
+            self.log(f"🌐 Connected to coordinator {self.address}")
+        elif changed:
+            self.log(f"⏳ Waiting for coordinator {self.address} ({reason})")
+
+    def serve_forever(self):
+        os.makedirs(self.scratch_dir, exist_ok=True)
+        threads = [threading.Thread(target=self._loop, daemon=True) for _ in range(self.resources.workers)]
+        for thread in threads:
+            thread.start()
+        try:
+            while not self.stopping.wait(WorkCoordinator.LEASE_SECONDS / 3):
+                with self.lock:
+                    active = list(self.active)
+                for task_id in active:
+                    try:
+                        self.client.heartbeat(task_id, self.name)
+                    except (ShiftError, OSError):
+                        pass
+        finally:
+            self.stopping.set()
+            self.resources.shutdown()
+
+    def stop(self):
+        self.stopping.set()
+
+    def _loop(self):
+        while not self.stopping.is_set():
+            try:
+                task = self.client.lease(self.name)
+            except (ShiftError, OSError, ValueError) as e:
+                self.set_connected(False, str(e))
+                self.stopping.wait(self.poll_interval * 5)
+                continue
+            self.set_connected(True)
+            if task is None:
+                self.stopping.wait(self.poll_interval)
+                continue
+            self.process(task)
+
+    def process(self, task):
+        """Download, process and upload one leased file"""
+        name = f"{task['subname']}/{task['file']}"
+        with self.lock:
+            self.active.add(task['id'])
+        work_dir = tempfile.mkdtemp(prefix=f"task{task['id']}-", dir=self.scratch_dir)
+        try:
+            source_dir = os.path.join(work_dir, "source")
+            os.makedirs(source_dir)
+            self.client.download(task['id'], self.name, os.path.join(source_dir, task['file']))
+            
+            console = []
+            engine = ShiftEngine(self.resources, on_log=lambda *line: console.append(line), results_dir=work_dir)
+            output, result = engine.run_task(dict(task, **self.overrides), source_dir, work_dir)
+            if output:
+                self.client.upload(task['id'], self.name, output)
+            result.update(ok=output is not None, console=console, worker=self.name)
+            self.client.complete(task['id'], self.name, result)
+            self.log(f"{'✅' if output else '⚠️'} {name}")
+        except (ShiftError, OSError, ValueError) as e:
+            self.log(f"⚠️ Giving back {name}: {str(e)}")
+            try:
+                self.client.release(task['id'], self.name, str(e))
+            except (ShiftError, OSError):
+                pass
+        finally:
+            with self.lock:
+                self.active.discard(task['id'])
+            shutil.rmtree(work_dir, ignore_errors=True)
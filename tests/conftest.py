@@ -0,0 +1,55 @@
+import os
+import sys
+
+import pytest
+
+from hkxshift.resources import EngineResources
+from hkxshift.engine import ShiftEngine
+
+from packfiles import build_packfile
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+
+@pytest.fixture
+def write_packfile():
+    def write(path, *args, **kwargs):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(build_packfile(*args, **kwargs))
+        return path
+    return write
+
+@pytest.fixture
+def source_tree(tmp_path, write_packfile):
+    """A batch source with two movesets of packfiles"""
+    source = tmp_path / "Animations"
+    write_packfile(str(source / "MovesetA" / "atk1.hkx"))
+    write_packfile(str(source / "MovesetA" / "atk2.hkx"), [[(0.25, "HitFrame")]])
+    write_packfile(str(source / "MovesetB" / "idle.hkx"), [[(0.0, "Start"), (1.0, "Loop")]])
+    return source
+
+@pytest.fixture
+def hkanno(tmp_path, monkeypatch):
+    """hkanno64.exe in the current directory (tmp_path), running the stand-in from packfiles.py"""
+    if os.name == "nt":
+        pytest.skip("the hkanno stand-in is a script with a shebang line")
+    path = tmp_path / "hkanno64.exe"
+    path.write_text(f"#!{sys.executable}\nimport sys\nsys.path.insert(0, {TESTS!r})\n"
+                    "from packfiles import hkanno\nsys.exit(hkanno(sys.argv[1:]))\n")
+    path.chmod(0o755)
+    # It is started by name, so it has to be on PATH as well
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ.get('PATH', '')}")
+    monkeypatch.chdir(tmp_path)
+    return path
+
+@pytest.fixture
+def resources():
+    resources = EngineResources(2)
+    yield resources
+    resources.shutdown()
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch, resources):
+    # hkanno64.exe is looked up in the current directory
+    monkeypatch.chdir(tmp_path)
+    return ShiftEngine(resources, results_dir=str(tmp_path / "results"))
@@ -0,0 +1,119 @@
+"""Packfile test data, and a stand-in for hkanno64.exe that dumps and updates it.
+
+The stand-in only understands files written by build_packfile; conftest's hkanno
+fixture installs it as hkanno64.exe.
+"""
+import struct
+import sys
+
+ANNOTATIONS = [[(0.1, "HitFrame"), (0.5, "SCAR_ActionData{}"), (1.0, "SoundPlay.WPNSwing")], [], [(1.2, "animEnd")]]
+
+def build_packfile(tracks=ANNOTATIONS, duration=2.0, frames=61, class_name="hkaSplineCompressedAnimation"):
+    """Smallest 64-bit packfile holding one animation object with the given annotation tracks.
+
+    tracks is a list of [(time, text)] per annotation track.
+    """
+    data = bytearray(64)  # The animation object, at offset 0 of __data__
+    struct.pack_into("<f", data, 20, duration)
+    struct.pack_into("<i", data, 56, frames)
+    fixups = []
+    tracks_at = len(data)
+    data += bytearray(24 * len(tracks))
+    struct.pack_into("<i", data, 48, len(tracks))
+    fixups.append((40, tracks_at))
+    for index, annotations in enumerate(tracks):
+        track = tracks_at + index * 24
+        if not annotations:
+            continue
+        entries = len(data)
+        data += bytearray(16 * len(annotations))
+        struct.pack_into("<i", data, track + 16, len(annotations))
+        fixups.append((track + 8, entries))
+        for entry, (time_value, text) in enumerate(annotations):
+            at = entries + entry * 16
+            struct.pack_into("<f", data, at, time_value)
+            fixups.append((at + 8, len(data)))
+            data += text.encode("utf-8") + b"\0"
+    while len(data) % 16:
+        data += b"\0"
+    local_fixups = len(data)
+    for src, dst in fixups:
+        data += struct.pack("<2I", src, dst)
+    data += struct.pack("<2I", 0xFFFFFFFF, 0xFFFFFFFF)
+    global_fixups = virtual_fixups = len(data)
+    data += struct.pack("<3I", 0, 1, 0)
+    exports = len(data)
+    
+    names = class_name.encode("ascii") + b"\0"
+    header = bytearray(64 + 2 * 48)
+    struct.pack_into("<2I", header, 0, 0x57E0E057, 0x10C0C010)
+    struct.pack_into("<i", header, 12, 8)
+    header[16], header[17] = 8, 1
+    struct.pack_into("<i", header, 20, 2)
+    names_start = len(header)
+    data_start = names_start + len(names)
+    header[64:78] = b"__classnames__"
+    struct.pack_into("<7I", header, 84, names_start, *[len(names)] * 6)
+    header[112:120] = b"__data__"
+    struct.pack_into("<7I", header, 132, data_start, local_fixups, global_fixups, virtual_fixups,
+                     exports, exports, exports)
+    return bytes(header) + names + bytes(data)
+
+
+def read_packfile(data):
+    """(tracks, duration, frames, class_name) of a packfile written by build_packfile"""
+    names_start, = struct.unpack_from("<I", data, 84)
+    class_name = data[names_start:data.index(b"\0", names_start)].decode("ascii")
+    data_start, local_fixups = struct.unpack_from("<2I", data, 132)
+    section = data[data_start:]
+    fixups = {}
+    at = local_fixups
+    while True:
+        src, dst = struct.unpack_from("<2I", section, at)
+        if src == 0xFFFFFFFF:
+            break
+        fixups[src] = dst
+        at += 8
+    duration, = struct.unpack_from("<f", section, 20)
+    track_count, frames = struct.unpack_from("<i", section, 48)[0], struct.unpack_from("<i", section, 56)[0]
+    tracks = []
+    for index in range(track_count):
+        track = fixups[40] + index * 24
+        annotations = []
+        for entry in range(struct.unpack_from("<i", section, track + 16)[0]):
+            at = fixups[track + 8] + entry * 16
+            text_at = fixups[at + 8]
+            text = section[text_at:section.index(b"\0", text_at)].decode("utf-8")
+            annotations.append((struct.unpack_from("<f", section, at)[0], text))
+        tracks.append(annotations)
+    return tracks, duration, frames, class_name
+
+def hkanno(argv):
+    """hkanno64.exe "dump -o OUT HKX" and "update -i ANNO HKX" on build_packfile files"""
+    command, _, text_path, hkx = argv
+    try:
+        with open(hkx, "rb") as f:
+            tracks, duration, frames, class_name = read_packfile(f.read())
+    except (OSError, ValueError, KeyError, struct.error) as e:
+        print(f"ERROR: cannot load {hkx}: {e}", file=sys.stderr)
+        return 1
+    if command == "dump":
+        with open(text_path, "w", encoding="utf-8") as f:
+            f.write(f"# numOriginalFrames: {frames}\n")
+            f.write(f"# duration: {duration:.6f}\n")
+            f.write(f"# numAnnotationTracks: {len(tracks)}\n")
+            for annotations in tracks:
+                f.write(f"# numAnnotations: {len(annotations)}\n")
+                f.writelines(f"{time_value:.6f} {text}\n" for time_value, text in annotations)
+        return 0
+    tracks = []
+    with open(text_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("# numAnnotations:"):
+                tracks.append([])
+            elif not line.startswith("#") and line.strip():
+                time_value, text = line.rstrip("\n").split(" ", 1)
+                tracks[-1].append((float(time_value), text))
+    with open(hkx, "wb") as f:
+        f.write(build_packfile(tracks, duration, frames, class_name))
+    return 0
@@ -0,0 +1,38 @@
+from hkxshift.annotations import AnnotationIndex, parse_annotation_dump
+
+def test_parse_annotation_dump():
+    content = ("# numOriginalFrames: 61\n# duration: 2.000000\n# numAnnotationTracks: 3\n"
+               "# numAnnotations: 2\n0.100000 HitFrame\n0.500000 SCAR_ActionData{ a b }\n"
+               "# numAnnotations: 0\n# numAnnotations: 1\n1.200000 animEnd\n")
+    assert parse_annotation_dump(content) == [(0, 0.1, "HitFrame"), (0, 0.5, "SCAR_ActionData{ a b }"), (2, 1.2, "animEnd")]
+
+def index(engine, source_tree, tmp_path):
+    summary = engine.index_source(str(source_tree))
+    return summary, AnnotationIndex(str(tmp_path / "results" / "HKXShift_annotations.sqlite"))
+
+def test_index_and_query(engine, hkanno, source_tree, tmp_path):
+    summary, annotations = index(engine, source_tree, tmp_path)
+    assert (summary['indexed'], summary['unchanged'], summary['failed']) == (3, 0, 0)
+    assert annotations.counts() == (3, 7)
+    rows = annotations.query("HitFrame")
+    assert sorted((path.split("|")[-1], track, round(at, 6)) for path, track, at, _, _ in rows) == [
+        ("MovesetA/atk1.hkx", 0, 0.1), ("MovesetA/atk2.hkx", 0, 0.25)]
+    assert [text for _, _, _, text, _ in annotations.query(min_time=1.1)] == ["animEnd"]
+    assert [text for _, _, _, text, _ in annotations.query(path="*MovesetB/*")] == ["Start", "Loop"]
+    # Text that is not valid query syntax is searched as written
+    assert len(annotations.query('SCAR_ActionData{')) == 1
+    per_file = annotations.query("Sound*", files=True)
+    assert [(path.split("|")[-1], count) for path, _, _, count, _ in per_file] == [("MovesetA/atk1.hkx", 1)]
+
+def test_only_changed_files_are_indexed_again(engine, hkanno, source_tree, tmp_path, write_packfile):
+    index(engine, source_tree, tmp_path)
+    (source_tree / "MovesetA" / "atk2.hkx").unlink()
+    write_packfile(str(source_tree / "MovesetB" / "idle.hkx"), [[(0.0, "Start"), (1.0, "Loop"), (1.5, "End")]])
+    summary, annotations = index(engine, source_tree, tmp_path)
+    assert (summary['indexed'], summary['unchanged'], summary['removed']) == (1, 1, 1)
+    assert annotations.counts() == (2, 7)
+    assert annotations.query("End")
+
+def test_runs_can_index_their_dumps(engine, hkanno, source_tree, tmp_path):
+    engine.run(str(source_tree), 1.5, {'annotation_index': True})
+    assert AnnotationIndex(str(tmp_path / "results" / "HKXShift_annotations.sqlite")).counts() == (3, 7)
@@ -0,0 +1,37 @@
+import os
+
+import pytest
+
+from hkxshift.common import ShiftError
+
+def test_packfile_backend_needs_no_hkanno(engine, source_tree, tmp_path):
+    summary = engine.run(str(source_tree), 1.5, {'backend': 'packfile'})
+    assert (summary['merged'], summary['failed']) == (3, 0)
+    assert summary['backend'] == "packfile"
+
+def test_auto_calibrates_once_per_process(engine, hkanno, source_tree):
+    first = engine.run(str(source_tree), 1.5)
+    assert first['backend'].split()[0] in ("hkanno", "packfile")
+    assert "calibrated" in first['backend']
+    second = engine.run(str(source_tree), 0.8)
+    assert second['backend'] == first['backend']
+
+def test_stub_results_are_not_cached(engine, source_tree, tmp_path):
+    options = {'backend': 'stub', 'result_cache': True}
+    engine.run(str(source_tree), 1.5, options)
+    summary = engine.run(str(source_tree), 1.5, options)
+    assert (summary['cached'], summary['failed']) == (0, 0)
+    assert not list((tmp_path / "results" / "HKXShift_cache").rglob("*.hkx"))
+
+def test_hkanno_from_any_path_and_wrapper(engine, hkanno, source_tree, tmp_path, monkeypatch):
+    elsewhere = tmp_path / "tools" / "hkanno.bin"
+    elsewhere.parent.mkdir()
+    os.replace(hkanno, elsewhere)
+    summary = engine.run(str(source_tree), 1.5, {'backend': 'hkanno', 'hkanno_path': str(elsewhere), 'hkanno_wrapper': "env"})
+    assert (summary['merged'], summary['failed']) == (3, 0)
+    with pytest.raises(ShiftError, match="nowhere not found"):
+        engine.run(str(source_tree), 1.5, {'backend': 'hkanno', 'hkanno_path': str(elsewhere), 'hkanno_wrapper': "nowhere"})
+
+def test_unknown_backend_is_refused(engine, hkanno, source_tree):
+    with pytest.raises(ShiftError, match="Unknown annotation backend"):
+        engine.run(str(source_tree), 1.5, {'backend': "magic"})
@@ -0,0 +1,100 @@
+import hashlib
+import json
+import zipfile
+
+import pytest
+
+from hkxshift.common import ShiftError
+from hkxshift.sources import open_source
+from hkxshift.fileops import copy_and_hash
+from hkxshift.backup import SourceBackup
+
+def manifest(backup_dir):
+    with open(backup_dir / "hkxshift_manifest.json", encoding="utf-8") as f:
+        return json.load(f)
+
+def back_up(source, backup_dir):
+    source_tree = open_source(str(source))
+    backup = SourceBackup(source_tree, str(backup_dir))
+    backup.start()
+    errors = backup.finish()
+    source_tree.close()
+    return backup, errors
+
+def test_folder_backup(source_tree, tmp_path):
+    backup, errors = back_up(source_tree, tmp_path / "backup")
+    assert errors == [] and (backup.kind, backup.count) == ("folder", 3)
+    assert backup.progress() == 100.0
+    files = manifest(tmp_path / "backup")['files']
+    data = (source_tree / "MovesetA" / "atk1.hkx").read_bytes()
+    assert (tmp_path / "backup" / "MovesetA" / "atk1.hkx").read_bytes() == data
+    assert files["MovesetA/atk1.hkx"]['sha256'] == hashlib.sha256(data).hexdigest()
+    assert manifest(tmp_path / "backup")['complete']
+
+def test_single_folder_backup(source_tree, tmp_path):
+    backup, errors = back_up(source_tree / "MovesetA", tmp_path / "backup")
+    assert errors == [] and backup.kind == "single"
+    assert set(manifest(tmp_path / "backup")['files']) == {"atk1.hkx", "atk2.hkx"}
+
+def test_archives_are_backed_up_whole(source_tree, tmp_path):
+    archive = tmp_path / "Animations.zip"
+    with zipfile.ZipFile(archive, "w") as zf:
+        for path in source_tree.rglob("*.hkx"):
+            zf.write(path, path.relative_to(tmp_path).as_posix())
+    backup, errors = back_up(archive, tmp_path / "backup")
+    assert errors == [] and (backup.kind, backup.count) == ("archive", 3)
+    assert (tmp_path / "backup" / "Animations.zip").read_bytes() == archive.read_bytes()
+
+def test_runs_back_up_alongside_processing(engine, hkanno, source_tree, tmp_path):
+    summary = engine.run(str(source_tree), 1.5)
+    assert summary['backed_up'] == 3 and summary['backup_duration'] >= 0
+    assert manifest(tmp_path / "results" / "Animations-backup")['complete']
+
+def test_zip_backups_restore_file_by_file(engine, hkanno, source_tree, tmp_path):
+    summary = engine.run(str(source_tree), 1.5, {'backup_format': 'zip'})
+    assert summary['backed_up'] == 3
+    backup = tmp_path / "results" / "Animations-backup"
+    files = manifest(backup)['files']
+    assert {entry['part'] for entry in files.values()} == {path.name for path in backup.glob("backup-*.zip")}
+    for name in ("atk1.hkx", "atk2.hkx"):
+        (source_tree / "MovesetA" / name).write_bytes(b"broken")
+    summary = engine.restore_backup(str(backup), only=["*/atk2.hkx"])
+    assert (summary['restored'], summary['verified']) == (1, 1)
+    assert (source_tree / "MovesetA" / "atk1.hkx").read_bytes() == b"broken"
+    assert hashlib.sha256((source_tree / "MovesetA" / "atk2.hkx").read_bytes()).hexdigest() == \
+        files["MovesetA/atk2.hkx"]['sha256']
+
+def test_incomplete_backups_keep_the_previous_one(engine, hkanno, source_tree, tmp_path, monkeypatch):
+    engine.run(str(source_tree), 1.5)
+    backup = tmp_path / "results" / "Animations-backup"
+    previous = manifest(backup)
+    (source_tree / "MovesetA" / "atk1.hkx").write_bytes(b"changed since")
+
+    def failing_copy(src, dest):
+        if src.endswith("atk2.hkx"):
+            raise OSError("disk full")
+        return copy_and_hash(src, dest)
+
+    # SourceBackup calls the copy_and_hash it imported from fileops
+    monkeypatch.setattr("hkxshift.backup.copy_and_hash", failing_copy)
+    with pytest.raises(ShiftError, match="Backup incomplete: 1 files"):
+        engine.run(str(source_tree), 0.8)
+    assert manifest(backup) == previous
+    assert (backup / "MovesetA" / "atk1.hkx").read_bytes() != b"changed since"
+    assert [path.name for path in backup.parent.iterdir() if path.name.startswith("Animations-backup.")] == [
+        "Animations-backup.lock"]
+    # The output itself was written
+    assert (tmp_path / "results" / "Animations-merged" / "MovesetA" / "atk2.hkx").exists()
+
+def test_cancelled_backups_are_not_swapped_in(source_tree, tmp_path):
+    source = open_source(str(source_tree))
+    backup = SourceBackup(source, str(tmp_path / "backup"))
+    backup.start()
+    backup.cancel()
+    backup.pool.shutdown()
+    source.close()
+    assert not (tmp_path / "backup").exists()
+    # Anything a running copy wrote after the cancel goes with the next backup
+    _, errors = back_up(source_tree, tmp_path / "backup")
+    assert errors == [] and manifest(tmp_path / "backup")['complete']
+    assert not [path for path in tmp_path.iterdir() if path.name.endswith(".new")]
@@ -0,0 +1,108 @@
+import itertools
+import os
+import types
+
+import pytest
+
+from hkxshift import caches
+from hkxshift.caches import ResultCache
+
+KEY = ("0" * 64, 1.5, "rules", "hkanno", False)
+
+@pytest.mark.parametrize("index, value", [(0, "1" * 64), (1, 1.25), (2, "other"), (3, "packfile"), (4, True)])
+def test_key_covers_every_setting(index, value):
+    changed = list(KEY)
+    changed[index] = value
+    assert ResultCache.make_key(*KEY) == ResultCache.make_key(*KEY)
+    assert ResultCache.make_key(*changed) != ResultCache.make_key(*KEY)
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Deterministic last_used times: every call is one second after the previous one"""
+    ticks = itertools.count(1000)
+    monkeypatch.setattr(caches, "time", types.SimpleNamespace(time=lambda: float(next(ticks))))
+
+def add(cache, tmp_path, name, size):
+    src = tmp_path / f"{name}.hkx"
+    src.write_bytes(name.encode("ascii")[:1] * size)
+    key = ResultCache.make_key(name, 1.5, "rules", "hkanno", False)
+    cache.put(key, str(src))
+    return key
+
+def test_put_and_get(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), 1024)
+    key = add(cache, tmp_path, "atk1", 10)
+    path = cache.get(key, "run1")
+    with open(path, "rb") as f:
+        assert f.read() == b"a" * 10
+    assert cache.get(ResultCache.make_key("atk2", 1.5, "rules", "hkanno", False), "run1") is None
+
+def test_entries_changed_on_disk_are_dropped(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), 1024)
+    key = add(cache, tmp_path, "atk1", 10)
+    with open(cache.entry_path(key), "ab") as f:
+        f.write(b"more")
+    assert cache.get(key, "run1") is None
+    assert cache.conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0] == 0
+
+def test_eviction_removes_least_recently_used(tmp_path, clock):
+    cache = ResultCache(str(tmp_path / "cache"), 25)
+    first = add(cache, tmp_path, "atk1", 10)
+    second = add(cache, tmp_path, "atk2", 10)
+    third = add(cache, tmp_path, "atk3", 10)
+    assert cache.get(first, "run1")
+    cache.unpin("run1")
+
+    assert cache.evict() == 1
+    assert cache.get(second, "run1") is None
+    assert cache.get(first, "run1") and cache.get(third, "run1")
+    assert cache.evict() == 0
+
+def test_pinned_entries_outlive_eviction(tmp_path, clock):
+    cache = ResultCache(str(tmp_path / "cache"), 15)
+    first = add(cache, tmp_path, "atk1", 10)
+    second = add(cache, tmp_path, "atk2", 10)
+    # Another run found the oldest entry and has not copied it yet
+    assert cache.get(first, "run1")
+    cache.conn.execute("UPDATE entries SET last_used = 0")
+    cache.conn.commit()
+
+    assert cache.evict() == 1
+    assert os.path.isfile(cache.entry_path(first))
+    assert not os.path.exists(cache.entry_path(second))
+
+    cache.unpin("run1")
+    add(cache, tmp_path, "atk3", 10)
+    assert cache.evict() == 1
+    assert not os.path.exists(cache.entry_path(first))
+
+def test_pins_of_crashed_runs_expire(tmp_path, clock):
+    cache = ResultCache(str(tmp_path / "cache"), 15)
+    first = add(cache, tmp_path, "atk1", 10)
+    assert cache.get(first, "crashed")
+    cache.conn.execute("UPDATE pins SET pinned = pinned - ?", (ResultCache.PIN_SECONDS + 1,))
+    cache.conn.execute("UPDATE entries SET last_used = 0")
+    cache.conn.commit()
+    add(cache, tmp_path, "atk2", 10)
+
+    assert cache.evict() == 1
+    assert not os.path.exists(cache.entry_path(first))
+
+def test_eviction_within_budget_keeps_everything(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), 100)
+    keys = [add(cache, tmp_path, name, 10) for name in ("atk1", "atk2")]
+    assert cache.evict() == 0
+    assert all(cache.get(key, "run1") for key in keys)
+
+def test_cached_results_are_copies(engine, hkanno, source_tree, tmp_path):
+    options = {'result_cache': True}
+    engine.run(str(source_tree), 1.5, options)
+    summary = engine.run(str(source_tree), 1.5, options)
+    assert (summary['cached'], summary['dumped']) == (3, 0)
+    result = tmp_path / "results" / "Animations-merged" / "MovesetA" / "atk1.hkx"
+    # Editing the output in place must not reach the cache entry
+    assert os.stat(result).st_nlink == 1
+    result.write_bytes(b"edited")
+    summary = engine.run(str(source_tree), 1.5, options)
+    assert summary['cached'] == 3
+    assert result.read_bytes() != b"edited"
@@ -0,0 +1,87 @@
+import threading
+import time
+
+import pytest
+
+from hkxshift.common import ShiftError
+from hkxshift.resources import ConcurrencyController, ResizableLimiter
+
+def test_limiter_blocks_past_its_limit():
+    limiter = ResizableLimiter(1)
+    entered = threading.Event()
+
+    def second():
+        with limiter.slot():
+            entered.set()
+
+    with limiter.slot():
+        thread = threading.Thread(target=second)
+        thread.start()
+        assert not entered.wait(0.1)
+        assert limiter.waiting == 1
+        # A larger limit lets the waiting task in without the first slot being released
+        limiter.set_limit(2)
+        assert entered.wait(5)
+    thread.join()
+    completed, busy, waiting = limiter.take_window()
+    assert (completed, waiting) == (2, 0) and busy > 0
+    assert limiter.take_window()[:2] == (0, 0.0)
+
+class FakeLimiter(ResizableLimiter):
+    """A limiter reporting a fixed window"""
+    def __init__(self, limit, window):
+        super().__init__(limit)
+        self.window = window
+
+    def take_window(self):
+        return self.window
+
+def adjust(controller, name, limit, window, cpu=0.5, iowait=0.0):
+    limiter = FakeLimiter(limit, window)
+    controller._adjust(name, limiter, 1.0, cpu, iowait)
+    return limiter.limit
+
+def test_limits_grow_while_tasks_wait():
+    controller = ConcurrencyController('adaptive', 2, 8)
+    assert adjust(controller, 'subprocess', 2, (10, 5.0, 3)) == 3
+    # Throughput kept improving
+    assert adjust(controller, 'subprocess', 3, (12, 6.0, 3)) == 4
+    # Nothing waiting: no reason to grow
+    assert adjust(controller, 'io', 2, (10, 1.0, 0)) == 2
+    # At the upper bound
+    assert adjust(ConcurrencyController('adaptive', 8, 8), 'io', 8, (10, 1.0, 5)) == 8
+
+def test_limits_back_off():
+    controller = ConcurrencyController('adaptive', 2, 8)
+    assert adjust(controller, 'subprocess', 4, (10, 5.0, 3), cpu=0.99) == 3
+    assert adjust(controller, 'io', 4, (10, 5.0, 3), iowait=0.5) == 3
+
+def test_steps_that_made_things_slower_are_taken_back():
+    controller = ConcurrencyController('adaptive', 2, 8)
+    assert adjust(controller, 'subprocess', 3, (10, 5.0, 3)) == 4
+    assert adjust(controller, 'subprocess', 4, (5, 5.0, 3)) == 3
+    # Then the limit holds for a window before probing upwards again
+    assert adjust(controller, 'subprocess', 3, (10, 5.0, 3)) == 3
+    assert adjust(controller, 'subprocess', 3, (10, 5.0, 3)) == 4
+
+def test_background_mode_starts_low_and_backs_off_early():
+    controller = ConcurrencyController('background', 8, 16)
+    assert controller.parallelism() == 1
+    assert controller.bounds['io'] == (1, 2)
+    assert adjust(controller, 'io', 2, (10, 1.0, 3), cpu=0.6) == 1
+
+def test_fixed_mode_never_samples():
+    controller = ConcurrencyController('fixed', 3, 8, interval=0.01)
+    controller.start()
+    time.sleep(0.05)
+    controller.stop()
+    assert controller.parallelism() == 3 and controller.thread is None
+
+@pytest.mark.parametrize("mode", ["adaptive", "fixed", "background"])
+def test_runs_in_every_mode(engine, hkanno, source_tree, mode):
+    summary = engine.run(str(source_tree), 1.5, {'concurrency': mode})
+    assert (summary['merged'], summary['failed']) == (3, 0)
+
+def test_unknown_mode_is_refused(engine, hkanno, source_tree):
+    with pytest.raises(ShiftError, match="Unknown concurrency mode"):
+        engine.run(str(source_tree), 1.5, {'concurrency': "turbo"})
@@ -0,0 +1,30 @@
+import pytest
+
+from hkxshift.logs import log_level
+from hkxshift.gui import ConsoleBuffer
+
+@pytest.mark.parametrize("message, debug, level", [
+    ("  ⚠️ Error dumping atk1.hkx", False, "error"),
+    ("[ERROR - DUMP] atk1.hkx", False, "error"),
+    ("Error: hkanno64.exe not found", False, "error"),
+    ("Dumping atk1.hkx", True, "debug"),
+    ("✅ Files Processed: 3", False, "info"),
+])
+def test_log_level(message, debug, level):
+    assert log_level(message, debug) == level
+
+def test_buffer_keeps_the_newest_lines():
+    buffer = ConsoleBuffer(capacity=3)
+    seqs = [buffer.append(f"line {n}", "error" if n % 2 else "info") for n in range(5)]
+    assert seqs == [0, 1, 2, 3, 4]
+    assert (buffer.first, len(buffer)) == (2, 3)
+    assert buffer.get(4) == ("line 4", "info")
+    assert buffer.seqs({"error"}) == [3]
+    assert buffer.seqs({"info", "error"}) == [2, 3, 4]
+
+def test_clear_starts_over():
+    buffer = ConsoleBuffer(capacity=2)
+    buffer.append("line", "info")
+    buffer.clear()
+    assert (buffer.first, len(buffer), buffer.seqs({"info"})) == (0, 0, [])
+    assert buffer.append("again", "info") == 0
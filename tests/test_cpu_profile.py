@@ -0,0 +1,61 @@
+import pstats
+import threading
+
+import pytest
+
+from hkxshift import profiling
+from hkxshift.common import ShiftError
+from hkxshift.profiling import CpuProfiler
+
+def busy_work():
+    return sum(i * i for i in range(20000))
+
+def profile_threads(profiler, count):
+    """Run busy_work in count threads that are inside the 'dump' phase at the same time"""
+    inside = threading.Barrier(count)
+
+    def work():
+        with profiler.phase("dump"):
+            inside.wait()
+            busy_work()
+            inside.wait()
+
+    threads = [threading.Thread(target=work) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+def test_phase_selection():
+    profiler = CpuProfiler(["process", "finish"])
+    assert profiler.selected("rescale") and profiler.selected("finish")
+    assert not profiler.selected("prepare")
+    assert CpuProfiler().selected("prepare")
+    assert not CpuProfiler(["merge"]).selected("dump")
+
+@pytest.mark.parametrize("shared", [False, True])
+def test_profiles_of_all_threads_are_written(tmp_path, monkeypatch, shared):
+    monkeypatch.setattr(profiling, "SHARED_CPROFILE", shared)
+    profiler = CpuProfiler(["dump"])
+    profiler.start()
+    profile_threads(profiler, 3)
+    with profiler.phase("merge"):
+        busy_work()
+    profiler.stop()
+    # One profiler for the whole phase when cProfile is process-wide, one per thread otherwise
+    assert len(profiler.profiles) == (1 if shared else 3)
+    paths = profiler.write(str(tmp_path / "run_cpu"))
+    assert paths == [str(tmp_path / f"run_cpu{suffix}") for suffix in (".pstats", "_top.txt", ".collapsed")]
+    functions = {name for _, _, name in pstats.Stats(paths[0]).stats}
+    assert "busy_work" in functions
+
+def test_runs_write_cpu_profiles(engine, hkanno, source_tree, tmp_path):
+    engine.run(str(source_tree), 1.5, {'cpu_profile': "all"})
+    results = tmp_path / "results"
+    assert (results / "Animations_cpu.pstats").is_file()
+    assert "cumulative" in (results / "Animations_cpu_top.txt").read_text(encoding="utf-8")
+    assert (results / "Animations_cpu.collapsed").is_file()
+
+def test_unknown_phases_are_refused(engine, hkanno, source_tree):
+    with pytest.raises(ShiftError, match="Unknown profiling phase: publish"):
+        engine.run(str(source_tree), 1.5, {'cpu_profile': "dump,publish"})
@@ -0,0 +1,25 @@
+import os
+import shutil
+
+from packfiles import read_packfile
+
+def test_identical_files_are_processed_once(engine, hkanno, source_tree, tmp_path):
+    shutil.copy2(source_tree / "MovesetA" / "atk1.hkx", source_tree / "MovesetB" / "atk1-copy.hkx")
+    summary = engine.run(str(source_tree), 1.5, {'deduplicate': True})
+    assert (summary['dumped'], summary['merged'], summary['deduplicated'], summary['failed']) == (3, 3, 1, 0)
+    merged = tmp_path / "results" / "Animations-merged"
+    copy = merged / "MovesetB" / "atk1-copy.hkx"
+    assert copy.read_bytes() == (merged / "MovesetA" / "atk1.hkx").read_bytes()
+    tracks, _, _, _ = read_packfile(copy.read_bytes())
+    assert [round(time_value, 5) for time_value, _ in tracks[0]] == [0.15, 0.5, 1.5]
+
+def test_files_of_the_same_size_are_compared_by_content(engine, hkanno, source_tree, tmp_path, write_packfile):
+    write_packfile(str(source_tree / "MovesetB" / "other.hkx"), [[(0.0, "Start"), (2.0, "Loop")]])
+    assert os.path.getsize(source_tree / "MovesetB" / "other.hkx") == os.path.getsize(source_tree / "MovesetB" / "idle.hkx")
+    summary = engine.run(str(source_tree), 1.5, {'deduplicate': True})
+    assert (summary['dumped'], summary['deduplicated']) == (4, 0)
+
+def test_deduplication_is_off_by_default(engine, hkanno, source_tree):
+    shutil.copy2(source_tree / "MovesetA" / "atk1.hkx", source_tree / "MovesetB" / "atk1-copy.hkx")
+    summary = engine.run(str(source_tree), 1.5)
+    assert (summary['dumped'], summary['deduplicated']) == (4, 0)
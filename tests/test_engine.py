@@ -0,0 +1,39 @@
+import pytest
+
+from hkxshift.common import ShiftError
+
+from packfiles import read_packfile
+
+def times(path):
+    tracks, _, _, _ = read_packfile(path.read_bytes())
+    return [[round(time_value, 5) for time_value, _ in annotations] for annotations in tracks]
+
+def test_run_scales_annotation_times(engine, hkanno, source_tree, tmp_path):
+    summary = engine.run(str(source_tree), 1.5)
+    assert (summary['dumped'], summary['merged'], summary['failed']) == (3, 3, 0)
+    merged = tmp_path / "results" / "Animations-merged"
+    # SCAR annotation lines keep their time
+    assert times(merged / "MovesetA" / "atk1.hkx") == [[0.15, 0.5, 1.5], [], [1.8]]
+    assert times(merged / "MovesetB" / "idle.hkx") == [[0.0, 1.5]]
+
+def test_second_job_reuses_the_annotation_dumps(engine, hkanno, resources, source_tree, tmp_path):
+    engine.run(str(source_tree), 1.5)
+    summary = engine.run(str(source_tree), 0.8)
+    assert summary['annotation_cache_hits'] == 3
+    assert times(tmp_path / "results" / "Animations-merged" / "MovesetB" / "idle.hkx") == [[0.0, 0.8]]
+
+@pytest.mark.parametrize("multiplier, message", [(1.0, "will not change"), (0.0, "Invalid"), (float("nan"), "Invalid")])
+def test_bad_multipliers_are_refused(engine, hkanno, source_tree, multiplier, message):
+    with pytest.raises(ShiftError, match=message):
+        engine.run(str(source_tree), multiplier)
+
+def test_extreme_multipliers_only_warn(engine, hkanno, source_tree):
+    lines = []
+    engine.on_log = lambda formatted, message, debug: lines.append(message)
+    summary = engine.run(str(source_tree), 3.0)
+    assert summary['merged'] == 3
+    assert any("outside the recommended range" in line for line in lines)
+
+def test_missing_hkanno_is_refused(engine, source_tree):
+    with pytest.raises(ShiftError, match="hkanno64.exe not found"):
+        engine.run(str(source_tree), 1.5)
@@ -0,0 +1,87 @@
+import errno
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from hkxshift import fileops
+from hkxshift.fileops import CopyBatcher, fast_copy, link_or_copy
+
+linux_only = pytest.mark.skipif(not sys.platform.startswith("linux"), reason="copy_file_range and sendfile are Linux only")
+
+@pytest.fixture
+def src(tmp_path):
+    path = tmp_path / "src.hkx"
+    path.write_bytes(os.urandom(300000))
+    os.utime(path, ns=(1_000_000_000_000_000_000, 1_000_000_000_000_000_000))
+    return path
+
+@pytest.fixture
+def no_reflink(tmp_path, monkeypatch):
+    """Forget what earlier tests learned about this filesystem, and rule out reflinks on it"""
+    device = os.stat(tmp_path).st_dev
+    monkeypatch.setattr(fileops, "UNSUPPORTED_COPIES", {('reflink', device, device)})
+    return device
+
+def test_copies_data_and_timestamps(src, tmp_path):
+    dest = tmp_path / "dest.hkx"
+    method = fast_copy(str(src), str(dest))
+    assert method in ("reflink", "copy_file_range", "sendfile", "copyfile", "copy")
+    assert dest.read_bytes() == src.read_bytes()
+    assert os.stat(dest).st_mtime_ns == os.stat(src).st_mtime_ns
+
+@linux_only
+def test_unsupported_methods_are_skipped_from_then_on(src, tmp_path, monkeypatch, no_reflink):
+    def unsupported(*args):
+        raise OSError(errno.ENOSYS, "not implemented")
+
+    monkeypatch.setattr(os, "copy_file_range", unsupported)
+    assert fast_copy(str(src), str(tmp_path / "dest.hkx")) == "sendfile"
+    assert ('copy_file_range', no_reflink, no_reflink) in fileops.UNSUPPORTED_COPIES
+    assert (tmp_path / "dest.hkx").read_bytes() == src.read_bytes()
+
+@linux_only
+def test_real_errors_are_not_mistaken_for_unsupported_methods(src, tmp_path, monkeypatch, no_reflink):
+    def failing(*args):
+        raise OSError(errno.EBADF, "bad file descriptor")
+
+    monkeypatch.setattr(os, "copy_file_range", failing)
+    with pytest.raises(OSError) as raised:
+        fast_copy(str(src), str(tmp_path / "dest.hkx"))
+    assert raised.value.errno == errno.EBADF
+    assert not (tmp_path / "dest.hkx").exists()
+    assert ('copy_file_range', no_reflink, no_reflink) not in fileops.UNSUPPORTED_COPIES
+
+@linux_only
+def test_clone_only_never_copies_the_data(src, tmp_path, no_reflink):
+    with pytest.raises(OSError, match="reflinks are not supported"):
+        fast_copy(str(src), str(tmp_path / "dest.hkx"), clone_only=True)
+    assert not (tmp_path / "dest.hkx").exists()
+
+def test_link_or_copy_without_hardlinks(src, tmp_path):
+    dest = tmp_path / "dest.hkx"
+    dest.write_bytes(b"old")
+    assert link_or_copy(str(src), str(dest), hardlink=False) != "link"
+    assert os.stat(dest).st_nlink == 1 and dest.read_bytes() == src.read_bytes()
+
+def test_batches_by_count_and_size():
+    done = []
+    with ThreadPoolExecutor(2) as pool:
+        batcher = CopyBatcher(pool, batch_files=3, batch_bytes=100)
+        for n in range(4):
+            batcher.add(lambda n=n: done.append(n), size=1)
+        assert len(batcher.futures) == 1
+        batcher.add(lambda: done.append("large"), size=200)
+        assert len(batcher.futures) == 2
+        batcher.add(lambda: 1 / 0)
+        assert len(batcher.finish()) == 1
+    assert sorted(map(str, done)) == ["0", "1", "2", "3", "large"]
+
+def test_cancel_drops_queued_tasks():
+    done = []
+    with ThreadPoolExecutor(1) as pool:
+        batcher = CopyBatcher(pool)
+        batcher.add(lambda: done.append(1))
+        assert batcher.cancel() == []
+    assert done == []
@@ -0,0 +1,88 @@
+import json
+import socket
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from hkxshift.common import ShiftError, job_options
+from hkxshift.server import JobClient, JobServer
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+@pytest.fixture
+def start_server(tmp_path, monkeypatch):
+    """Start a JobServer on a free localhost port; results go to tmp_path/HKXShift_results"""
+    monkeypatch.chdir(tmp_path)
+    servers = []
+
+    def start(**kwargs):
+        server = JobServer("127.0.0.1", free_port(), workers=2, concurrent_jobs=1, **kwargs)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.httpd.shutdown()
+
+def port_of(server):
+    return server.httpd.server_address[1]
+
+def post(server, path, body, headers):
+    request = urllib.request.Request(f"http://127.0.0.1:{port_of(server)}{path}", data=body, method="POST",
+                                     headers=headers)
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+def test_jobs_run_on_the_server(start_server, source_tree, tmp_path):
+    server = start_server(token="secret")
+    client = JobClient(port=port_of(server), token="secret")
+    job = client.submit(str(source_tree), 1.5, {'backend': 'packfile', 'concurrency': 'fixed'})
+    status = client.follow(job['id'])
+    assert status['state'] == "done", status['error']
+    assert status['summary']['merged'] == 3
+    assert (tmp_path / "HKXShift_results" / "Animations-merged" / "MovesetA" / "atk1.hkx").exists()
+
+def test_other_addresses_need_a_token():
+    with pytest.raises(ShiftError, match="needs a token"):
+        JobServer("0.0.0.0", free_port())
+
+def test_cross_site_requests_are_refused(start_server, source_tree):
+    server = start_server(token="secret")
+    body = json.dumps({'source': str(source_tree), 'multiplier': 1.5}).encode("utf-8")
+    # A page can post text/plain without a preflight, and rebind its own host name to 127.0.0.1
+    assert post(server, "/jobs", body, {"Content-Type": "text/plain", "X-HKXShift-Token": "secret"}) == 415
+    assert post(server, "/jobs", body, {"Content-Type": "application/json", "X-HKXShift-Token": "secret",
+                                        "Host": f"evil.example:{port_of(server)}"}) == 403
+    assert post(server, "/jobs", body, {"Content-Type": "application/json"}) == 403
+    with pytest.raises(ShiftError, match="Invalid token"):
+        JobClient(port=port_of(server), token="wrong").status()
+    assert server.list_jobs() == []
+
+def test_server_side_options_are_refused(start_server, source_tree, tmp_path):
+    server = start_server(options={'hkanno_wrapper': ""})
+    client = JobClient(port=port_of(server))
+    with pytest.raises(ShiftError, match="not accepted from clients: hkanno_wrapper"):
+        client.submit(str(source_tree), 1.5, {'hkanno_wrapper': "sh -c"})
+    with pytest.raises(ShiftError, match="not accepted from clients: surprise"):
+        client.submit(str(source_tree), 1.5, {'surprise': True})
+    with pytest.raises(ShiftError, match="scratch_dir"):
+        job_options({'debug': True, 'scratch_dir': str(tmp_path)})
+    assert job_options({'debug': True, 'scratch_dir': ''}) == {'debug': True}
+
+def test_metrics_need_the_token(start_server):
+    server = start_server(token="secret")
+    request = urllib.request.Request(f"http://127.0.0.1:{port_of(server)}/metrics", headers={"X-HKXShift-Token": "secret"})
+    with urllib.request.urlopen(request, timeout=10) as response:
+        assert 'hkxshift_jobs{state="queued"} 0' in response.read().decode("utf-8")
+    with pytest.raises(urllib.error.HTTPError) as refused:
+        urllib.request.urlopen(f"http://127.0.0.1:{port_of(server)}/metrics", timeout=10)
+    assert refused.value.code == 403
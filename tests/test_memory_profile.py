@@ -0,0 +1,49 @@
+import tracemalloc
+
+from hkxshift.profiling import MemoryProfiler
+
+def test_tracing_is_shared_between_profiles(resources):
+    first, second = MemoryProfiler(resources), MemoryProfiler(resources)
+    first.start()
+    assert tracemalloc.is_tracing() and not resources.tracing_shared()
+    second.start()
+    assert resources.tracing_shared()
+    first.stop()
+    # The other profile is still running
+    assert tracemalloc.is_tracing()
+    second.stop()
+    second.stop()
+    assert not tracemalloc.is_tracing()
+
+def test_tracing_started_elsewhere_is_left_running(resources):
+    tracemalloc.start()
+    try:
+        profiler = MemoryProfiler(resources)
+        profiler.start()
+        profiler.stop()
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+def test_shared_peaks_are_marked(resources, tmp_path):
+    first, second = MemoryProfiler(resources), MemoryProfiler(resources)
+    first.start()
+    second.start()
+    first.checkpoint("while shared")
+    second.stop()
+    first.checkpoint("alone")
+    first.stop()
+    report = tmp_path / "memory.txt"
+    first.write_report(str(report), "test")
+    text = report.read_text(encoding="utf-8")
+    assert [label for label, *_ in first.checkpoints] == ["start", "while shared", "alone"]
+    assert [checkpoint[-1] for checkpoint in first.checkpoints] == [False, True, False]
+    assert "another profiled job was running" in text
+
+def test_runs_write_a_memory_report(engine, hkanno, source_tree, tmp_path):
+    engine.run(str(source_tree), 1.5, {'memory_profile': True})
+    text = (tmp_path / "results" / "Animations_memory.txt").read_text(encoding="utf-8")
+    assert text.startswith("=== HKXShift Memory Report for Animations ===")
+    assert "Top 20 allocation sites" in text
+    assert "another profiled job" not in text
+    assert not tracemalloc.is_tracing()
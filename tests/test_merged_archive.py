@@ -0,0 +1,38 @@
+import os
+import zipfile
+
+from hkxshift.sources import open_source
+from hkxshift.fileops import MergedArchiveWriter
+
+def test_files_and_source_members_are_archived(tmp_path):
+    merged = tmp_path / "atk1.hkx"
+    merged.write_bytes(b"merged")
+    (tmp_path / "MyMod" / "MovesetA").mkdir(parents=True)
+    (tmp_path / "MyMod" / "MovesetA" / "atk1.txt").write_bytes(b"notes")
+    source = open_source(str(tmp_path / "MyMod"))
+
+    path = str(tmp_path / "MyMod-merged.zip")
+    writer = MergedArchiveWriter(path)
+    writer.add_file(str(merged), "MovesetA/atk1.hkx")
+    writer.add_source(source, os.path.join("MovesetA", "atk1.txt"), "MovesetA/atk1.txt")
+    assert writer.close() == []
+    assert writer.count == 2
+    with zipfile.ZipFile(path) as archive:
+        assert archive.read("MovesetA/atk1.hkx") == b"merged"
+        assert archive.read("MovesetA/atk1.txt") == b"notes"
+        assert archive.getinfo("MovesetA/atk1.hkx").compress_type == zipfile.ZIP_DEFLATED
+
+def test_archive_appears_only_when_closed(tmp_path):
+    path = str(tmp_path / "MyMod-merged.zip")
+    writer = MergedArchiveWriter(path)
+    assert not os.path.exists(path)
+    writer.close()
+    assert os.path.exists(path) and not os.path.exists(path + ".part")
+
+def test_failed_files_are_reported(tmp_path):
+    path = str(tmp_path / "MyMod-merged.zip")
+    writer = MergedArchiveWriter(path)
+    writer.add_file(str(tmp_path / "missing.hkx"), "MovesetA/missing.hkx")
+    errors = writer.close()
+    assert [arcname for arcname, _ in errors] == ["MovesetA/missing.hkx"]
+    assert writer.count == 0
@@ -0,0 +1,63 @@
+import socket
+import urllib.request
+
+import pytest
+
+from hkxshift.common import ShiftError, job_options
+from hkxshift.metrics import MetricsText, render_metrics
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def test_metrics_text_format():
+    metrics = MetricsText()
+    metrics.add("hkxshift_files_total", "counter", "Files", 3, {'stage': "merged"})
+    metrics.add("hkxshift_jobs", "gauge", "Jobs", 0.5, {'source': 'C:\\Mods\\"A"'})
+    metrics.add("hkxshift_files_total", "counter", "Files", 1, {'stage': "dumped"})
+    metrics.histogram("hkxshift_stage_seconds", "Seconds", [0.2, 3.0], buckets=(0.5, 1))
+    assert metrics.text().splitlines() == [
+        "# HELP hkxshift_files_total Files",
+        "# TYPE hkxshift_files_total counter",
+        'hkxshift_files_total{stage="merged"} 3',
+        'hkxshift_files_total{stage="dumped"} 1',
+        "# HELP hkxshift_jobs Jobs",
+        "# TYPE hkxshift_jobs gauge",
+        'hkxshift_jobs{source="C:\\\\Mods\\\\\\"A\\""} 0.5',
+        "# HELP hkxshift_stage_seconds Seconds",
+        "# TYPE hkxshift_stage_seconds histogram",
+        'hkxshift_stage_seconds_bucket{le="0.5"} 1',
+        'hkxshift_stage_seconds_bucket{le="1"} 1',
+        'hkxshift_stage_seconds_bucket{le="+Inf"} 2',
+        "hkxshift_stage_seconds_sum 3.2",
+        "hkxshift_stage_seconds_count 2",
+    ]
+
+def test_metrics_are_read_from_the_summary(engine, hkanno, resources, source_tree):
+    engine.run(str(source_tree), 1.5)
+    text = render_metrics([({'job': "1"}, engine)], resources)
+    assert 'hkxshift_files_total{job="1",stage="merged"} 3' in text
+    assert 'hkxshift_failures_total{job="1"} 0' in text
+    assert 'hkxshift_stage_duration_seconds_count{job="1",stage="dump"} 3' in text
+    assert 'hkxshift_process_cache_misses_total{cache="annotation"} 3' in text
+
+def test_runs_serve_metrics_while_running(engine, hkanno, source_tree):
+    address = f"127.0.0.1:{free_port()}"
+    pages = []
+
+    def on_log(formatted, message, debug):
+        if message.startswith("📈 Metrics at"):
+            with urllib.request.urlopen(f"http://{address}/metrics", timeout=10) as response:
+                pages.append(response.read().decode("utf-8"))
+
+    engine.on_log = on_log
+    engine.run(str(source_tree), 1.5, {'metrics': address})
+    assert "hkxshift_run_active 1" in pages[0]
+    # The endpoint goes away with the run
+    with pytest.raises(OSError):
+        urllib.request.urlopen(f"http://{address}/metrics", timeout=2)
+
+def test_metrics_address_is_server_side():
+    with pytest.raises(ShiftError, match="metrics"):
+        job_options({'metrics': "0.0.0.0:8759"})
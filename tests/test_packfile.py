@@ -0,0 +1,135 @@
+import struct
+
+import pytest
+
+from hkxshift.rules import DEFAULT_PRESERVATION_RULES, PreservationRules
+from hkxshift.packfile import (HkxPatchError, hkanno_time, parse_packfile_animations, patch_annotation_times,
+                               read_packfile_annotations)
+from hkxshift.backends import PackfileBackend
+
+from packfiles import build_packfile, read_packfile
+
+def test_read_annotations():
+    pointer_size, annotations = read_packfile_annotations(build_packfile())
+    assert pointer_size == 8
+    assert [(round(time_value, 6), text, track) for _, time_value, text, track in annotations] == [
+        (0.1, "HitFrame", 0), (0.5, "SCAR_ActionData{}", 0), (1.0, "SoundPlay.WPNSwing", 0), (1.2, "animEnd", 2)]
+
+def test_annotation_offsets_point_at_the_time_floats():
+    data = build_packfile()
+    _, annotations = read_packfile_annotations(data)
+    for offset, time_value, _, _ in annotations:
+        assert struct.unpack_from("<f", data, offset)[0] == time_value
+
+def test_parse_animations():
+    _, _, animations = parse_packfile_animations(build_packfile(duration=1.5, frames=46))
+    assert animations == [("hkaSplineCompressedAnimation", 1.5, 3, 46)]
+
+def test_frame_count_unknown_for_other_classes():
+    _, _, animations = parse_packfile_animations(build_packfile(class_name="hkaQuantizedAnimation"))
+    assert animations[0][3] is None
+
+@pytest.mark.parametrize("data, message", [
+    (b"<?xml version='1.0'?>" + bytes(64), "not a binary packfile"),
+    (build_packfile()[:100], "truncated section headers"),
+    (build_packfile(class_name="hkaSkeleton"), "no animation object"),
+    (build_packfile([[(3.0, "late")]]), "outside animation duration"),
+])
+def test_unreadable_files_raise(data, message):
+    with pytest.raises(HkxPatchError, match=message):
+        read_packfile_annotations(data)
+
+def test_patch_scales_times_and_keeps_preserved_lines(tmp_path):
+    path = tmp_path / "atk.hkx"
+    original = build_packfile()
+    path.write_bytes(original)
+    preserved = patch_annotation_times(str(path), 1.5, PreservationRules(DEFAULT_PRESERVATION_RULES))
+
+    assert preserved == {'SCAR': 1}
+    patched = path.read_bytes()
+    _, annotations = read_packfile_annotations(patched)
+    assert [round(time_value, 5) for _, time_value, _, _ in annotations] == [0.15, 0.5, 1.5, 1.8]
+    # Only the time floats change
+    times = {offset + i for offset, _, _, _ in annotations for i in range(4)}
+    assert len(patched) == len(original)
+    assert all(patched[i] == original[i] for i in range(len(original)) if i not in times)
+
+def test_patch_refuses_rules_that_drop_lines(tmp_path):
+    path = tmp_path / "atk.hkx"
+    path.write_bytes(build_packfile())
+    rules = PreservationRules([{'target': 'line', 'pattern': 'SoundPlay', 'action': 'skip'}])
+    with pytest.raises(HkxPatchError, match="drops annotations"):
+        patch_annotation_times(str(path), 1.5, rules)
+    assert path.read_bytes() == build_packfile()
+
+def test_patch_refuses_empty_files(tmp_path):
+    path = tmp_path / "atk.hkx"
+    path.write_bytes(b"")
+    with pytest.raises(HkxPatchError, match="empty file"):
+        patch_annotation_times(str(path), 1.5, PreservationRules(DEFAULT_PRESERVATION_RULES))
+
+def test_times_are_rounded_like_hkanno_dumps():
+    assert hkanno_time(1 / 3) == 0.333333
+    # Scaling the unrounded time would give 0.5
+    assert hkanno_time(hkanno_time(1 / 3) * 1.5) == 0.499999
+
+def times(path):
+    tracks, _, _, _ = read_packfile(path.read_bytes())
+    return [[time_value for time_value, _ in annotations] for annotations in tracks]
+
+def test_patched_files_match_the_hkanno_path(engine, hkanno, tmp_path, write_packfile):
+    source = tmp_path / "Animations"
+    write_packfile(str(source / "MovesetA" / "atk1.hkx"), [[(1 / 3, "HitFrame"), (0.123456789, "weaponSwing")]])
+    engine.run(str(source), 1.5)
+    merged = tmp_path / "results" / "Animations-merged" / "MovesetA" / "atk1.hkx"
+    through_hkanno = times(merged)
+    summary = engine.run(str(source), 1.5, {'binary_patch': True})
+    assert summary['binary_patched'] == 1
+    assert times(merged) == through_hkanno
+
+def test_files_the_patch_cannot_handle_go_through_hkanno(engine, hkanno, source_tree, tmp_path):
+    rules_file = tmp_path / "rules.json"
+    rules_file.write_text('{"rules": [{"target": "line", "pattern": "SoundPlay", "action": "skip"}]}')
+    summary = engine.run(str(source_tree), 1.5, {'binary_patch': True, 'rules_file': str(rules_file)})
+    assert (summary['binary_patched'], summary['merged'], summary['failed']) == (2, 3, 0)
+    tracks, _, _, _ = read_packfile((tmp_path / "results" / "Animations-merged" / "MovesetA" / "atk1.hkx").read_bytes())
+    assert [text for _, text in tracks[0]] == ["HitFrame", "SCAR_ActionData{}"]
+
+def test_packfile_backend_dump(tmp_path):
+    hkx = tmp_path / "atk.hkx"
+    hkx.write_bytes(build_packfile())
+    dump = tmp_path / "atk.txt"
+    PackfileBackend().dump(str(hkx), str(dump))
+    assert dump.read_text(encoding="utf-8") == (
+        "# numOriginalFrames: 61\n"
+        "# duration: 2.000000\n"
+        "# numAnnotationTracks: 3\n"
+        "# numAnnotations: 3\n"
+        "0.100000 HitFrame\n"
+        "0.500000 SCAR_ActionData{}\n"
+        "1.000000 SoundPlay.WPNSwing\n"
+        "# numAnnotations: 0\n"
+        "# numAnnotations: 1\n"
+        "1.200000 animEnd\n")
+
+def test_packfile_backend_update(tmp_path):
+    hkx = tmp_path / "atk.hkx"
+    hkx.write_bytes(build_packfile())
+    dump = tmp_path / "atk.txt"
+    backend = PackfileBackend()
+    backend.dump(str(hkx), str(dump))
+    dump.write_text(dump.read_text(encoding="utf-8").replace("1.000000 Sound", "1.250000 Sound"), encoding="utf-8")
+    backend.update(str(hkx), str(dump))
+    _, annotations = read_packfile_annotations(hkx.read_bytes())
+    assert [round(time_value, 6) for _, time_value, _, _ in annotations] == [0.1, 0.5, 1.25, 1.2]
+
+def test_packfile_backend_update_refuses_renamed_annotations(tmp_path):
+    hkx = tmp_path / "atk.hkx"
+    hkx.write_bytes(build_packfile())
+    dump = tmp_path / "atk.txt"
+    backend = PackfileBackend()
+    backend.dump(str(hkx), str(dump))
+    dump.write_text(dump.read_text(encoding="utf-8").replace("HitFrame", "weaponSwing"), encoding="utf-8")
+    with pytest.raises(HkxPatchError, match="added, removed or renamed"):
+        backend.update(str(hkx), str(dump))
+    assert hkx.read_bytes() == build_packfile()
@@ -0,0 +1,67 @@
+import socket
+import threading
+
+import pytest
+
+from hkxshift.common import ShiftError
+from hkxshift.packfile import read_packfile_annotations
+from hkxshift.remote import CoordinatorClient, WorkCoordinator
+from hkxshift.worker import RemoteWorker
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+@pytest.fixture
+def coordinated(engine, tmp_path):
+    """Run the engine as coordinator with one RemoteWorker thread; yields (run, worker)"""
+    address = f"127.0.0.1:{free_port()}"
+    worker = RemoteWorker(address, workers=2, token="secret", scratch_dir=str(tmp_path / "worker"), name="test-worker",
+                          poll_interval=0.05)
+    thread = threading.Thread(target=worker.serve_forever, daemon=True)
+
+    def run(source):
+        thread.start()
+        return engine.run(str(source), 1.5, {'backend': 'packfile', 'concurrency': 'fixed', 'coordinator': address,
+                                              'coordinator_token': "secret"})
+
+    yield run, worker
+    worker.stop()
+    thread.join(timeout=10)
+
+def test_round_trip(coordinated, source_tree, tmp_path):
+    run, worker = coordinated
+    summary = run(source_tree)
+    assert (summary['merged'], summary['failed']) == (3, 0)
+    assert summary['preserved_lines'] == {'SCAR': 1}
+    with open(tmp_path / "results" / "Animations-merged" / "MovesetA" / "atk1.hkx", "rb") as f:
+        _, annotations = read_packfile_annotations(f.read())
+    assert [round(time_value, 5) for _, time_value, _, _ in annotations] == [0.15, 0.5, 1.5, 1.8]
+    # Merged by the worker, which has no hkanno64.exe: it used the backend it was sent
+    assert 'test-worker' in (tmp_path / "results" / "Animations_log.jsonl").read_text(encoding="utf-8")
+
+def test_uploads_unlike_their_source_are_rejected(coordinated, source_tree, tmp_path):
+    run, worker = coordinated
+    junk = tmp_path / "junk.hkx"
+    junk.write_bytes(b"not an hkx file")
+    upload = worker.client.upload
+    worker.client.upload = lambda task_id, name, path: upload(task_id, name, str(junk))
+    summary = run(source_tree)
+    assert (summary['merged'], summary['failed']) == (0, 3)
+    assert not (tmp_path / "results" / "Animations-merged" / "MovesetA" / "atk1.hkx").exists()
+
+def test_other_addresses_need_a_token():
+    with pytest.raises(ShiftError, match="needs a token"):
+        WorkCoordinator("0.0.0.0", free_port())
+
+def test_requests_without_the_token_are_refused():
+    coordinator = WorkCoordinator("127.0.0.1", free_port(), token="secret")
+    coordinator.start()
+    try:
+        address = f"127.0.0.1:{coordinator.httpd.server_address[1]}"
+        with pytest.raises(ShiftError, match="Invalid token"):
+            CoordinatorClient(address, "wrong").lease("intruder")
+        assert CoordinatorClient(address, "secret").lease("worker") is None
+    finally:
+        coordinator.stop()
@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+from hkxshift.common import ShiftError
+
+from packfiles import build_packfile, read_packfile
+
+def times(path):
+    tracks, _, _, _ = read_packfile(path.read_bytes())
+    return [round(time_value, 5) for annotations in tracks for time_value, _ in annotations]
+
+@pytest.fixture
+def finished_run(engine, hkanno, source_tree, tmp_path):
+    summary = engine.run(str(source_tree), 1.5, {'concurrency': 'fixed'})
+    assert summary['merged'] == 3 and summary['failed'] == 0
+    results = tmp_path / "results"
+    return results / "Animations-merged", results / "Animations-backup"
+
+def test_restore_rewrites_only_changed_files(engine, finished_run, source_tree):
+    _, backup = finished_run
+    with open(backup / "hkxshift_manifest.json", encoding="utf-8") as f:
+        assert set(json.load(f)['files']) == {"MovesetA/atk1.hkx", "MovesetA/atk2.hkx", "MovesetB/idle.hkx"}
+    changed = source_tree / "MovesetA" / "atk1.hkx"
+    changed.write_bytes(build_packfile([[(0.3, "HitFrame")]]))
+    extra = source_tree / "MovesetA" / "new.hkx"
+    extra.write_bytes(b"new")
+
+    summary = engine.restore_backup(str(backup))
+    assert (summary['restored'], summary['verified'], summary['unchanged'], summary['extra']) == (1, 1, 2, 1)
+    assert changed.read_bytes() == build_packfile()
+    assert extra.exists()
+
+def test_restore_dry_run_and_delete_extra(engine, finished_run, source_tree):
+    _, backup = finished_run
+    (source_tree / "MovesetB" / "idle.hkx").write_bytes(b"broken")
+    extra = source_tree / "MovesetB" / "new.hkx"
+    extra.write_bytes(b"new")
+
+    summary = engine.restore_backup(str(backup), dry_run=True, delete_extra=True)
+    assert (summary['restored'], summary['deleted']) == (0, 0)
+    assert (source_tree / "MovesetB" / "idle.hkx").read_bytes() == b"broken"
+
+    summary = engine.restore_backup(str(backup), delete_extra=True)
+    assert (summary['restored'], summary['deleted'], summary['failed']) == (1, 1, 0)
+    assert not extra.exists()
+    assert times(source_tree / "MovesetB" / "idle.hkx") == [0.0, 1.0]
+
+def test_restore_by_moving_uses_up_the_backup(engine, finished_run, source_tree):
+    _, backup = finished_run
+    (source_tree / "MovesetA" / "atk2.hkx").unlink()
+    summary = engine.restore_backup(str(backup), mode="move")
+    assert (summary['restored'], summary['verified']) == (1, 1)
+    assert (source_tree / "MovesetA" / "atk2.hkx").read_bytes() == build_packfile([[(0.25, "HitFrame")]])
+    assert not (backup / "MovesetA" / "atk2.hkx").exists()
+
+def test_restore_needs_a_backup(engine, tmp_path):
+    with pytest.raises(ShiftError):
+        engine.restore_backup(str(tmp_path / "missing-backup"))
@@ -0,0 +1,73 @@
+import json
+
+import pytest
+
+from hkxshift.common import ShiftError
+from hkxshift.rules import DEFAULT_PRESERVATION_RULES, PreservationRules
+
+from packfiles import read_packfile
+
+def rule(pattern, **fields):
+    return dict({'target': 'line', 'match': 'regex', 'pattern': pattern}, **fields)
+
+def test_default_rules():
+    rules = PreservationRules(DEFAULT_PRESERVATION_RULES)
+    assert rules.match_file("MCO_SCAR_Attack.hkx")['name'] == "SCAR"
+    assert rules.match_file("1hm_Equip.HKX")['name'] == "CPR"
+    assert rules.match_file("atk1.hkx") is None
+    assert rules.match_line("0.500000 SCAR_ActionData{...}")['name'] == "SCAR"
+    # Annotation lines match case-sensitively
+    assert rules.match_line("0.500000 scar_actiondata") is None
+
+def test_first_rule_in_order_wins():
+    # Both built-in file rules match; SCAR comes first
+    assert PreservationRules(DEFAULT_PRESERVATION_RULES).match_file("scar_equip.hkx")['name'] == "SCAR"
+    rules = PreservationRules([rule("Hit", name="first", action='skip'), rule("Frame", name="second")])
+    assert rules.match_line("0.25 HitFrame")['name'] == "first"
+    assert rules.match_line("0.25 Frame")['name'] == "second"
+
+def test_match_kinds():
+    rules = PreservationRules([
+        {'name': 'glob', 'target': 'file', 'match': 'glob', 'pattern': 'idle*.hkx'},
+        rule(r"(?P<tag>MCO_)\w+(?P=tag)", name="named groups"),
+        rule("sound", name="folded", ignore_case=True),
+    ])
+    assert rules.match_file("IDLE_loop.hkx")['name'] == "glob"
+    assert rules.match_file("my_idle.hkx") is None
+    assert rules.match_line("0.1 MCO_WinOpen_MCO_")['name'] == "named groups"
+    assert rules.match_line("0.1 SoundPlay")['name'] == "folded"
+
+@pytest.mark.parametrize("pattern, message", [
+    ("(?i)hit", "global flags"),
+    (r"(a)\1", "by name"),
+    (r"(a)?(?(1)b|c)", "by name"),
+    (r"(?P<_rule0>x)", "reserved"),
+    ("(unclosed", "Invalid pattern"),
+])
+def test_patterns_that_break_the_combined_matcher_are_refused(pattern, message):
+    with pytest.raises(ShiftError, match=message):
+        PreservationRules([rule(pattern)])
+
+def test_escaped_backslashes_are_not_references():
+    assert PreservationRules([rule(r"a\\1")]).match_line(r"a\1")
+
+@pytest.mark.parametrize("bad", [{'target': 'name'}, {'match': 'fuzzy'}, {'action': 'drop'}, {'pattern': ''}])
+def test_invalid_rules_are_refused(bad):
+    with pytest.raises(ShiftError, match="Invalid preservation rule"):
+        PreservationRules([dict(rule("x"), **bad)])
+
+def test_rules_file(engine, hkanno, source_tree, tmp_path):
+    rules_file = tmp_path / "rules.json"
+    rules_file.write_text(json.dumps({'rules': [
+        {'name': 'idle', 'target': 'file', 'match': 'glob', 'pattern': 'idle.hkx', 'action': 'skip'},
+        {'name': 'hits', 'target': 'line', 'match': 'substring', 'pattern': 'HitFrame'},
+    ]}))
+    engine.run(str(source_tree), 1.5, {'rules_file': str(rules_file)})
+    merged = tmp_path / "results" / "Animations-merged"
+    assert not (merged / "MovesetB" / "idle.hkx").exists()
+    tracks, _, _, _ = read_packfile((merged / "MovesetA" / "atk2.hkx").read_bytes())
+    assert [round(time_value, 5) for time_value, _ in tracks[0]] == [0.25]
+
+def test_missing_rules_file_is_refused(engine, hkanno, source_tree, tmp_path):
+    with pytest.raises(ShiftError, match="not found"):
+        engine.run(str(source_tree), 1.5, {'rules_file': str(tmp_path / "missing.json")})
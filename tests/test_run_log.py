@@ -0,0 +1,35 @@
+import json
+
+from hkxshift.logs import RotatingLogFile, RunLogWriter
+
+def test_log_rolls_over_past_max_bytes(tmp_path):
+    path = tmp_path / "run.log"
+    (tmp_path / "run.log.2").write_text("left by an earlier run")
+    log = RotatingLogFile(str(path), 10, 2)
+    assert not (tmp_path / "run.log.2").exists()
+    for n in range(4):
+        log.write(f"line {n:04d}\n")
+    log.close()
+    assert path.read_text() == ""
+    assert (tmp_path / "run.log.1").read_text() == "line 0003\n"
+    assert (tmp_path / "run.log.2").read_text() == "line 0002\n"
+    assert not (tmp_path / "run.log.3").exists()
+
+def test_writer_writes_text_and_records(tmp_path):
+    writer = RunLogWriter(str(tmp_path / "run.log"), str(tmp_path / "run.jsonl"))
+    writer.write("plain line")
+    writer.write("⚠️ Error dumping atk1.hkx", dict(level="error", message="failed", file="atk1.hkx"))
+    writer.write(None, dict(level="info", message="record only"))
+    writer.close()
+    assert (tmp_path / "run.log").read_text(encoding="utf-8") == "plain line\n⚠️ Error dumping atk1.hkx\n"
+    records = [json.loads(line) for line in (tmp_path / "run.jsonl").read_text(encoding="utf-8").splitlines()]
+    assert [(record['level'], record['message']) for record in records] == [("error", "failed"), ("info", "record only")]
+    assert records[0]['file'] == "atk1.hkx" and "ts" in records[0]
+
+def test_runs_write_a_json_lines_log(engine, hkanno, source_tree, tmp_path):
+    engine.run(str(source_tree), 1.2)
+    lines = (tmp_path / "results" / "Animations_log.jsonl").read_text(encoding="utf-8").splitlines()
+    records = [json.loads(line) for line in lines]
+    assert records[0]['message'] == "run started" and records[0]['multiplier'] == 1.2
+    assert {"MovesetA/atk1.hkx", "MovesetA/atk2.hkx", "MovesetB/idle.hkx"} <= {record.get('file') for record in records}
+    assert not [record for record in records if record['level'] == "error"]
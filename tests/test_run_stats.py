@@ -0,0 +1,36 @@
+import sqlite3
+
+import pytest
+
+from hkxshift.stats import DEFAULT_STAGE_COSTS, RunStatsDB, fit_stage_model, format_duration
+
+@pytest.mark.parametrize("seconds, text", [(44.6, "45s"), (192, "3m 12s"), (3900, "1h 05m")])
+def test_format_duration(seconds, text):
+    assert format_duration(seconds) == text
+
+def test_stage_model_fits_fixed_and_per_byte_cost():
+    fixed, per_byte = fit_stage_model([(size, 0.1 + size * 2e-6) for size in (1000, 50000, 200000, 800000)], 0.25)
+    assert fixed == pytest.approx(0.1)
+    assert per_byte == pytest.approx(2e-6)
+
+def test_stage_model_without_enough_history():
+    assert fit_stage_model([], 0.25) == (0.25, 0.0)
+    # Too few rows for a slope: the mean duration
+    assert fit_stage_model([(1000, 0.2), (2000, 0.4)], 0.25) == (pytest.approx(0.3), 0.0)
+
+def test_predictions_prefer_a_files_own_history(tmp_path):
+    db = RunStatsDB(str(tmp_path / "stats.sqlite"))
+    assert db.predict([("mod|a.hkx", 1000)]) == [DEFAULT_STAGE_COSTS]
+    db.record_run(0.0, "mod", 1.5, 2, 3.0, [("mod|a.hkx", "dump", 1000, 2.0), ("mod|b.hkx", "dump", 1000, 0.5)])
+    own, other_size, unknown = db.predict([("mod|a.hkx", 1000), ("mod|a.hkx", 5000), ("mod|c.hkx", 1000)])
+    assert own['dump'] == pytest.approx(2.0)
+    # Changed size or never seen: the model over all history (the mean of two rows)
+    assert other_size['dump'] == unknown['dump'] == pytest.approx(1.25)
+    assert unknown['merge'] == DEFAULT_STAGE_COSTS['merge']
+
+def test_runs_record_their_stage_times(engine, hkanno, source_tree, tmp_path):
+    engine.run(str(source_tree), 1.5)
+    with sqlite3.connect(tmp_path / "results" / "HKXShift_stats.sqlite") as conn:
+        assert conn.execute("SELECT files FROM runs").fetchall() == [(3,)]
+        stages = conn.execute("SELECT stage, COUNT(*) FROM stage_times GROUP BY stage ORDER BY stage").fetchall()
+    assert stages == [("dump", 3), ("merge", 3), ("rescale", 3)]
@@ -0,0 +1,32 @@
+from hkxshift import fileops
+from hkxshift.fileops import ScratchCleaner, find_ram_scratch
+
+def test_cleaner_deletes_queued_folders(tmp_path):
+    folders = [tmp_path / name for name in ("a", "b")]
+    for folder in folders:
+        (folder / "nested").mkdir(parents=True)
+        (folder / "nested" / "file.txt").write_text("x")
+    cleaner = ScratchCleaner()
+    cleaner.discard(*folders, tmp_path / "missing")
+    cleaner.close()
+    assert not any(folder.exists() for folder in folders)
+
+def test_ram_scratch_needs_room_to_spare(tmp_path, monkeypatch):
+    monkeypatch.setattr(fileops, "RAM_SCRATCH_DIRS", [str(tmp_path / "missing"), str(tmp_path)])
+    assert find_ram_scratch(1024) == str(tmp_path)
+    assert find_ram_scratch(1 << 60) is None
+
+def test_intermediate_files_go_to_the_scratch_folder(engine, hkanno, source_tree, tmp_path):
+    scratch = tmp_path / "scratch"
+    summary = engine.run(str(source_tree), 1.5, {'scratch_dir': str(scratch), 'delete_temp': False})
+    assert summary['merged'] == 3
+    workspace = scratch / "HKXShift_runs" / summary['run_id']
+    assert (workspace / "converted" / "MovesetA" / "atk1.hkx").is_dir()
+    assert (workspace / "rescaled" / "MovesetB" / "idle.hkx").is_dir()
+    assert not list((tmp_path / "results").rglob("converted"))
+
+def test_scratch_files_are_deleted_per_file(engine, hkanno, resources, source_tree, tmp_path):
+    scratch = tmp_path / "scratch"
+    engine.run(str(source_tree), 1.5, {'scratch_dir': str(scratch)})
+    resources.cleaner.close()
+    assert not [path for path in scratch.rglob("*") if path.is_file()]
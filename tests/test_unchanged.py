@@ -0,0 +1,33 @@
+from hkxshift.rules import DEFAULT_PRESERVATION_RULES, PreservationRules
+from hkxshift.annotations import rescale_annotations
+
+def rescale(lines, scale=1.5):
+    return rescale_annotations(lines, scale, PreservationRules(DEFAULT_PRESERVATION_RULES).match_line)
+
+def test_rescale_annotations():
+    lines, preserved, dropped, changed = rescale(["# numAnnotations: 2\n", "0.100000 HitFrame\n", "0.5 SCAR_ActionData{}\n"])
+    assert lines == ["# numAnnotations: 2\n", "0.150000 HitFrame\n", "0.5 SCAR_ActionData{}\n"]
+    assert (preserved, dropped, changed) == ({'SCAR': 1}, 0, True)
+
+def test_results_that_mean_the_same_are_unchanged():
+    assert not rescale(["# numAnnotations: 0\n"])[3]
+    assert not rescale(["0.5 SCAR_ActionData{}\n", "0.000000 Start\n"])[3]
+    skip = PreservationRules([{'target': 'line', 'pattern': 'Start', 'action': 'skip'}])
+    assert rescale_annotations(["0.000000 Start\n"], 1.5, skip.match_line)[2:] == (1, True)
+
+def test_files_without_annotations_to_rescale_are_copied(engine, hkanno, source_tree, tmp_path, write_packfile):
+    write_packfile(str(source_tree / "MovesetB" / "pose.hkx"), [[(0.0, "Start")], []])
+    summary = engine.run(str(source_tree), 1.5)
+    assert (summary['merged'], summary['unchanged'], summary['failed']) == (4, 1, 0)
+    merged = tmp_path / "results" / "Animations-merged" / "MovesetB" / "pose.hkx"
+    assert merged.read_bytes() == (source_tree / "MovesetB" / "pose.hkx").read_bytes()
+
+def test_indexed_files_skip_the_dump(engine, hkanno, source_tree, tmp_path, write_packfile):
+    write_packfile(str(source_tree / "MovesetB" / "pose.hkx"), [[(0.0, "Start")], []])
+    engine.run(str(source_tree), 1.5, {'annotation_index': True})
+    summary = engine.run(str(source_tree), 0.8, {'annotation_index': True})
+    assert (summary['merged'], summary['unchanged']) == (4, 1)
+    # Only the three files that need rescaling looked up their dump
+    assert summary['annotation_cache_hits'] == 3
+    merged = tmp_path / "results" / "Animations-merged" / "MovesetB" / "pose.hkx"
+    assert merged.read_bytes() == (source_tree / "MovesetB" / "pose.hkx").read_bytes()
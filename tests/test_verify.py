@@ -0,0 +1,42 @@
+import json
+import os
+
+import pytest
+
+from hkxshift.common import ShiftError
+
+@pytest.fixture
+def finished_run(engine, hkanno, source_tree, tmp_path):
+    def run(options=None):
+        summary = engine.run(str(source_tree), 1.5, options)
+        assert summary['merged'] == 3 and summary['failed'] == 0
+        return tmp_path / "results" / "Animations_manifest.json"
+    return run
+
+def test_manifest_lists_every_output(finished_run):
+    with open(finished_run(), encoding="utf-8") as f:
+        manifest = json.load(f)
+    assert set(manifest['files']) == {"MovesetA/atk1.hkx", "MovesetA/atk2.hkx", "MovesetB/idle.hkx"}
+
+def test_verify_output(engine, finished_run):
+    summary = engine.verify_output(str(finished_run()))
+    assert (summary['checked'], summary['ok'], summary['mismatched'], summary['missing']) == (3, 3, 0, 0)
+
+def test_verify_output_reports_changed_and_missing_files(engine, finished_run, tmp_path):
+    manifest = finished_run()
+    merged = tmp_path / "results" / "Animations-merged"
+    with open(merged / "MovesetA" / "atk1.hkx", "r+b") as f:
+        f.seek(-1, os.SEEK_END)
+        f.write(b"\1")
+    os.remove(merged / "MovesetB" / "idle.hkx")
+    (merged / "MovesetB" / "extra.hkx").write_bytes(b"")
+    summary = engine.verify_output(str(manifest))
+    assert (summary['ok'], summary['mismatched'], summary['missing'], summary['extra']) == (1, 1, 1, 1)
+
+def test_verify_archive_output(engine, finished_run):
+    summary = engine.verify_output(str(finished_run({'archive_output': True})))
+    assert (summary['checked'], summary['ok']) == (3, 3)
+
+def test_verify_output_needs_a_manifest(engine, tmp_path):
+    with pytest.raises(ShiftError, match="Could not read output manifest"):
+        engine.verify_output(str(tmp_path / "missing.json"))
@@ -0,0 +1,53 @@
+import json
+import threading
+
+from hkxshift.fileops import FileLock
+from hkxshift.engine import ShiftEngine
+
+from packfiles import read_packfile
+
+def test_runs_publish_from_their_own_workspace(engine, hkanno, resources, source_tree, tmp_path):
+    summary = engine.run(str(source_tree), 1.5)
+    assert summary['run_id'].startswith("Animations-")
+    results = tmp_path / "results"
+    assert (results / "Animations-merged" / "MovesetA" / "atk1.hkx").is_file()
+    assert (results / "Animations_log.txt").is_file() and (results / "Animations_manifest.json").is_file()
+    engine.run(str(source_tree), 0.8)
+    resources.cleaner.close()
+    # The previous output was swapped out and both workspaces are gone
+    assert not [path for path in results.iterdir() if path.name.endswith(".old")]
+    assert not list((results / "HKXShift_runs").iterdir())
+
+def test_concurrent_runs_on_one_source(hkanno, resources, source_tree, tmp_path):
+    summaries = {}
+
+    def run(scale):
+        engine = ShiftEngine(resources, results_dir=str(tmp_path / "results"))
+        summaries[scale] = engine.run(str(source_tree), scale, {'backup': False})
+
+    threads = [threading.Thread(target=run, args=(scale,)) for scale in (1.5, 0.8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(summaries[scale]['merged'] == 3 and summaries[scale]['failed'] == 0 for scale in (1.5, 0.8))
+    # Whichever run published last, its output, manifest and log belong together
+    results = tmp_path / "results"
+    with open(results / "Animations_manifest.json", encoding="utf-8") as f:
+        scale = json.load(f)['multiplier']
+    tracks, _, _, _ = read_packfile((results / "Animations-merged" / "MovesetB" / "idle.hkx").read_bytes())
+    assert round(tracks[0][1][0], 5) == scale
+    with open(results / "Animations_log.jsonl", encoding="utf-8") as f:
+        assert json.loads(f.readline())['multiplier'] == scale
+
+def test_file_lock_waits_for_the_holder(tmp_path):
+    path = str(tmp_path / "run.lock")
+    holder = FileLock(path)
+    assert holder.acquire()
+    assert not FileLock(path).acquire(timeout=0.1)
+    waited = []
+    threading.Timer(0.2, holder.release).start()
+    with_lock = FileLock(path, poll_interval=0.05)
+    assert with_lock.acquire(on_wait=lambda: waited.append(True))
+    with_lock.release()
+    assert waited == [True]
@@ -0,0 +1,60 @@
+import os
+import time
+import zipfile
+
+import pytest
+
+from hkxshift.sources import FolderSource, ZipSource, open_source
+
+@pytest.fixture
+def mod_zip(tmp_path):
+    """A mod archive that wraps everything in a MyMod/ folder, as most downloads do"""
+    path = tmp_path / "MyMod.zip"
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr(zipfile.ZipInfo("MyMod/MovesetA/atk1.HKX", (2020, 5, 17, 12, 30, 0)), b"attack")
+        archive.writestr("MyMod\\MovesetA\\notes.txt", b"packed on Windows")
+        archive.writestr("MyMod/MovesetB/Empty/", b"")
+        archive.writestr("MyMod/idle.hkx", b"idle")
+    return path
+
+def test_single_top_folder_is_unwrapped(mod_zip):
+    source = open_source(str(mod_zip))
+    assert isinstance(source, ZipSource)
+    assert source.base == "MyMod"
+    assert source.listdir() == ["MovesetA", "MovesetB", "idle.hkx"]
+    assert source.listdir("MovesetA") == ["atk1.HKX", "notes.txt"]
+    assert source.isdir("MovesetB/Empty") and not source.isfile("MovesetB/Empty")
+    assert source.getsize("idle.hkx") == 4
+    assert source.display_path("idle.hkx") == f"{mod_zip}:MyMod/idle.hkx"
+    source.close()
+
+def test_walk_lists_every_folder(mod_zip):
+    source = open_source(str(mod_zip))
+    assert dict(source.walk()) == {'': ["idle.hkx"], 'MovesetA': ["atk1.HKX", "notes.txt"], 'MovesetB': [],
+                                   'MovesetB/Empty': []}
+    source.close()
+
+def test_members_are_read_without_extracting(mod_zip, tmp_path):
+    source = open_source(str(mod_zip))
+    with source.open("MovesetA/notes.txt") as f:
+        assert f.read() == b"packed on Windows"
+    dest = tmp_path / "atk1.HKX"
+    source.copy_file("MovesetA/atk1.HKX", str(dest))
+    assert dest.read_bytes() == b"attack"
+    # The member's timestamp is kept, like shutil.copy2 does for folder sources
+    assert os.path.getmtime(dest) == time.mktime((2020, 5, 17, 12, 30, 0, 0, 0, -1))
+    source.close()
+
+def test_missing_folders_raise(mod_zip):
+    source = open_source(str(mod_zip))
+    with pytest.raises(FileNotFoundError):
+        source.listdir("MovesetC")
+    source.close()
+
+def test_folders_open_as_folder_sources(tmp_path):
+    (tmp_path / "MyMod" / "MovesetA").mkdir(parents=True)
+    (tmp_path / "MyMod" / "MovesetA" / "atk1.hkx").write_bytes(b"attack")
+    source = open_source(str(tmp_path / "MyMod"))
+    assert isinstance(source, FolderSource)
+    assert source.base == "MyMod"
+    assert dict(source.walk()) == {'': [], 'MovesetA': ["atk1.hkx"]}